@@ -35,74 +35,287 @@
 
 
 
+from commands import enable_logging, run_command
 from game_logic import GameState
-import shlex
+from instrument import enable_stats
+from levelgen import level_from_config
+from replay import Recorder
+from typing import Iterator, List, Optional, Tuple
+import argparse
+import functools
+import io
+import multiprocessing
+import os
+import sys
 
-def display_field(state: GameState):
-    """Display the current state of the game field."""
-    for r in range(state.get_rows()):
-        row_display = '|'
+# Line separating games in --batch mode.
+DELIMITER = '---'
+
+# Display text for each field character; anything else shows as blank.
+CELL_TEXT = {' ': '   ', 'r': ' r ', 'y': ' y ', 'b': ' b ', 'R': ' R ', 'Y': ' Y ', 'B': ' B '}
+
+def render_row(state: GameState, row: int) -> str:
+    """Render one row of the field, including any faller segments in it."""
+    cells = [CELL_TEXT.get(cell, '   ') for cell in state.get_row_text(row)]
+    if row in state.faller_rows():
         for c in range(state.get_columns()):
-            row_display += state.get_cell_display(r, c)
-        row_display += '|'
-        print(row_display)
-    print(' ' + '-' * (3 * state.get_columns()) + ' ')
+            cells[c] = state.get_cell_display(row, c)
+    return '|' + ''.join(cells) + '|'
+
+def render_footer(state: GameState) -> str:
+    """Render the line under the field and the level status."""
+    footer = ' ' + '-' * (3 * state.get_columns()) + ' \n'
     if not state.has_viruses():
-        print('LEVEL CLEARED')
+        footer += 'LEVEL CLEARED\n'
+    return footer
 
-def main():
-    """Main game loop."""
-    # Read field dimensions
-    rows = int(input())
-    columns = int(input())
+def display_field(state: GameState):
+    """Display the current state of the game field."""
+    rows = [render_row(state, r) for r in range(state.get_rows())]
+    sys.stdout.write('\n'.join(rows) + '\n' + render_footer(state))
+
+class TextRenderer:
+    """
+    Writes display_field frames, re-rendering only rows that changed.
     
-    # Read initial configuration
-    config = input().strip()
-    contents = None
-    if config == 'CONTENTS':
-        contents = [input().strip() for _ in range(rows)]
+    Row text is cached between frames; a row is rendered again only when its
+    field cells changed or a faller segment entered or left it. Each frame is
+    written to the output with a single write.
+    """
     
-    # Initialize game state
-    state = GameState(rows, columns, config, contents)
+    def __init__(self, every: int = 1, final_only: bool = False, out=None):
+        """
+        Args:
+            every: Write only every Nth frame (the first frame is always written).
+            final_only: Write no frames until finish is called.
+            out: Stream to write to (defaults to sys.stdout at write time).
+        """
+        self.every: int = every
+        self.final_only: bool = final_only
+        self.out = out
+        self._state: Optional[GameState] = None
+        self._lines: List[str] = []
+        self._stamp: int = 0
+        self._faller_rows: set = set()
+        self._frames: int = 0
+        self._written: bool = False
     
-    # Main game loop
+    def render(self, state: GameState) -> str:
+        """Return the text of a frame, reusing cached rows where possible."""
+        faller_rows = set(state.faller_rows())
+        if state is not self._state or len(self._lines) != state.get_rows():
+            self._state = state
+            self._lines = [''] * state.get_rows()
+            stale = range(state.get_rows())
+        else:
+            stale = set(state.changed_rows(self._stamp)) | self._faller_rows | faller_rows
+        for r in stale:
+            self._lines[r] = render_row(state, r)
+        self._stamp = state.field_stamp()
+        self._faller_rows = faller_rows
+        return '\n'.join(self._lines) + '\n' + render_footer(state)
+    
+    def frame(self, state: GameState):
+        """Record a frame, writing it if it falls on the sampling interval."""
+        self._frames += 1
+        self._written = not self.final_only and (self._frames - 1) % self.every == 0
+        if self._written:
+            self._write(self.render(state))
+    
+    def finish(self, state: GameState, trailer: str = ''):
+        """Write the last frame if it was skipped, followed by trailer."""
+        text = trailer if self._written else self.render(state) + trailer
+        self._written = True
+        if text:
+            self._write(text)
+    
+    def _write(self, text: str):
+        """Write text to the output stream in one call."""
+        (self.out or sys.stdout).write(text)
+
+def input_lines() -> Iterator[str]:
+    """Yield standard input lines read with input() until end of file."""
     while True:
-        display_field(state)
+        try:
+            yield input()
+        except EOFError:
+            return
+
+def read_game(lines: Iterator[str]) -> GameState:
+    """Read a game's rows, columns and initial configuration lines and build its state."""
+    rows = int(next(lines))
+    columns = int(next(lines))
+    config = next(lines).strip()
+    # RANDOM seed amount [height] lays out viruses with levelgen
+    if config.startswith('RANDOM'):
+        return level_from_config(rows, columns, config)
+    contents = None
+    if config == 'CONTENTS':
+        contents = [next(lines).strip() for _ in range(rows)]
+    return GameState(rows, columns, config, contents)
+
+def play(state: GameState, lines: Iterator[str], renderer: TextRenderer, recorder: Optional[Recorder] = None):
+    """Apply command lines to a game until Q, game over or the last line, writing its frames."""
+    while True:
+        renderer.frame(state)
         if state.game_over:
-            print('GAME OVER')
-            break
-        
-        command = input().strip()
-        if command == 'Q':
+            renderer.finish(state, 'GAME OVER\n')
+            return
+        command = next(lines, 'Q').strip()
+        running = run_command(state, command)
+        if recorder:
+            recorder.record(command, state)
+        if not running:
+            renderer.finish(state)
+            return
+
+def read_games(stream, delimiter: str = DELIMITER, chunk_size: int = 1 << 20) -> Iterator[List[str]]:
+    """
+    Split a stream of games separated by delimiter lines into one list of lines per game.
+    
+    The stream is read in chunks of chunk_size characters. Games holding
+    only blank lines are skipped.
+    """
+    game: List[str] = []
+    tail = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
             break
-        elif command == '':
-            if state.faller:
-                if state.faller_landed:
-                    state.freeze_faller()
-                else:
-                    state.faller_fall()
-            state.apply_gravity()
-        elif command.startswith('F'):
-            parts = shlex.split(command)
-            if len(parts) == 3 and parts[1] in ('R', 'B', 'Y') and parts[2] in ('R', 'B', 'Y'):
-                state.create_faller(parts[1], parts[2])
-        elif command == 'A':
-            state.rotate_faller(True)
-        elif command == 'B':
-            state.rotate_faller(False)
-        elif command == '<':
-            state.move_faller_left()
-        elif command == '>':
-            state.move_faller_right()
-        elif command.startswith('v'):
-            parts = shlex.split(command)
-            if len(parts) == 4 and parts[3] in ('r', 'y', 'b'):
-                try:
-                    row, col = int(parts[1]), int(parts[2])
-                    if 0 <= row < state.get_rows() and 0 <= col < state.get_columns():
-                        state.create_virus(row, col, parts[3])
-                except ValueError:
-                    pass
+        lines = (tail + chunk).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            if line.strip() == delimiter:
+                if any(game_line.strip() for game_line in game):
+                    yield game
+                game = []
+            else:
+                game.append(line)
+    if tail and tail.strip() != delimiter:
+        game.append(tail)
+    if any(game_line.strip() for game_line in game):
+        yield game
+
+def play_batch_game(lines: List[str], every: int = 1, final_only: bool = False) -> Tuple[str, Optional[str]]:
+    """
+    Play one game of a batch.
+    
+    Returns:
+        The game's output, and None or a message saying why the game stopped
+        early (its output up to that point is kept).
+    """
+    out = io.StringIO()
+    renderer = TextRenderer(every, final_only, out)
+    commands = iter(lines)
+    try:
+        play(read_game(commands), commands, renderer)
+    except (StopIteration, ValueError, IndexError) as error:
+        return out.getvalue(), input_error(error)
+    return out.getvalue(), None
+
+def input_error(error: Exception) -> str:
+    """Describe an error raised by a game's input lines, for standard error."""
+    if isinstance(error, StopIteration):
+        return 'incomplete game header'
+    return f'{type(error).__name__}: {error}'
+
+def run_batch(stream, out, delimiter: str = DELIMITER, every: int = 1, final_only: bool = False,
+              workers: int = 1, chunksize: int = 4, log_commands: bool = False) -> int:
+    """
+    Play every game of a batch stream and write their outputs in order.
+    
+    Each game's output is followed by a delimiter line. A game that stops
+    with an error keeps its output so far and is reported on standard
+    error; the rest of the batch still runs.
+    
+    Args:
+        stream: Text stream of games separated by delimiter lines.
+        out: Text stream to write the outputs to.
+        delimiter: Line separating games, in the input and the output.
+        every: Write only every Nth frame of a game.
+        final_only: Write only the final frame of each game.
+        workers: Worker processes to spread the games across (0: one per
+            core; 1: play them in this process).
+        chunksize: Games handed to a worker at a time.
+        log_commands: Log each command to standard error.
+    
+    Returns:
+        int: The number of games that stopped with an error.
+    """
+    play_game = functools.partial(play_batch_game, every=every, final_only=final_only)
+    results = _batch_results(play_game, read_games(stream, delimiter), workers, chunksize, log_commands)
+    failed = 0
+    for number, (text, error) in enumerate(results, 1):
+        out.write(text + delimiter + '\n')
+        if error:
+            failed += 1
+            sys.stderr.write(f'game {number}: {error}\n')
+    out.flush()
+    return failed
+
+def _batch_results(play_game, games: Iterator[List[str]], workers: int, chunksize: int,
+                   log_commands: bool) -> Iterator[Tuple[str, Optional[str]]]:
+    """Play games in this process or across a pool, yielding their results in input order."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        yield from map(play_game, games)
+        return
+    with multiprocessing.Pool(workers, initializer=enable_logging, initargs=(log_commands,)) as pool:
+        yield from pool.imap(play_game, games, chunksize)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Main game loop."""
+    parser = argparse.ArgumentParser(description='Play Dr. Mario from commands on standard input.')
+    parser.add_argument('--every', type=int, default=1, metavar='N',
+                        help='only print every Nth frame (the final frame is always printed)')
+    parser.add_argument('--final-only', action='store_true', help='only print the final frame')
+    parser.add_argument('--log-commands', action='store_true', help='log each command to standard error')
+    parser.add_argument('--record', metavar='FILE', help='write the session to a binary replay log')
+    parser.add_argument('--keyframe-interval', type=int, default=1000, metavar='N',
+                        help='commands between replay log keyframes')
+    parser.add_argument('--stats', action='store_true',
+                        help='time the game logic and print a summary to standard error at exit')
+    parser.add_argument('--batch', action='store_true',
+                        help='play a stream of games separated by delimiter lines, each with its own header')
+    parser.add_argument('--delimiter', default=DELIMITER, help=f'line between games in --batch mode (default: {DELIMITER})')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes for --batch (default: 1, this process; 0: one per core; '
+                             '--stats only times games played in this process)')
+    parser.add_argument('--chunksize', type=int, default=4, help='games handed to a --batch worker at a time')
+    args = parser.parse_args(argv)
+    if args.batch and args.record:
+        parser.error('--record cannot be used with --batch')
+    enable_logging(args.log_commands)
+    stats = enable_stats() if args.stats else None
+    
+    if args.batch:
+        try:
+            failed = run_batch(sys.stdin, sys.stdout, args.delimiter, max(args.every, 1), args.final_only,
+                               args.workers, max(args.chunksize, 1), args.log_commands)
+        finally:
+            if stats:
+                sys.stderr.write(stats.summary())
+        return 1 if failed else 0
+    
+    renderer = TextRenderer(every=max(args.every, 1), final_only=args.final_only)
+    lines = input_lines()
+    try:
+        state = read_game(lines)
+    except (StopIteration, ValueError) as error:
+        sys.stderr.write(input_error(error) + '\n')
+        return 1
+    log = open(args.record, 'wb') if args.record else None
+    recorder = Recorder(log, state, max(args.keyframe_interval, 1)) if log else None
+    
+    # Main game loop
+    try:
+        play(state, lines, renderer, recorder)
+    finally:
+        if log:
+            log.close()
+        if stats:
+            sys.stderr.write(stats.summary())
+    return 0
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
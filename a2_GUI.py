@@ -1,11 +1,20 @@
-import pygame
+from typing import List, Optional
+import argparse
+import os
+import sys
+import time
+from commands import apply_command, run_command
 from game_logic import GameState
+from instrument import enable_stats
+from replay import Recorder, Replay
 
-# Pygame initialization
-pygame.init()
+# Pygame is imported and initialised by DrMarioGUI, only as far as its mode
+# needs: logic-only headless games and the text front end never load it.
+pygame = None
 CELL_SIZE = 80  # Increased from 40 to 80 for larger interface
 FPS = 60
 FALL_INTERVAL = 0.5  # Time between faller drops (seconds)
+MAX_CATCH_UP = 5  # Most gravity ticks run at once after a stall
 
 # Colors
 COLORS = {
@@ -14,10 +23,22 @@ COLORS = {
     ' ': (255, 255, 255), 'border': (0, 0, 0), 'text': (0, 0, 0)
 }
 
+
+def _import_pygame(quiet: bool = False):
+    """Import pygame into this module, hiding its banner if quiet."""
+    global pygame
+    if pygame is None:
+        if quiet:
+            os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+        import pygame
+    return pygame
+
+
 class DrMarioGUI:
     """GUI for the Dr. Mario game using Pygame."""
     
-    def __init__(self, rows: int, columns: int, config: str, contents: list = None):
+    def __init__(self, rows: int, columns: int, config: str, contents: list = None, headless: bool = False,
+                 offscreen: bool = False, cell_size: int = CELL_SIZE):
         """
         Initialize the GUI and game state.
         
@@ -26,95 +47,215 @@ class DrMarioGUI:
             columns: Number of columns in the field.
             config: 'EMPTY' or 'CONTENTS' for initial field state.
             contents: List of strings for initial field contents if config is 'CONTENTS'.
+            headless: Open no window; run uses a simulated clock and no input.
+            offscreen: Like headless, but draw_field draws to an offscreen
+                surface, with no display driver, for frame export.
+            cell_size: Width and height of a cell in pixels.
         """
         self.state = GameState(rows, columns, config, contents)
-        self.screen = pygame.display.set_mode((columns * CELL_SIZE, (rows + 2) * CELL_SIZE))
-        pygame.display.set_caption("Dr. Mario")
-        self.font = pygame.font.SysFont('arial', 48)  # Increased font size to match larger interface
+        self.headless = headless or offscreen
+        self.offscreen = offscreen
+        self.cell_size = cell_size
+        self.recorder: Optional[Recorder] = None  # Logs every processed command when set
+        self.simulated_time = 0.0
+        # Debug overlay (F3): the time taken to draw the last frame and the
+        # time spent in game commands since the frame before it, measured
+        # only while the overlay is on.
+        self.overlay = False
+        self.frame_time = 0.0
+        self.logic_time = 0.0
+        if headless and not offscreen:
+            return
+        _import_pygame(quiet=offscreen)
+        size = (columns * cell_size, (rows + 2) * cell_size)
+        if offscreen:
+            pygame.font.init()
+            self.screen = pygame.Surface(size)
+        else:
+            pygame.init()
+            self.screen = pygame.display.set_mode(size)
+            pygame.display.set_caption("Dr. Mario")
+        self.font = pygame.font.SysFont('arial', max(cell_size * 3 // 5, 1))  # 48 at the default cell size
+        self.small_font = pygame.font.SysFont('arial', max(cell_size // 4, 1))
+        self.line_width = max(cell_size // 20, 1)
         self.input_text = ""
         self.clock = pygame.time.Clock()
-        self.last_fall_time = pygame.time.get_ticks() / 1000.0
+        self.sprites = {}
+        self.background = (200, 200, 200)
+        # What is currently on screen: each cell's display string, the field
+        # stamp it was drawn at, the rows holding faller segments and the
+        # status lines. None forces a full redraw.
+        self.shown_cells = None
+        self.shown_stamp = 0
+        self.shown_faller_rows = set()
+        self.shown_status = None
+        self.prerender_sprites()
 
-    def draw_cell(self, row: int, col: int):
-        """Draw a single cell based on its state."""
-        x, y = col * CELL_SIZE, row * CELL_SIZE
-        cell_display = self.state.get_cell_display(row, col)
+    def get_sprite(self, cell_display: str) -> 'pygame.Surface':
+        """Return the pre-rendered surface for a cell display string."""
+        sprite = self.sprites.get(cell_display)
+        if sprite is None:
+            sprite = pygame.Surface((self.cell_size, self.cell_size))
+            if not self.offscreen:
+                sprite = sprite.convert()
+            self.render_cell(sprite, cell_display)
+            self.sprites[cell_display] = sprite
+        return sprite
+
+    def prerender_sprites(self):
+        """Render the sprite for every cell type up front."""
+        displays = ['   ']
+        for color in ('r', 'y', 'b'):
+            displays.append(f' {color} ')
+        for color in ('R', 'Y', 'B'):
+            displays.append(f' {color} ')
+            for left, right in (('[', ']'), ('|', '|')):
+                displays += [f"{left}{color}{right}", f"{left}{color}-", f"-{color}{right}"]
+        for cell_display in displays:
+            self.get_sprite(cell_display)
+
+    def render_cell(self, surface: 'pygame.Surface', cell_display: str):
+        """Draw one cell, given its display string, at the top left of a surface."""
+        x, y = 0, 0
+        cell_size, line_width = self.cell_size, self.line_width
         color = COLORS.get(cell_display[1], COLORS[' '])
         
         # Draw cell background
-        pygame.draw.rect(self.screen, COLORS[' '], (x, y, CELL_SIZE, CELL_SIZE))
+        pygame.draw.rect(surface, COLORS[' '], (x, y, cell_size, cell_size))
         
-        # Draw content
+        # Draw content, inset by an eighth of the cell
+        offset = cell_size // 8
+        size = cell_size - 2 * offset
         if cell_display != '   ':
             if cell_display[0] in ('[', '|'):  # Faller
-                size = CELL_SIZE - 20  # Adjusted for larger cells
-                offset = 10
-                pygame.draw.rect(self.screen, color, (x + offset, y + offset, size, size))
+                pygame.draw.rect(surface, color, (x + offset, y + offset, size, size))
                 border_color = (0, 0, 0) if cell_display[0] == '[' else (100, 100, 100)
-                pygame.draw.rect(self.screen, border_color, (x + offset, y + offset, size, size), 4)  # Thicker border
+                pygame.draw.rect(surface, border_color, (x + offset, y + offset, size, size), line_width)
             elif cell_display[1] in ('r', 'y', 'b'):  # Virus
-                size = CELL_SIZE - 20
-                offset = 10
-                pygame.draw.rect(self.screen, color, (x + offset, y + offset, size, size))
+                pygame.draw.rect(surface, color, (x + offset, y + offset, size, size))
             else:  # Capsule
-                size = CELL_SIZE - 20
-                offset = 10
-                pygame.draw.rect(self.screen, color, (x + offset, y + offset, size, size))
+                pygame.draw.rect(surface, color, (x + offset, y + offset, size, size))
         
         # Draw connection lines for horizontal capsules/fallers
         if '-' in cell_display:
-            line_y = y + CELL_SIZE // 2
+            line_y = y + cell_size // 2
             if cell_display[0] == '-':  # Right end
-                pygame.draw.line(self.screen, COLORS['border'], (x, line_y), (x + CELL_SIZE // 2, line_y), 4)  # Thicker line
+                pygame.draw.line(surface, COLORS['border'], (x, line_y), (x + cell_size // 2, line_y), line_width)
             elif cell_display[2] == '-':  # Left end
-                pygame.draw.line(self.screen, COLORS['border'], (x + CELL_SIZE // 2, line_y), (x + CELL_SIZE, line_y), 4)
-
-    def draw_field(self):
-        """Draw the entire game field."""
-        self.screen.fill((200, 200, 200))  # Background
-        for r in range(self.state.get_rows()):
-            for c in range(self.state.get_columns()):
-                self.draw_cell(r, c)
-        
-        # Draw borders
-        width, height = self.state.get_columns() * CELL_SIZE, self.state.get_rows() * CELL_SIZE
-        pygame.draw.rect(self.screen, COLORS['border'], (0, 0, width, height), 4)  # Thicker border
-        pygame.draw.line(self.screen, COLORS['border'], (0, height), (width, height), 4)
-        
-        # Draw status text
+                pygame.draw.line(surface, COLORS['border'], (x + cell_size // 2, line_y), (x + cell_size, line_y),
+                                 line_width)
+
+    def draw_cell(self, row: int, col: int) -> 'pygame.Rect':
+        """Draw a single cell based on its state and return the area it covers."""
+        cell_display = self.state.get_cell_display(row, col)
+        self.shown_cells[row][col] = cell_display
+        return self.screen.blit(self.get_sprite(cell_display), (col * self.cell_size, row * self.cell_size))
+
+    def draw_borders(self):
+        """Draw the field outline and the line above the status area."""
+        width, height = self.state.get_columns() * self.cell_size, self.state.get_rows() * self.cell_size
+        pygame.draw.rect(self.screen, COLORS['border'], (0, 0, width, height), self.line_width)
+        pygame.draw.line(self.screen, COLORS['border'], (0, height), (width, height), self.line_width)
+
+    def status_lines(self) -> tuple:
+        """Return the status message and command prompt shown under the field."""
         if self.state.game_over:
-            text = self.font.render("GAME OVER", True, COLORS['text'])
-            self.screen.blit(text, (20, height + 20))
+            status = "GAME OVER"
         elif not self.state.has_viruses():
-            text = self.font.render("LEVEL CLEARED", True, COLORS['text'])
-            self.screen.blit(text, (20, height + 20))
+            status = "LEVEL CLEARED"
+        else:
+            status = ""
+        return status, f"Command: {self.input_text}"
+
+    def overlay_text(self) -> str:
+        """Return the debug overlay line."""
+        return f"frame {self.frame_time * 1000:.2f} ms  logic {self.logic_time * 1000:.2f} ms"
+
+    def draw_field(self) -> list:
+        """
+        Draw whatever changed since the previous frame.
         
-        # Draw input prompt
-        prompt = self.font.render(f"Command: {self.input_text}", True, COLORS['text'])
-        self.screen.blit(prompt, (20, height + 80))
+        Only cells whose display changed are blitted from the sprite cache.
+        
+        Returns:
+            list: Screen rectangles that were redrawn (empty if nothing changed).
+        """
+        rows, columns = self.state.get_rows(), self.state.get_columns()
+        cell_size = self.cell_size
+        height = rows * cell_size
+        faller_rows = set(self.state.faller_rows())
+        rects = []
+        full = self.shown_cells is None
+        if full:
+            self.screen.fill(self.background)  # Background
+            self.shown_cells = [[None] * columns for _ in range(rows)]
+            stale = range(rows)
+            self.shown_status = None
+        else:
+            stale = set(self.state.changed_rows(self.shown_stamp)) | self.shown_faller_rows | faller_rows
+        for r in stale:
+            shown = self.shown_cells[r]
+            for c in range(columns):
+                if self.state.get_cell_display(r, c) != shown[c]:
+                    rects.append(self.draw_cell(r, c))
+        self.shown_stamp = self.state.field_stamp()
+        self.shown_faller_rows = faller_rows
+        if rects:
+            self.draw_borders()
+        
+        # Draw status text
+        status = self.status_lines() + ((self.overlay_text(),) if self.overlay else ())
+        if status != self.shown_status:
+            top = height + self.line_width - 1
+            area = pygame.Rect(0, top, self.screen.get_width(), self.screen.get_height() - top)
+            self.screen.fill(self.background, area)
+            message, prompt = status[:2]
+            margin = cell_size // 4
+            if message:
+                self.screen.blit(self.font.render(message, True, COLORS['text']), (margin, height + margin))
+            # Draw input prompt
+            self.screen.blit(self.font.render(prompt, True, COLORS['text']), (margin, height + cell_size))
+            if self.overlay:
+                self.screen.blit(self.small_font.render(status[2], True, COLORS['text']),
+                                 (margin, height + cell_size * 33 // 20))
+            self.shown_status = status
+            rects.append(area)
+        if full:
+            return [self.screen.get_rect()]
+        return rects
+
+    def frame_bytes(self) -> bytes:
+        """Draw the current frame and return its pixels as RGB bytes, row after row."""
+        self.draw_field()
+        return pygame.image.tobytes(self.screen, 'RGB')
 
-    def handle_input(self):
+    def handle_input(self, events: list = None):
         """Process keyboard input and update command buffer."""
-        for event in pygame.event.get():
+        if events is None:
+            events = pygame.event.get()
+        for event in events:
             if event.type == pygame.QUIT:
                 return False
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_q:
                     return False
                 elif event.key == pygame.K_RETURN:
-                    self.process_command(self.input_text)
-                    self.input_text = ""
+                    command, self.input_text = self.input_text, ""
+                    if not self.process_command(command):
+                        return False
+                elif event.key == pygame.K_F3:
+                    self.overlay = not self.overlay
                 elif event.key == pygame.K_BACKSPACE:
                     self.input_text = self.input_text[:-1]
                 elif event.key == pygame.K_a:
                     self.process_command("A")
                 elif event.key == pygame.K_b:
                     self.process_command("B")
+                elif event.key in (pygame.K_DOWN, pygame.K_d):
+                    self.process_command("D")
                 elif event.key == pygame.K_LEFT:
-                    print("Left Arrow pressed")
                     self.process_command("<")
                 elif event.key == pygame.K_RIGHT:
-                    print("Right Arrow pressed")
                     self.process_command(">")
                 elif event.key == pygame.K_SPACE:
                     if self.input_text == "":
@@ -130,71 +271,206 @@ class DrMarioGUI:
                         self.input_text += event.unicode
         return True
 
-    def process_command(self, command: str):
-        """Execute a game command."""
-        print(f"Processing command: {command}")
-        import shlex
-        parts = shlex.split(command)
-        print(f"Parsed parts: {parts}")
-        if command == "Q":
-            pygame.quit()
-            return
-        elif command == "":
-            if self.state.faller:
-                if self.state.faller_landed:
-                    self.state.freeze_faller()
-                else:
-                    self.state.faller_fall()
-            self.state.apply_gravity()
-        elif command.startswith("F"):
-            parts = shlex.split(command)
-            if len(parts) == 3 and parts[1] in ('R', 'B', 'Y') and parts[2] in ('R', 'B', 'Y'):
-                self.state.create_faller(parts[1], parts[2])
-        elif command == "A":
-            self.state.rotate_faller(True)
-        elif command == "B":
-            self.state.rotate_faller(False)
-        elif command == "<":
-            print("Moving faller left")
-            self.state.move_faller_left()
-        elif command == ">":
-            print("Moving faller right")
-            self.state.move_faller_right()
-        elif command.startswith("v"):
-            parts = shlex.split(command)
-            if len(parts) == 4 and parts[3] in ('r', 'y', 'b'):
-                try:
-                    row, col = int(parts[1]), int(parts[2])
-                    if 0 <= row < self.state.get_rows() and 0 <= col < self.state.get_columns():
-                        self.state.create_virus(row, col, parts[3])
-                except ValueError:
-                    pass
-
-    def run(self):
-        """Main game loop for local execution."""
+    def process_command(self, command: str) -> bool:
+        """
+        Execute a game command.
+        
+        Returns:
+            bool: False if the command was a quit, True otherwise.
+        """
+        if self.overlay:
+            start = time.perf_counter()
+            running = run_command(self.state, command)
+            self.logic_time += time.perf_counter() - start
+        else:
+            running = run_command(self.state, command)
+        if self.recorder:
+            self.recorder.record(command, self.state)
+        return running
+
+    def now(self) -> float:
+        """Return the loop clock in seconds (simulated when headless)."""
+        return self.simulated_time if self.headless else time.perf_counter()
+
+    def run(self, script: list = None, max_ticks: int = None) -> int:
+        """
+        Main game loop for local execution.
+        
+        Gravity advances in fixed FALL_INTERVAL steps driven by an accumulator,
+        so slow frames do not slow the fall; after a long stall at most
+        MAX_CATCH_UP steps run and the rest of the backlog is dropped. The
+        screen is redrawn only after something changed, and an idle loop
+        sleeps until the next input event or gravity step.
+        
+        Headless, the same loop runs on a simulated clock that jumps straight
+        to the next due step, as fast as the game logic allows.
+        
+        Args:
+            script: (seconds, command) pairs to process at those times after
+                the start, e.g. for soak tests.
+            max_ticks: Stop after this many gravity steps.
+        
+        Returns:
+            int: Number of gravity steps run.
+        """
+        script = sorted(script or [], key=lambda entry: entry[0])
+        next_entry = 0
+        start = previous = self.now()
+        accumulator = 0.0
+        ticks = 0
+        changed = True
         running = True
         while running:
-            current_time = pygame.time.get_ticks() / 1000.0
-            if current_time - self.last_fall_time >= FALL_INTERVAL:
+            now = self.now()
+            accumulator += now - previous
+            previous = now
+            while running and next_entry < len(script) and script[next_entry][0] <= now - start:
+                running = self.process_command(script[next_entry][1])
+                next_entry += 1
+                changed = True
+            if not running:
+                break
+            steps = 0
+            while accumulator >= FALL_INTERVAL:
+                if steps == MAX_CATCH_UP:
+                    accumulator = 0.0
+                    break
                 self.process_command("")
-                self.last_fall_time = current_time
+                accumulator -= FALL_INTERVAL
+                steps += 1
+            ticks += steps
+            changed = changed or steps > 0
+            if max_ticks is not None and ticks >= max_ticks:
+                break
             
-            running = self.handle_input()
-            self.draw_field()
-            pygame.display.flip()
-            self.clock.tick(FPS)
+            wait = FALL_INTERVAL - accumulator
+            if next_entry < len(script):
+                wait = min(wait, script[next_entry][0] - (now - start))
+            if self.headless:
+                if self.state.game_over or (max_ticks is None and next_entry >= len(script)):
+                    break
+                self.simulated_time += max(wait, 0.0)
+                continue
+            
+            if changed:
+                frame_start = time.perf_counter()
+                rects = self.draw_field()
+                if rects:
+                    pygame.display.update(rects)
+                if self.overlay:
+                    self.frame_time = time.perf_counter() - frame_start
+                    self.logic_time = 0.0
+                self.clock.tick(FPS)
+                events = pygame.event.get()
+            else:
+                event = pygame.event.wait(max(int(wait * 1000), 1))
+                events = [] if event.type == pygame.NOEVENT else [event] + pygame.event.get()
+            if any(event.type == pygame.VIDEOEXPOSE for event in events):
+                self.shown_cells = None
+            running = self.handle_input(events)
+            changed = any(event.type in (pygame.KEYDOWN, pygame.VIDEOEXPOSE) for event in events)
         
-        pygame.quit()
+        if not self.headless:
+            pygame.quit()
+        return ticks
+
+def export_replay(replay: Replay, writer_pool, pattern: str, cell_size: int = CELL_SIZE, every: int = 1,
+                  sheet_columns: int = 0, sheet_frames: int = 100, level: int = 6) -> int:
+    """
+    Render a replayed session offscreen and write its frames as PNG files.
+    
+    A frame is rendered before the first command and after every command,
+    as fast as the game logic and drawing allow; the frames are encoded on
+    writer_pool while drawing goes on.
+    
+    Args:
+        replay: Session to render.
+        writer_pool: Executor that encodes and writes the files.
+        pattern: Output path with an {index} field (see frames.FrameWriter).
+        cell_size: Width and height of a cell in pixels.
+        every: Keep only every Nth frame (the final frame is always kept).
+        sheet_columns: Tile the frames into sprite sheets this many frames
+            wide instead of writing one file per frame (0).
+        sheet_frames: Most frames per sprite sheet.
+        level: zlib compression level of the PNG files.
+    
+    Returns:
+        int: The number of files written.
+    """
+    from frames import FrameWriter
+    game = DrMarioGUI(replay.rows, replay.columns, 'EMPTY', offscreen=True, cell_size=cell_size)
+    game.state = replay.initial_state()
+    width, height = game.screen.get_size()
+    writer = FrameWriter(writer_pool, pattern, width, height, sheet_columns, sheet_frames, level)
+    writer.add(game.frame_bytes())
+    written = True
+    for frame, parsed in enumerate(replay.commands, 1):
+        running = apply_command(game.state, parsed)
+        written = frame % every == 0
+        if written:
+            writer.add(game.frame_bytes())
+        if not running or game.state.game_over:
+            break
+    if not written:
+        writer.add(game.frame_bytes())
+    return writer.close()
+
+def export_main(args) -> int:
+    """Render every replay log named on the command line into args.export."""
+    from concurrent.futures import ThreadPoolExecutor
+    files = 0
+    with ThreadPoolExecutor(args.threads) as pool:
+        for log in args.logs:
+            name = os.path.splitext(os.path.basename(log))[0]
+            if args.sheet:
+                pattern = os.path.join(args.export, name + '_{index:03d}.png')
+            else:
+                pattern = os.path.join(args.export, name, '{index:06d}.png')
+            files += export_replay(Replay.load(log), pool, pattern, args.cell_size, max(args.every, 1),
+                                   args.sheet, args.sheet_frames, args.compression)
+    print(f'{len(args.logs)} sessions, {files} files written to {args.export}')
+    return 0
 
-def main():
+def main(argv: Optional[List[str]] = None):
     """Entry point for the game."""
+    parser = argparse.ArgumentParser(description='Play Dr. Mario in a window.')
+    parser.add_argument('--record', metavar='FILE', help='write the session to a binary replay log')
+    parser.add_argument('--stats', action='store_true',
+                        help='show the frame time overlay and print a game logic summary at exit')
+    parser.add_argument('--export', metavar='DIR',
+                        help='render the replay logs given as arguments offscreen, with no window, '
+                             'and write their frames as PNG files in DIR')
+    parser.add_argument('logs', nargs='*', help='replay logs to render with --export')
+    parser.add_argument('--cell-size', type=int, default=CELL_SIZE, help='cell width and height in pixels')
+    parser.add_argument('--every', type=int, default=1, metavar='N',
+                        help='only export every Nth frame (the final frame is always exported)')
+    parser.add_argument('--sheet', type=int, default=0, metavar='COLUMNS',
+                        help='export sprite sheets this many frames wide instead of one file per frame')
+    parser.add_argument('--sheet-frames', type=int, default=100, metavar='N', help='most frames per sprite sheet')
+    parser.add_argument('--compression', type=int, default=6, choices=range(10), metavar='LEVEL',
+                        help='PNG compression level, 0 (fastest) to 9 (smallest)')
+    parser.add_argument('--threads', type=int, default=None, help='threads encoding PNG files (default: per core)')
+    args = parser.parse_args(argv)
+    if args.logs and not args.export:
+        parser.error('replay logs can only be given with --export')
+    if args.export:
+        return export_main(args)
     rows = 8
     columns = 6
     config = "EMPTY"
     contents = None
     
-    game = DrMarioGUI(rows, columns, config, contents)
-    game.run()
+    stats = enable_stats() if args.stats else None
+    game = DrMarioGUI(rows, columns, config, contents, cell_size=args.cell_size)
+    game.overlay = args.stats
+    if args.record:
+        with open(args.record, 'wb') as log:
+            game.recorder = Recorder(log, game.state)
+            game.run()
+    else:
+        game.run()
+    if stats:
+        print(stats.summary(), end='')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,438 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from commands import DROP, FALLER, LEFT, QUIT, RIGHT, ROTATE, TICK, VIRUS, parse_command
+from game_logic import GameState
+
+# Cell codes of the field array. Viruses and capsule segments of the same
+# colour share a match key, which is also their colour plane plus one.
+CELL_CHARS = ' rybRYB'
+CELL_CODES = {char: code for code, char in enumerate(CELL_CHARS)}
+MATCH_KEYS = np.array([0, 1, 2, 3, 1, 2, 3], dtype=np.uint8)
+CAPSULE = 3  # Plane of capsule segments, after the three colour planes
+LANE_TYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+
+class BatchGameState:
+    """
+    Many Dr. Mario games of the same size advanced in lockstep.
+
+    Each column of each board is held as one unsigned integer lane with a
+    bit per row, bit 0 being the bottom row, in four planes: one per colour
+    and one marking capsule segments. A match scan is a few shifts and ANDs
+    down the lanes and across neighbouring columns, and a gravity step finds
+    every falling stack of segments with one addition per lane, so each
+    command is a handful of NumPy operations over the whole batch. The
+    fallers live in per-board arrays.
+
+    Each command takes an optional boolean mask selecting the boards it
+    applies to; boards outside the mask are left untouched. Every board
+    follows GameState exactly, except that a rotation which would push the
+    faller below the floor (an IndexError in GameState) is rejected.
+    """
+
+    def __init__(self, count: int, rows: int, columns: int, initial_config: str = 'EMPTY',
+                 contents: Optional[List[str]] = None):
+        """
+        Initialize the batch.
+
+        Args:
+            count: Number of boards.
+            rows: Number of rows in each field (4 to 64).
+            columns: Number of columns in each field (at least 3).
+            initial_config: 'EMPTY' or 'CONTENTS' to specify initial field state.
+            contents: Field contents shared by every board if initial_config is 'CONTENTS'.
+
+        Raises:
+            ValueError: If the fields have more rows than a lane holds.
+        """
+        if rows > 64:
+            raise ValueError(f'Batch fields have at most 64 rows, not {rows}')
+        self.count: int = count
+        self.rows: int = rows
+        self.columns: int = columns
+        lane = next(dtype for dtype in LANE_TYPES if np.iinfo(dtype).bits >= rows)
+        # Bit of each row within a column lane.
+        self.row_bits: np.ndarray = (np.uint64(1) << np.arange(rows - 1, -1, -1, dtype=np.uint64)).astype(lane)
+        self.planes: np.ndarray = np.zeros((4, count, columns), dtype=lane)
+        if initial_config == 'CONTENTS' and contents:
+            codes = np.array([[CELL_CODES.get(contents[r][c], 0) for c in range(columns)] for r in range(rows)],
+                             dtype=np.uint8)
+            self._load(np.broadcast_to(codes, (count, rows, columns)))
+        # Faller position is its top-left segment; color1 is the left or top
+        # segment and color2 the right or bottom one.
+        self.has_faller: np.ndarray = np.zeros(count, dtype=bool)
+        self.faller_row: np.ndarray = np.zeros(count, dtype=np.int64)
+        self.faller_col: np.ndarray = np.zeros(count, dtype=np.int64)
+        self.faller_vertical: np.ndarray = np.zeros(count, dtype=bool)
+        self.faller_color1: np.ndarray = np.zeros(count, dtype=np.uint8)
+        self.faller_color2: np.ndarray = np.zeros(count, dtype=np.uint8)
+        self.faller_landed: np.ndarray = np.zeros(count, dtype=bool)
+        self.game_over: np.ndarray = np.zeros(count, dtype=bool)
+        # Boards known to have no falling segments and no runs of four, which
+        # an empty command can skip straight past.
+        self.settled: np.ndarray = np.full(count, initial_config != 'CONTENTS' or not contents)
+
+    @classmethod
+    def from_states(cls, states: Sequence[GameState]) -> 'BatchGameState':
+        """Build a batch from GameStates that share the same field size."""
+        rows, columns = states[0].get_rows(), states[0].get_columns()
+        batch = cls(len(states), rows, columns)
+        codes = np.zeros((len(states), rows, columns), dtype=np.uint8)
+        for i, state in enumerate(states):
+            if state.get_rows() != rows or state.get_columns() != columns:
+                raise ValueError('All states must have the same field size')
+            field = state.field
+            for r in range(rows):
+                codes[i, r] = [CELL_CODES.get(cell, 0) for cell in field[r]]
+            if state.has_faller:
+                batch.has_faller[i] = True
+                batch.faller_row[i] = state.faller_row
+                batch.faller_col[i] = state.faller_col
+                batch.faller_vertical[i] = state.faller_vertical
+                batch.faller_color1[i] = CELL_CODES[state.faller_color1]
+                batch.faller_color2[i] = CELL_CODES[state.faller_color2]
+                batch.faller_landed[i] = state.faller_landed
+            batch.game_over[i] = state.game_over
+        batch._load(codes)
+        batch.settled[:] = False
+        return batch
+
+    def to_state(self, index: int) -> GameState:
+        """Return a GameState holding a copy of one board."""
+        contents = [''.join(CELL_CHARS[code] for code in row) for row in self.field[index]]
+        state = GameState(self.rows, self.columns, 'CONTENTS', contents)
+        if self.has_faller[index]:
+            state.has_faller = True
+            state.faller_row = int(self.faller_row[index])
+            state.faller_col = int(self.faller_col[index])
+            state.faller_vertical = bool(self.faller_vertical[index])
+            state.faller_color1 = CELL_CHARS[self.faller_color1[index]]
+            state.faller_color2 = CELL_CHARS[self.faller_color2[index]]
+            state.faller_landed = bool(self.faller_landed[index])
+        state.game_over = bool(self.game_over[index])
+        return state
+
+    @property
+    def field(self) -> np.ndarray:
+        """The fields as a new (count, rows, columns) array of cell codes."""
+        bits = ((self.planes[:, :, None, :] & self.row_bits[:, None]) != 0).astype(np.uint8)
+        key = bits[0] + 2 * bits[1] + 3 * bits[2]
+        return key + 3 * bits[CAPSULE]
+
+    def _load(self, codes: np.ndarray):
+        """Replace every field with a (count, rows, columns) array of cell codes."""
+        row_bits = self.row_bits[:, None]
+        keys = MATCH_KEYS[codes]
+        for plane in range(3):
+            self.planes[plane] = np.where(keys == plane + 1, row_bits, 0).sum(axis=1, dtype=self.planes.dtype)
+        self.planes[CAPSULE] = np.where(codes >= CELL_CODES['R'], row_bits, 0).sum(axis=1, dtype=self.planes.dtype)
+
+    def _select(self, where: Optional[np.ndarray]) -> np.ndarray:
+        """Return a boolean board mask, defaulting to every board."""
+        if where is None:
+            return np.ones(self.count, dtype=bool)
+        return np.asarray(where, dtype=bool)
+
+    def _empty_at(self, boards: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Check cells given per board; cells off the field count as occupied."""
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.columns)
+        lanes = self.planes[:3, boards, np.clip(cols, 0, self.columns - 1)]
+        occupied = lanes[0] | lanes[1] | lanes[2]
+        return inside & ((occupied & self.row_bits[np.clip(rows, 0, self.rows - 1)]) == 0)
+
+    def _landed(self, boards: np.ndarray) -> np.ndarray:
+        """Check whether the fallers on the given boards rest on something."""
+        row, col = self.faller_row[boards], self.faller_col[boards]
+        vertical = self.faller_vertical[boards]
+        bottom = np.where(vertical, row + 1, row)
+        on_floor = bottom == self.rows - 1
+        below_left = ~self._empty_at(boards, bottom + 1, col)
+        below_right = ~self._empty_at(boards, bottom + 1, col + 1)
+        return on_floor | below_left | (~vertical & below_right)
+
+    def create_faller(self, color1: str, color2: str, where: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Create a new faller at the top middle of each selected field.
+
+        Returns:
+            np.ndarray: Per-board flags for fallers that were created.
+        """
+        mask = self._select(where) & ~self.has_faller
+        mid = (self.columns // 2) - 1
+        spawn = self.planes[:3, :, mid] | self.planes[:3, :, mid + 1]
+        blocked = ((spawn[0] | spawn[1] | spawn[2]) & self.row_bits[1]) != 0
+        self.game_over |= mask & blocked
+        created = mask & ~blocked
+        self.has_faller |= created
+        self.faller_row[created] = 1
+        self.faller_col[created] = mid
+        self.faller_vertical[created] = False
+        self.faller_color1[created] = CELL_CODES[color1]
+        self.faller_color2[created] = CELL_CODES[color2]
+        self.faller_landed[created] = False
+        return created
+
+    def _shift_faller(self, where: Optional[np.ndarray], step: int) -> np.ndarray:
+        """Move the selected fallers one column left (-1) or right (+1)."""
+        boards = np.flatnonzero(self._select(where) & self.has_faller)
+        row, col = self.faller_row[boards], self.faller_col[boards]
+        vertical = self.faller_vertical[boards]
+        target = col + step if step < 0 else np.where(vertical, col + 1, col + 2)
+        ok = self._empty_at(boards, row, target) & (~vertical | self._empty_at(boards, row + 1, target))
+        boards = boards[ok]
+        self.faller_col[boards] += step
+        self.faller_landed[boards] = self._landed(boards)
+        moved = np.zeros(self.count, dtype=bool)
+        moved[boards] = True
+        return moved
+
+    def move_faller_left(self, where: Optional[np.ndarray] = None) -> np.ndarray:
+        """Move the selected fallers left where possible."""
+        return self._shift_faller(where, -1)
+
+    def move_faller_right(self, where: Optional[np.ndarray] = None) -> np.ndarray:
+        """Move the selected fallers right where possible."""
+        return self._shift_faller(where, 1)
+
+    def rotate_faller(self, clockwise: bool, where: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Rotate the selected fallers clockwise or counterclockwise.
+
+        Returns:
+            np.ndarray: Per-board flags for fallers that rotated.
+        """
+        boards = np.flatnonzero(self._select(where) & self.has_faller)
+        row, col = self.faller_row[boards], self.faller_col[boards]
+        vertical = self.faller_vertical[boards]
+        left_free = (col > 0) & self._empty_at(boards, row, col - 1)
+
+        # Horizontal to vertical: the new bottom segment goes below the left one.
+        below_free = (row + 1 < self.rows) & self._empty_at(boards, row + 1, col)
+        below_left_free = (row + 1 >= self.rows) | self._empty_at(boards, row + 1, col - 1)
+        h_kick = ~below_free
+        h_ok = (below_free | (left_free & below_left_free)) & (row + 1 < self.rows)
+
+        # Vertical to horizontal: the new right segment goes beside the top one.
+        right_free = (col + 1 < self.columns) & self._empty_at(boards, row, col + 1)
+        v_kick = ~right_free
+        v_ok = right_free | left_free
+
+        kick = np.where(vertical, v_kick, h_kick)
+        ok = np.where(vertical, v_ok, h_ok)
+        boards, kick, vertical = boards[ok], kick[ok], vertical[ok]
+        self.faller_col[boards] -= kick.astype(np.int64)
+        # Clockwise keeps the colour order going to vertical and swaps it
+        # going to horizontal; counterclockwise does the opposite.
+        swap = boards[vertical == clockwise]
+        color1 = self.faller_color1[swap].copy()
+        self.faller_color1[swap] = self.faller_color2[swap]
+        self.faller_color2[swap] = color1
+        self.faller_vertical[boards] = ~vertical
+        self.faller_landed[boards] = self._landed(boards)
+        rotated = np.zeros(self.count, dtype=bool)
+        rotated[boards] = True
+        return rotated
+
+    def hard_drop(self, where: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Drop the selected fallers to rest and freeze them, as repeated ticks would.
+
+        Returns:
+            np.ndarray: Per-board flags for fallers that were dropped.
+        """
+        dropped = self._select(where) & self.has_faller
+        dropping = dropped.copy()
+        while dropping.any():
+            self.tick(dropping)
+            dropping &= self.has_faller
+        return dropped
+
+    def create_virus(self, row: int, col: int, color: str, where: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Create a virus at the same position on each selected board.
+
+        Returns:
+            np.ndarray: Per-board flags for viruses that were created.
+        """
+        bit = self.row_bits[row]
+        planes = self.planes
+        occupied = planes[0, :, col] | planes[1, :, col] | planes[2, :, col]
+        created = self._select(where) & ((occupied & bit) == 0)
+        planes[MATCH_KEYS[CELL_CODES[color]] - 1, created, col] |= bit
+        self.settled &= ~created
+        return created
+
+    def tick(self, where: Optional[np.ndarray] = None):
+        """Advance the selected boards by one empty command: fall or freeze, then gravity."""
+        mask = self._select(where)
+        freezing = np.flatnonzero(mask & self.has_faller & self.faller_landed)
+        falling = np.flatnonzero(mask & self.has_faller & ~self.faller_landed)
+
+        blocked = self._landed(falling)
+        self.faller_landed[falling[blocked]] = True
+        self.faller_row[falling[~blocked]] += 1
+
+        row, col = self.faller_row[freezing], self.faller_col[freezing]
+        vertical = self.faller_vertical[freezing]
+        row2, col2 = row + vertical, col + ~vertical
+        planes = self.planes
+        # One segment at a time, so that a vertical faller's two segments,
+        # which share a lane, are both written. A segment replaces a virus
+        # created under the faller.
+        for colors, r, c in ((self.faller_color1, row, col), (self.faller_color2, row2, col2)):
+            bits = self.row_bits[r]
+            planes[:3, freezing, c] &= ~bits
+            planes[MATCH_KEYS[colors[freezing]] - 1, freezing, c] |= bits
+            planes[CAPSULE, freezing, c] |= bits
+        self.has_faller[freezing] = False
+        self.faller_landed[freezing] = False
+
+        # A freeze starts with a match step; then every selected board that
+        # is not already settled alternates drop and match steps until it is.
+        # A board that did not move can only hold a run if it had one before
+        # the loop, so later match steps only look at boards that moved.
+        unsettled = mask & ~self.settled
+        active = self._clear_matches(freezing) | unsettled
+        # Without a clear, only half of a horizontal capsule can be left
+        # hanging; everything else on a settled board stays put.
+        hanging = ~vertical & (self._empty_at(freezing, row + 1, col) | self._empty_at(freezing, row + 1, col2))
+        active[freezing[hanging]] = True
+        self.settled |= active
+        while active.any():
+            moved = self._drop_step(np.flatnonzero(active))
+            active = moved | self._clear_matches(np.flatnonzero(moved | unsettled))
+            unsettled = np.zeros(self.count, dtype=bool)
+
+    def _drop_step(self, boards: np.ndarray) -> np.ndarray:
+        """
+        Move every falling segment on the given boards down one row.
+
+        Returns:
+            np.ndarray: Per-board flags (over the whole batch) for boards where something moved.
+        """
+        moved = np.zeros(self.count, dtype=bool)
+        if len(boards) == 0:
+            return moved
+        planes = self.planes[:, boards]
+        capsule = planes[CAPSULE]
+        empty = ~(planes[0] | planes[1] | planes[2])
+        # A stack of segments falls if the cell under its lowest one is
+        # empty. Adding a bit at the bottom of each such stack carries
+        # through the whole stack and no further, so the bits the addition
+        # flips within the capsule plane are exactly the falling segments.
+        # The floor lies below bit 0, which no shift reaches.
+        bottoms = capsule & (empty << 1)
+        moving = ((capsule + bottoms) ^ capsule) & capsule
+        found = moving.any(axis=1)
+        if found.any():
+            self.planes[:, boards] = (planes & ~moving) | ((planes & moving) >> 1)
+        moved[boards] = found
+        return moved
+
+    def _clear_matches(self, boards: np.ndarray) -> np.ndarray:
+        """
+        Remove runs of four or more on the given boards.
+
+        Returns:
+            np.ndarray: Per-board flags (over the whole batch) for boards that cleared cells.
+        """
+        cleared = np.zeros(self.count, dtype=bool)
+        if len(boards) == 0:
+            return cleared
+        planes = self.planes[:, boards]
+        marks = _run_marks(planes[:3])
+        found = marks.any(axis=1)
+        if found.any():
+            self.planes[:, boards] = planes & ~marks
+        cleared[boards] = found
+        return cleared
+
+    def command(self, command: str, where: Optional[np.ndarray] = None) -> bool:
+        """
+        Apply one a2.py command line to the selected boards.
+
+        Returns:
+            bool: False if the command was a quit, True otherwise.
+        """
+        parsed = parse_command(command)
+        if parsed is None:
+            return True
+        opcode = parsed[0]
+        if opcode == TICK:
+            self.tick(where)
+        elif opcode == LEFT:
+            self.move_faller_left(where)
+        elif opcode == RIGHT:
+            self.move_faller_right(where)
+        elif opcode == ROTATE:
+            self.rotate_faller(parsed[1], where)
+        elif opcode == DROP:
+            self.hard_drop(where)
+        elif opcode == FALLER:
+            self.create_faller(parsed[1], parsed[2], where)
+        elif opcode == VIRUS:
+            _, row, col, color = parsed
+            if 0 <= row < self.rows and 0 <= col < self.columns:
+                self.create_virus(row, col, color, where)
+        elif opcode == QUIT:
+            return False
+        return True
+
+    def virus_counts(self) -> np.ndarray:
+        """Return the number of viruses on each board."""
+        planes = self.planes
+        viruses = (planes[0] | planes[1] | planes[2]) & ~planes[CAPSULE]
+        return _bit_count(viruses).sum(axis=1)
+
+    def has_viruses(self) -> np.ndarray:
+        """Return per-board flags for boards that still contain viruses."""
+        planes = self.planes
+        return ((planes[0] | planes[1] | planes[2]) & ~planes[CAPSULE]).any(axis=1)
+
+    def get_cell_display(self, index: int, row: int, col: int) -> str:
+        """Get the 3-character display for a cell of one board, as GameState does."""
+        if self.has_faller[index]:
+            top, left = int(self.faller_row[index]), int(self.faller_col[index])
+            vertical = bool(self.faller_vertical[index])
+            opening, closing = ('|', '|') if self.faller_landed[index] else ('[', ']')
+            if (row, col) == (top, left):
+                color = CELL_CHARS[self.faller_color1[index]]
+                return f"{opening}{color}{closing}" if vertical else f"{opening}{color}-"
+            if (row, col) == ((top + 1, left) if vertical else (top, left + 1)):
+                color = CELL_CHARS[self.faller_color2[index]]
+                return f"{opening}{color}{closing}" if vertical else f"-{color}{closing}"
+        bit = 1 << (self.rows - 1 - row)
+        red, yellow, blue, capsule = self.planes[:, index, col].tolist()
+        code = 1 if red & bit else 2 if yellow & bit else 3 if blue & bit else 0
+        if code and capsule & bit:
+            code += 3
+        return f' {CELL_CHARS[code]} '
+
+
+def _run_marks(colors: np.ndarray) -> np.ndarray:
+    """
+    Mark the cells that sit in a run of four or more.
+
+    Args:
+        colors: (3, count, columns) colour planes of column lanes.
+
+    Returns:
+        np.ndarray: (count, columns) lanes of the marked cells.
+    """
+    down = colors & (colors >> 1)
+    down &= down >> 2
+    marks = down | (down << 1)
+    marks |= marks << 2
+    across = colors[..., :-3] & colors[..., 1:-2] & colors[..., 2:-1] & colors[..., 3:]
+    for offset in range(4):
+        marks[..., offset:offset + across.shape[-1]] |= across
+    return marks[0] | marks[1] | marks[2]
+
+
+def _bit_count(lanes: np.ndarray) -> np.ndarray:
+    """Count the set bits of each lane."""
+    if hasattr(np, 'bitwise_count'):  # NumPy 2.0 and later
+        return np.bitwise_count(lanes)
+    return sum((lanes >> bit) & 1 for bit in range(np.iinfo(lanes.dtype).bits))
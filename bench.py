@@ -0,0 +1,549 @@
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import argparse
+import io
+import json
+import platform
+import random
+import sys
+import time
+
+from game_logic import STATE_BYTES, GameState
+
+DEFAULT_SIZES = '8x6,16x8,64x32,250x250,1000x1000'
+DEFAULT_OUTPUT = 'bench_output.txt'
+# Most chain links in a 'chain' board, and most rows a 'tower' falls.
+CHAIN_DEPTH = 16
+TOWER_DROP = 8
+# Shortest time one sample of a fast benchmark is stretched to.
+MIN_SAMPLE = 0.02
+# Virus density of the levels the batch benchmark plays.
+BATCH_DENSITY = 0.3
+# Virus density of the levels the lookahead benchmark searches.
+LOOKAHEAD_DENSITY = 0.4
+
+
+def random_state(rows: int, columns: int, seed: int = 0) -> GameState:
+    """Build a half-full field with a faller in play."""
+    rng = random.Random(seed)
+    contents = [''.join(rng.choice('ryb  ') if r > 1 else ' ' for _ in range(columns)) for r in range(rows)]
+    state = GameState(rows, columns, 'CONTENTS', contents)
+    state.create_faller('R', 'Y')
+    state.tick()
+    return state
+
+
+def bench_memory(count: int = 10000) -> int:
+    """
+    Measure the memory held per GameState on a 16 x 8 field.
+
+    Args:
+        count: Number of states to build; the largest is reported.
+
+    Returns:
+        int: Bytes per state.
+    """
+    return max(random_state(16, 8, seed).memory_bytes() for seed in range(count))
+
+
+def batch_script(rows: int, columns: int, pieces: int, seed: int = 0) -> List[str]:
+    """
+    Write the commands of a lockstep game: each faller may be rotated, is
+    moved to a random column, then ticked for as many commands as the field
+    has rows, which brings it to rest.
+    """
+    rng = random.Random(seed)
+    mid = columns // 2 - 1
+    commands = []
+    for _ in range(pieces):
+        commands.append(f'F {rng.choice("RYB")} {rng.choice("RYB")}')
+        if rng.random() < 0.5:
+            commands.append(rng.choice('AB'))
+        shift = rng.randrange(columns - 1) - mid
+        commands.extend(('<' if shift < 0 else '>') * abs(shift))
+        commands.extend([''] * rows)
+    return commands
+
+
+def bench_batch(boards: int, rows: int = 16, columns: int = 8, pieces: int = 10, sample: int = 1000,
+                backend: str = 'grid', repeat: int = 3) -> Optional[Dict[str, object]]:
+    """
+    Time batch_script on a BatchGameState against a loop over GameStates.
+
+    Every board starts from its own generated level at BATCH_DENSITY. The
+    loop is timed on the first sample boards only, since its cost per board
+    does not depend on how many there are. Each side is played repeat times
+    from the start and the fastest run is kept.
+
+    Returns:
+        A result record with the seconds per board and command of each, or
+        None if NumPy is not installed.
+    """
+    try:
+        from batch_state import BatchGameState
+    except ImportError:
+        return None
+    from commands import run_command
+    from levelgen import generate_level
+    commands = batch_script(rows, columns, pieces)
+    states = [generate_level(rows, columns, seed, density=BATCH_DENSITY, backend=backend) for seed in range(boards)]
+    batch_times = []
+    for _ in range(repeat):
+        batch = BatchGameState.from_states(states)
+        began = time.perf_counter()
+        for command in commands:
+            batch.command(command)
+        batch_times.append((time.perf_counter() - began) / (boards * len(commands)))
+    loop_times = []
+    for _ in range(repeat):
+        played = [state.clone() for state in states[:sample]]
+        began = time.perf_counter()
+        for state in played:
+            for command in commands:
+                run_command(state, command)
+        loop_times.append((time.perf_counter() - began) / (len(played) * len(commands)))
+    batch_time, loop_time = min(batch_times), min(loop_times)
+    return {'benchmark': 'batch', 'board': 'levels', 'size': f'{rows}x{columns}', 'backend': backend,
+            'boards': boards, 'commands': len(commands), 'game_over': int(batch.game_over.sum()),
+            'seconds': batch_time, 'loop_seconds': loop_time, 'speedup': loop_time / batch_time}
+
+
+def bench_lookahead(levels: int = 20, rows: int = 16, columns: int = 8, depth: int = 2, backend: str = 'grid',
+                    repeat: int = 3) -> Dict[str, object]:
+    """
+    Time LookaheadPlayer choosing a placement on generated levels.
+
+    Each level gets a random faller and the depth - 1 fallers after it, and
+    the player starts every choice with an empty transposition table. The
+    fastest of repeat runs is kept.
+
+    Returns:
+        A result record with the seconds per placement examined (the nodes
+        of the search) and per enumerate_placements call.
+    """
+    from engine import LookaheadPlayer, enumerate_placements
+    from levelgen import generate_level
+    rng = random.Random(0)
+    games = []
+    for seed in range(levels):
+        state = generate_level(rows, columns, seed, density=LOOKAHEAD_DENSITY, backend=backend)
+        state.create_faller(rng.choice('RYB'), rng.choice('RYB'))
+        games.append((state, tuple((rng.choice('RYB'), rng.choice('RYB')) for _ in range(depth - 1))))
+    player = LookaheadPlayer(depth=depth)
+    times, enumerate_times = [], []
+    for _ in range(repeat):
+        nodes = 0
+        began = time.perf_counter()
+        for state, upcoming in games:
+            player.table.clear()
+            player.choose(state, upcoming)
+            nodes += player.nodes
+        times.append((time.perf_counter() - began) / nodes)
+        began = time.perf_counter()
+        for state, _ in games:
+            enumerate_placements(state)
+        enumerate_times.append((time.perf_counter() - began) / levels)
+    seconds = min(times)
+    return {'benchmark': 'lookahead', 'board': 'levels', 'size': f'{rows}x{columns}', 'backend': backend,
+            'depth': depth, 'placements': nodes, 'seconds': seconds, 'per_second': 1 / seconds,
+            'enumerate_seconds': min(enumerate_times)}
+
+
+def board_contents(kind: str, rows: int, columns: int, seed: int = 0) -> Optional[List[str]]:
+    """
+    Build the CONTENTS rows of a benchmark field.
+
+    Args:
+        kind: 'empty'; 'random' (viruses and capsules below the top third);
+            'full' (every cell, no two touching cells alike);
+            'checkerboard' (viruses on alternate cells); 'chain' (in every
+            column, stacks of three viruses under capsule segments that
+            complete them one chain step at a time, the first already in
+            place); or 'tower' (capsules filling the lower half but for the
+            TOWER_DROP rows under them).
+        rows: Field rows.
+        columns: Field columns.
+        seed: Seed for 'random'.
+
+    Returns:
+        The rows, or None for 'empty'.
+    """
+    if kind == 'empty':
+        return None
+    if kind == 'random':
+        rng = random.Random(seed)
+        return [''.join(rng.choice('rybRYB    ') if r >= rows // 3 else ' ' for _ in range(columns))
+                for r in range(rows)]
+    if kind == 'full':
+        return [''.join(('RYB' if (r + c) % 2 else 'ryb')[(r + 2 * c) % 3] for c in range(columns))
+                for r in range(rows)]
+    if kind == 'checkerboard':
+        return [''.join('rb'[r % 2] if (r + c) % 2 == 0 else ' ' for c in range(columns)) for r in range(rows)]
+    if kind == 'chain':
+        # From the bottom: depth groups of three viruses, then one capsule
+        # segment per group, nearest group first. Colours shift by column so
+        # that no row holds a run.
+        depth = max(min(rows // 4, CHAIN_DEPTH), 1)
+        stacks = []
+        for c in range(columns):
+            stack = ''.join('ryb'[(g + c) % 3] * 3 for g in range(depth))
+            stack += ''.join('RYB'[(g + c) % 3] for g in reversed(range(depth)))
+            stacks.append(stack[:rows].ljust(rows)[::-1])
+        return [''.join(stack[r] for stack in stacks) for r in range(rows)]
+    if kind == 'tower':
+        drop = min(TOWER_DROP, rows // 4)
+        return [''.join('RYB'[(r + 2 * c) % 3] if rows // 2 <= r < rows - drop else ' ' for c in range(columns))
+                for r in range(rows)]
+    raise ValueError(f'Unknown board: {kind!r}')
+
+
+def make_board(kind: str, rows: int, columns: int, backend: str = 'grid', settle: bool = True) -> GameState:
+    """
+    Build a benchmark field.
+
+    Args:
+        kind: See board_contents.
+        rows: Field rows.
+        columns: Field columns.
+        backend: Field storage backend.
+        settle: Resolve gravity and matches first, as a game in progress has.
+    """
+    contents = board_contents(kind, rows, columns)
+    state = GameState(rows, columns, 'CONTENTS' if contents else 'EMPTY', contents, backend)
+    if settle:
+        state.apply_gravity()
+    return state
+
+
+class NullWriter:
+    """Output stream that discards what is written, counting the characters."""
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, text: str) -> int:
+        self.written += len(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def session_script(state: GameState, commands: int = 300, seed: int = 0) -> str:
+    """
+    Write an a2.py standard input for a session on a field's viruses.
+
+    The session starts EMPTY and lays out up to a third of its commands'
+    worth of the field's viruses, bottom row first, with v commands. Fallers
+    are then moved a little near the top and ticked or hard dropped to rest;
+    the script is played on a state of its own while it is written, so it
+    stays within what the game accepts.
+    """
+    from commands import run_command
+    rows, columns = state.get_rows(), state.get_columns()
+    lines = [str(rows), str(columns), 'EMPTY']
+    viruses = [(r, c, cell) for r in reversed(range(rows)) for c, cell in enumerate(state.get_row_text(r))
+               if cell in 'ryb']
+    state = GameState(rows, columns, 'EMPTY')
+    for row, col, color in viruses[:commands // 3]:
+        lines.append(f'v {row} {col} {color}')
+        run_command(state, lines[-1])
+    rng = random.Random(seed)
+    while len(lines) < commands and not state.game_over:
+        if not state.has_faller:
+            command = f'F {rng.choice("RYB")} {rng.choice("RYB")}'
+        elif state.faller_row < 3:
+            command = rng.choice(('<', '>', 'A', 'B', ''))
+        else:
+            command = 'D' if rng.random() < 0.02 else ''
+        run_command(state, command)
+        lines.append(command)
+    return '\n'.join(lines + ['Q']) + '\n'
+
+
+def run_session(script: str) -> int:
+    """Pipe a script through a2.main and return the characters it printed."""
+    import a2
+    out = NullWriter()
+    stdin, stdout = sys.stdin, sys.stdout
+    sys.stdin, sys.stdout = io.StringIO(script), out
+    try:
+        a2.main([])
+    finally:
+        sys.stdin, sys.stdout = stdin, stdout
+    return out.written
+
+
+def _display(state: GameState) -> int:
+    """Print the field with a2.display_field to a discarding stream."""
+    import a2
+    out = NullWriter()
+    stdout, sys.stdout = sys.stdout, out
+    try:
+        a2.display_field(state)
+    finally:
+        sys.stdout = stdout
+    return out.written
+
+
+def _all_cells(state: GameState) -> int:
+    """Call get_cell_display for every cell."""
+    display = state.get_cell_display
+    columns = state.get_columns()
+    return sum(len(display(r, c)) for r in range(state.get_rows()) for c in range(columns))
+
+
+def _freeze(state: GameState):
+    """Prepare freeze_faller with a faller resting on the stack below the spawn point."""
+    state = state.clone()
+    if state.create_faller('R', 'Y'):
+        state.faller_row += state.drop_distance()
+        state.faller_landed = True
+    return state.clone, lambda s: s.freeze_faller()
+
+
+def _session(state: GameState):
+    """Prepare an a2.py session on the field's viruses."""
+    script = session_script(state)
+    return (lambda: script), run_session
+
+
+class Benchmark(NamedTuple):
+    """
+    One timed operation.
+
+    prepare turns a field built by make_board into a setup and a run
+    function; setup's result is passed to run, and only run is timed. The
+    fields are settled first unless settle is False.
+    """
+    name: str
+    boards: Tuple[str, ...]
+    prepare: Callable[[GameState], Tuple[Callable[[], object], Callable[[object], object]]]
+    settle: bool = True
+
+
+def _fresh(run: Callable[[GameState], object]):
+    """Prepare a benchmark that runs on a new copy of the field every call."""
+    return lambda state: (state.clone, run)
+
+
+def _shared(run: Callable[[GameState], object]):
+    """Prepare a benchmark that leaves the field unchanged."""
+    return lambda state: ((lambda: state), run)
+
+
+BENCHMARKS: List[Benchmark] = [
+    # Fields straight from CONTENTS, with every cell waiting for a match scan.
+    Benchmark('find_matches', ('random', 'full', 'checkerboard'), _fresh(lambda s: s.find_matches()), False),
+    Benchmark('find_matches_full', ('random', 'full', 'checkerboard'),
+              _shared(lambda s: s.find_matches(full=True))),
+    # Unsettled fields: apply_gravity runs the whole cascade.
+    Benchmark('cascade', ('chain', 'tower', 'random'), _fresh(lambda s: s.apply_gravity()), False),
+    Benchmark('handle_matching', ('chain', 'random'), _fresh(lambda s: s.handle_matching()), False),
+    Benchmark('freeze_faller', ('random', 'tower', 'empty'), _freeze),
+    Benchmark('has_viruses', ('random', 'full', 'empty'), _shared(lambda s: s.has_viruses())),
+    Benchmark('get_cell_display', ('random', 'full'), _shared(_all_cells)),
+    Benchmark('display_field', ('random', 'full', 'checkerboard'), _shared(_display)),
+    Benchmark('a2_session', ('empty', 'random'), _session),
+]
+
+
+def measure(setup: Callable[[], object], run: Callable[[object], object], repeat: int = 5,
+            max_time: float = 2.0) -> Tuple[List[float], int]:
+    """
+    Time a run function, timeit style.
+
+    Each sample times number consecutive runs, with number doubled until a
+    sample takes MIN_SAMPLE seconds; setups for a sample are made before it
+    starts.
+
+    Args:
+        setup: Makes the argument for one run.
+        run: The timed operation.
+        repeat: Samples to take.
+        max_time: Seconds after which no more samples are started.
+
+    Returns:
+        (seconds per run of each sample, runs per sample)
+    """
+    start = time.perf_counter()
+    number = 1
+    while True:
+        args = [setup() for _ in range(number)]
+        began = time.perf_counter()
+        for arg in args:
+            run(arg)
+        elapsed = time.perf_counter() - began
+        if elapsed >= MIN_SAMPLE or time.perf_counter() - start >= max_time:
+            break
+        number *= 2
+    samples = [elapsed / number]
+    while len(samples) < repeat and time.perf_counter() - start < max_time:
+        args = [setup() for _ in range(number)]
+        began = time.perf_counter()
+        for arg in args:
+            run(arg)
+        samples.append((time.perf_counter() - began) / number)
+    return samples, number
+
+
+def parse_sizes(text: str) -> List[Tuple[int, int]]:
+    """Parse 'ROWSxCOLUMNS,...' into (rows, columns) pairs."""
+    sizes = []
+    for part in text.split(','):
+        rows, _, columns = part.strip().lower().partition('x')
+        sizes.append((int(rows), int(columns)))
+    return sizes
+
+
+def run_benchmarks(sizes: Iterable[Tuple[int, int]], names: Optional[List[str]] = None, backend: str = 'grid',
+                   repeat: int = 5, max_time: float = 2.0, progress=None) -> Iterable[Dict[str, object]]:
+    """
+    Run the benchmarks on every size and board, yielding one record each.
+
+    Args:
+        sizes: (rows, columns) field sizes.
+        names: Benchmarks to run (default: all).
+        backend: Field storage backend.
+        repeat: Samples per benchmark.
+        max_time: Seconds per benchmark after which no more samples are started.
+        progress: Stream to report each result on as it finishes.
+    """
+    for rows, columns in sizes:
+        boards: Dict[Tuple[str, bool], GameState] = {}
+        for bench in BENCHMARKS:
+            if names and bench.name not in names:
+                continue
+            for kind in bench.boards:
+                if (kind, bench.settle) not in boards:
+                    boards[kind, bench.settle] = make_board(kind, rows, columns, backend, bench.settle)
+                setup, run = bench.prepare(boards[kind, bench.settle])
+                samples, number = measure(setup, run, repeat, max_time)
+                record = {'benchmark': bench.name, 'board': kind, 'size': f'{rows}x{columns}', 'backend': backend,
+                          'seconds': min(samples), 'median': sorted(samples)[len(samples) // 2],
+                          'samples': len(samples), 'number': number}
+                if progress:
+                    print(f"{bench.name:18} {kind:12} {rows:>5}x{columns:<5} {_format_time(record['seconds'])}",
+                          file=progress, flush=True)
+                yield record
+
+
+def _format_time(seconds: float) -> str:
+    """Format a duration with a unit that suits it."""
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:8.2f} {unit}'
+    return f'{seconds * 1e9:8.0f} ns'
+
+
+def _key(record: Dict[str, object]) -> Tuple:
+    return record['benchmark'], record['board'], record['size'], record.get('backend', 'grid')
+
+
+def load_results(path: str) -> Dict[Tuple, Dict[str, object]]:
+    """Read the timing records of a results file, keyed by benchmark, board, size and backend."""
+    results = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if 'seconds' in record:
+                results[_key(record)] = record
+    return results
+
+
+def compare(baseline: Dict[Tuple, Dict[str, object]], current: Dict[Tuple, Dict[str, object]],
+            threshold: float, out=sys.stdout) -> List[Tuple]:
+    """
+    Print the change of every benchmark found in both result sets.
+
+    Args:
+        baseline: Earlier results, from load_results.
+        current: New results.
+        threshold: Percentage slowdown above which a benchmark regressed.
+        out: Stream for the report.
+
+    Returns:
+        The keys of the benchmarks that regressed.
+    """
+    regressed = []
+    for key in sorted(set(baseline) & set(current)):
+        old, new = baseline[key]['seconds'], current[key]['seconds']
+        change = 100.0 * (new - old) / old if old else 0.0
+        flag = ''
+        if change > threshold:
+            regressed.append(key)
+            flag = '  REGRESSED'
+        name, board, size, backend = key
+        print(f'{name:18} {board:12} {size:>11} {backend:8} {_format_time(old)} -> {_format_time(new)} '
+              f'{change:+7.1f}%{flag}', file=out)
+    missing = len(set(baseline) - set(current))
+    if missing:
+        print(f'{missing} baseline benchmarks were not run', file=out)
+    return regressed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmarks for the game engine.')
+    parser.add_argument('--count', type=int, default=1000, help='states to build for the memory benchmark')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'ROWSxCOLUMNS list (default: {DEFAULT_SIZES})')
+    parser.add_argument('--only', default=None, metavar='NAMES',
+                        help='comma-separated benchmarks to run: memory, batch, lookahead, ' + ', '.join(b.name for b in BENCHMARKS))
+    parser.add_argument('--batch-boards', type=int, default=20000, help='boards for the batch benchmark')
+    parser.add_argument('--backend', choices=('grid', 'bitboard'), default='grid')
+    parser.add_argument('--repeat', type=int, default=5, help='samples per benchmark')
+    parser.add_argument('--max-time', type=float, default=2.0, metavar='SECONDS',
+                        help='stop sampling a benchmark after this long')
+    parser.add_argument('--out', default=DEFAULT_OUTPUT, help=f'results file, one JSON record per line '
+                                                              f'(default: {DEFAULT_OUTPUT})')
+    parser.add_argument('--compare', nargs='+', metavar='FILE',
+                        help='compare against a baseline results file after running, or compare two files '
+                             '(BASELINE CURRENT) without running')
+    parser.add_argument('--threshold', type=float, default=10.0, metavar='PERCENT',
+                        help='slowdown that counts as a regression (default: 10)')
+    args = parser.parse_args(argv)
+    if args.compare and len(args.compare) > 2:
+        parser.error('--compare takes a baseline file and optionally a current file')
+    if args.compare and len(args.compare) == 2:
+        regressed = compare(load_results(args.compare[0]), load_results(args.compare[1]), args.threshold)
+        return 1 if regressed else 0
+    names = args.only.split(',') if args.only else None
+    baseline = load_results(args.compare[0]) if args.compare else None
+
+    status = 0
+    with open(args.out, 'w') as out:
+        out.write(json.dumps({'python': platform.python_version(), 'platform': platform.platform(),
+                              'time': time.strftime('%Y-%m-%dT%H:%M:%S')}) + '\n')
+        if not names or 'memory' in names:
+            per_state = bench_memory(args.count)
+            ok = per_state <= STATE_BYTES
+            out.write(json.dumps({'benchmark': 'memory', 'bytes': per_state, 'budget': STATE_BYTES}) + '\n')
+            print(f"memory: {per_state} bytes per state (budget {STATE_BYTES}) {'ok' if ok else 'OVER BUDGET'}")
+            status = 0 if ok else 1
+        current = {}
+        if not names or 'batch' in names:
+            record = bench_batch(args.batch_boards, backend=args.backend, repeat=args.repeat)
+            if record is None:
+                print('batch: skipped, NumPy is not installed')
+            else:
+                out.write(json.dumps(record) + '\n')
+                current[_key(record)] = record
+                print(f"batch: {record['boards']} boards of {record['size']}, {record['commands']} commands: "
+                      f"{_format_time(record['seconds'])} per board and command against "
+                      f"{_format_time(record['loop_seconds'])} for single states ({record['speedup']:.1f}x)")
+        if not names or 'lookahead' in names:
+            record = bench_lookahead(backend=args.backend, repeat=args.repeat)
+            out.write(json.dumps(record) + '\n')
+            current[_key(record)] = record
+            print(f"lookahead: depth {record['depth']} on {record['size']} levels: {record['per_second']:.0f} "
+                  f"placements per second, {_format_time(record['enumerate_seconds'])} per enumerate_placements")
+        for record in run_benchmarks(parse_sizes(args.sizes), names, args.backend, args.repeat, args.max_time,
+                                     sys.stdout):
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            current[_key(record)] = record
+    if baseline is not None and compare(baseline, current, args.threshold):
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
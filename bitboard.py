@@ -0,0 +1,258 @@
+from typing import Dict, List, Optional, Set, Tuple
+from array import array
+
+from zobrist import cell_key
+
+VIRUS_COLORS = ('r', 'y', 'b')
+CAPSULE_COLORS = ('R', 'Y', 'B')
+
+
+class BitBoard:
+    """
+    Field storage as one integer bitmask per colour and kind.
+    
+    Cell (row, col) is bit row * stride + col, where the stride is one more
+    than the number of columns. The spare bit at the end of every row is
+    always clear, so a horizontal shift never carries a run from one row into
+    the next. Offers the same interface as game_logic.GridBoard; the Zobrist
+    hash uses the grid's row * columns + col cell indices, so both backends
+    hash a field alike.
+    """
+    
+    __slots__ = ('rows', 'columns', 'stride', 'board_mask', 'column_mask', 'viruses', 'capsules', 'occupied',
+                 'counts', 'stamp', 'row_stamps', 'zobrist')
+    
+    def __init__(self, rows: int, columns: int):
+        self.rows: int = rows
+        self.columns: int = columns
+        self.stride: int = columns + 1
+        row_mask = (1 << columns) - 1
+        self.board_mask: int = 0
+        # column_mask has a bit set in column 0 of every row.
+        self.column_mask: int = 0
+        for r in range(rows):
+            self.board_mask |= row_mask << (r * self.stride)
+            self.column_mask |= 1 << (r * self.stride)
+        self.viruses: Dict[str, int] = {color: 0 for color in VIRUS_COLORS}
+        self.capsules: Dict[str, int] = {color: 0 for color in CAPSULE_COLORS}
+        self.occupied: int = 0
+        self.counts: Dict[str, int] = {color: 0 for color in VIRUS_COLORS + CAPSULE_COLORS}
+        self.stamp: int = 0
+        self.row_stamps: array = array('Q', [0] * rows)
+        self.zobrist: int = 0
+    
+    def load(self, contents: List[str]):
+        """Fill the field from CONTENTS rows."""
+        for r in range(self.rows):
+            for c in range(self.columns):
+                if contents[r][c] != ' ':
+                    self.place(r, c, contents[r][c])
+    
+    def _bit(self, row: int, col: int) -> int:
+        """Return the mask bit for a cell, rejecting cells off the field."""
+        if not (0 <= row < self.rows and 0 <= col < self.columns):
+            raise IndexError('cell out of range')
+        return 1 << (row * self.stride + col)
+    
+    def get(self, row: int, col: int) -> str:
+        """Return the character stored in a cell."""
+        bit = self._bit(row, col)
+        if not self.occupied & bit:
+            return ' '
+        for color, mask in self.viruses.items():
+            if mask & bit:
+                return color
+        for color, mask in self.capsules.items():
+            if mask & bit:
+                return color
+        return ' '
+    
+    def is_empty(self, row: int, col: int) -> bool:
+        """Check whether a cell is empty."""
+        return not self.occupied & self._bit(row, col)
+    
+    def top(self, col: int) -> int:
+        """Return the topmost occupied row of a column, or rows if it is empty."""
+        column = self.occupied & (self.column_mask << col)
+        if not column:
+            return self.rows
+        return ((column & -column).bit_length() - 1) // self.stride
+    
+    def place(self, row: int, col: int, cell: str):
+        """Write a virus or capsule segment into a cell."""
+        if cell not in self.counts:
+            return
+        bit = self._bit(row, col)
+        if self.occupied & bit:
+            self._remove(bit)
+        if cell in self.viruses:
+            self.viruses[cell] |= bit
+        else:
+            self.capsules[cell] |= bit
+        self.occupied |= bit
+        self.counts[cell] += 1
+        self.zobrist ^= cell_key(row * self.columns + col, ord(cell))
+        self.touch((row,))
+    
+    def touch(self, rows):
+        """Advance the change stamp and record it against the given rows."""
+        self.stamp += 1
+        for row in rows:
+            self.row_stamps[row] = self.stamp
+    
+    def row_text(self, row: int) -> str:
+        """Return the cell characters of one row as a string."""
+        return ''.join(self.get(row, c) for c in range(self.columns))
+    
+    def to_rows(self) -> List[List[str]]:
+        """Return a copy of the field as rows of cell characters."""
+        return [[self.get(r, c) for c in range(self.columns)] for r in range(self.rows)]
+    
+    def to_bytes(self) -> bytes:
+        """Return the field as row-major cell characters."""
+        return ''.join(self.row_text(r) for r in range(self.rows)).encode('latin-1')
+    
+    def load_bytes(self, data: bytes):
+        """Replace the whole field with row-major cell characters from to_bytes."""
+        for kind in (self.viruses, self.capsules):
+            for color in kind:
+                kind[color] = 0
+        self.occupied = 0
+        self.zobrist = 0
+        for cell in self.counts:
+            self.counts[cell] = 0
+        text = data.decode('latin-1')
+        self.load([text[r * self.columns:(r + 1) * self.columns] for r in range(self.rows)])
+        self.touch(range(self.rows))
+    
+    def copy(self) -> 'BitBoard':
+        """Return an independent copy of the board."""
+        board = BitBoard.__new__(BitBoard)
+        board.rows = self.rows
+        board.columns = self.columns
+        board.stride = self.stride
+        board.board_mask = self.board_mask
+        board.column_mask = self.column_mask
+        board.viruses = self.viruses.copy()
+        board.capsules = self.capsules.copy()
+        board.occupied = self.occupied
+        board.counts = self.counts.copy()
+        board.stamp = self.stamp
+        board.row_stamps = self.row_stamps[:]
+        board.zobrist = self.zobrist
+        return board
+    
+    def checkpoint(self) -> tuple:
+        """Capture the board for rollback()."""
+        return self.viruses.copy(), self.capsules.copy(), self.occupied, self.counts.copy(), self.zobrist
+    
+    def rollback(self, checkpoint: tuple):
+        """Return the board to a checkpoint() of it; a checkpoint can be rolled back to any number of times."""
+        viruses, capsules, self.occupied, counts, self.zobrist = checkpoint
+        self.viruses.update(viruses)
+        self.capsules.update(capsules)
+        self.counts.update(counts)
+        self.touch(range(self.rows))
+    
+    def _match_mask(self) -> int:
+        """Return the mask of cells in a horizontal or vertical run of four or more."""
+        s = self.stride
+        found = 0
+        for virus, capsule in zip(VIRUS_COLORS, CAPSULE_COLORS):
+            m = self.viruses[virus] | self.capsules[capsule]
+            h = m & (m >> 1) & (m >> 2) & (m >> 3)
+            v = m & (m >> s) & (m >> 2 * s) & (m >> 3 * s)
+            found |= h | (h << 1) | (h << 2) | (h << 3)
+            found |= v | (v << s) | (v << 2 * s) | (v << 3 * s)
+        return found
+    
+    def adjacent_pairs(self) -> int:
+        """Count the pairs of touching cells of one colour, side by side or one above the other."""
+        s = self.stride
+        pairs = 0
+        for virus, capsule in zip(VIRUS_COLORS, CAPSULE_COLORS):
+            m = self.viruses[virus] | self.capsules[capsule]
+            pairs += (m & (m >> 1)).bit_count() + (m & (m >> s)).bit_count()
+        return pairs
+    
+    def _cells(self, mask: int) -> List[Tuple[int, int]]:
+        """List the (row, col) cells of a mask in row-major order."""
+        cells = []
+        while mask:
+            low = mask & -mask
+            cells.append(divmod(low.bit_length() - 1, self.stride))
+            mask ^= low
+        return cells
+    
+    def _hash_cells(self, mask: int, code: int) -> int:
+        """Return the XOR of the Zobrist keys of a cell byte in every cell of a mask."""
+        h = 0
+        columns = self.columns
+        for row, col in self._cells(mask):
+            h ^= cell_key(row * columns + col, code)
+        return h
+    
+    def find_matches(self, full: bool = False) -> Set[Tuple[int, int]]:
+        """
+        Find all cells involved in matches of 4 or more.
+        
+        The whole field is checked with a few shifts per colour, so full
+        makes no difference here.
+        """
+        return set(self._cells(self._match_mask()))
+    
+    def _remove(self, mask: int):
+        """Empty every cell in a mask."""
+        keep = ~mask
+        for kind in (self.viruses, self.capsules):
+            for color, cells in kind.items():
+                removed = cells & mask
+                if removed:
+                    self.counts[color] -= removed.bit_count()
+                    self.zobrist ^= self._hash_cells(removed, ord(color))
+                    kind[color] = cells & keep
+        self.occupied &= keep
+    
+    def clear_matches(self) -> List[Tuple[int, int]]:
+        """Remove every cell in a run of four or more and return them sorted."""
+        found = self._match_mask()
+        if not found:
+            return []
+        self._remove(found)
+        cells = self._cells(found)
+        self.touch({row for row, _ in cells})
+        return cells
+    
+    def drop_step(self, moves: Optional[List[Tuple[int, int]]] = None) -> bool:
+        """
+        Move every falling segment down one row; return whether any moved.
+        
+        Args:
+            moves: List to append the (row, col) each segment moved from to.
+        """
+        s = self.stride
+        capsules = self.capsules['R'] | self.capsules['Y'] | self.capsules['B']
+        empty = self.board_mask & ~self.occupied
+        # A segment falls if the cell below it is empty or is itself falling.
+        moving = capsules & (empty >> s)
+        while True:
+            grown = capsules & ((empty | moving) >> s)
+            if grown == moving:
+                break
+            moving = grown
+        if not moving:
+            return False
+        if moves is not None:
+            moves.extend(self._cells(moving))
+        for color, mask in self.capsules.items():
+            part = mask & moving
+            if part:
+                self.capsules[color] = (mask ^ part) | (part << s)
+                self.zobrist ^= self._hash_cells(part, ord(color)) ^ self._hash_cells(part << s, ord(color))
+        self.occupied = (self.occupied ^ moving) | (moving << s)
+        rows = set()
+        for row, _ in self._cells(moving):
+            rows.add(row)
+            rows.add(row + 1)
+        self.touch(rows)
+        return True
@@ -0,0 +1,152 @@
+from typing import Callable, Dict, Iterable, Optional, Tuple
+import logging
+import sys
+
+from game_logic import GameState
+
+log = logging.getLogger(__name__)
+
+# Opcodes for parsed commands.
+QUIT = 'Q'
+TICK = 'tick'
+FALLER = 'F'
+ROTATE = 'rotate'
+LEFT = '<'
+RIGHT = '>'
+VIRUS = 'v'
+DROP = 'D'
+
+Command = Tuple
+
+# Whole-line commands that take no arguments.
+SIMPLE_COMMANDS: Dict[str, Command] = {
+    'Q': (QUIT,),
+    '': (TICK,),
+    'A': (ROTATE, True),
+    'B': (ROTATE, False),
+    '<': (LEFT,),
+    '>': (RIGHT,),
+    'D': (DROP,),
+}
+
+CAPSULE_COLORS = ('R', 'B', 'Y')
+VIRUS_COLORS = ('r', 'y', 'b')
+
+
+def _parse_faller(parts) -> Optional[Command]:
+    """Parse the words of an F command."""
+    if len(parts) == 3 and parts[1] in CAPSULE_COLORS and parts[2] in CAPSULE_COLORS:
+        return (FALLER, parts[1], parts[2])
+    return None
+
+
+def _parse_virus(parts) -> Optional[Command]:
+    """Parse the words of a v command."""
+    if len(parts) == 4 and parts[3] in VIRUS_COLORS:
+        try:
+            return (VIRUS, int(parts[1]), int(parts[2]), parts[3])
+        except ValueError:
+            return None
+    return None
+
+
+# Commands recognised by their first character and parsed from their words.
+PREFIX_COMMANDS: Dict[str, Callable] = {
+    'F': _parse_faller,
+    'v': _parse_virus,
+}
+
+
+def parse_command(command: str) -> Optional[Command]:
+    """
+    Parse one command line.
+
+    Args:
+        command: A line of the a2.py command protocol.
+
+    Returns:
+        An (opcode, *args) tuple, or None for a line that is not a valid command.
+    """
+    command = command.strip()
+    parsed = SIMPLE_COMMANDS.get(command)
+    if parsed is not None:
+        return parsed
+    parser = PREFIX_COMMANDS.get(command[0])
+    if parser is None:
+        return None
+    return parser(command.split())
+
+
+def apply_command(state: GameState, parsed: Optional[Command]) -> bool:
+    """
+    Apply a parsed command to a game state.
+
+    Returns:
+        bool: False if the command was a quit, True otherwise.
+    """
+    if parsed is None:
+        return True
+    opcode = parsed[0]
+    if opcode == TICK:
+        state.tick()
+    elif opcode == LEFT:
+        state.move_faller_left()
+    elif opcode == RIGHT:
+        state.move_faller_right()
+    elif opcode == ROTATE:
+        state.rotate_faller(parsed[1])
+    elif opcode == DROP:
+        state.hard_drop()
+    elif opcode == FALLER:
+        state.create_faller(parsed[1], parsed[2])
+    elif opcode == VIRUS:
+        _, row, col, color = parsed
+        if 0 <= row < state.get_rows() and 0 <= col < state.get_columns():
+            state.create_virus(row, col, color)
+    elif opcode == QUIT:
+        return False
+    return True
+
+
+def run_command(state: GameState, command: str) -> bool:
+    """
+    Parse and apply one command line.
+
+    Returns:
+        bool: False if the command was a quit, True otherwise.
+    """
+    parsed = parse_command(command)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug('Processing command %r: %r', command, parsed)
+    return apply_command(state, parsed)
+
+
+def run_commands(state: GameState, commands: Iterable[str], stop_on_game_over: bool = True) -> int:
+    """
+    Apply a sequence of command lines, e.g. a list or an open file.
+
+    Args:
+        state: Game state to drive.
+        commands: Command lines; trailing newlines are ignored.
+        stop_on_game_over: Stop as soon as the game is over, as a2.py does.
+
+    Returns:
+        int: Number of commands read, including a final quit.
+    """
+    count = 0
+    for command in commands:
+        if stop_on_game_over and state.game_over:
+            break
+        count += 1
+        if not run_command(state, command):
+            break
+    return count
+
+
+def enable_logging(enabled: bool = True):
+    """Switch per-command debug logging to standard error on or off."""
+    if enabled and not log.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        log.addHandler(handler)
+    log.setLevel(logging.DEBUG if enabled else logging.WARNING)
@@ -0,0 +1,309 @@
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import time
+
+from game_logic import EMPTY, CascadeResult, GameState
+
+# Faller commands tried from every position, in the a2.py protocol.
+MOVES = ('<', '>', 'A', 'B', '')
+
+# Default weights for score_state.
+WEIGHTS: Dict[str, float] = {
+    'virus': 100.0,     # per virus left on the field
+    'segment': 1.0,     # per capsule segment left on the field
+    'height': 4.0,      # per row of the tallest column
+    'hole': 6.0,        # per empty cell covered by something above it
+    'adjacent': 3.0,    # per pair of touching cells of one colour
+    'cleared': 10.0,    # per cell cleared by the placement's cascade
+    'win': 10000.0,     # bonus once every virus is gone
+}
+LOSS = float('-inf')
+
+# Maps a cell byte to 1 if it is empty and 0 otherwise.
+FREE_CELLS = bytes(int(code == EMPTY) for code in range(256))
+
+
+class Placement(NamedTuple):
+    """A resting position for the faller and the commands that freeze it there."""
+    row: int
+    col: int
+    vertical: bool
+    color1: str
+    color2: str
+    commands: Tuple[str, ...]
+
+    @property
+    def drop_commands(self) -> Tuple[str, ...]:
+        """The commands with the closing run of ticks replaced by one hard drop (D)."""
+        end = len(self.commands)
+        while end and self.commands[end - 1] == '':
+            end -= 1
+        return self.commands[:end] + ('D',)
+
+
+def enumerate_placements(state: GameState) -> List[Placement]:
+    """
+    List every distinct position where the current faller can be frozen.
+
+    Runs a breadth-first search over faller positions reachable with the
+    <, >, A, B and tick commands, following the same rules as GameState's
+    faller methods, and visits each (position, orientation, landed) state
+    once. The field is assumed to be at rest, as it is between ticks.
+
+    Args:
+        state: A game state with an active faller.
+
+    Returns:
+        One Placement per distinct resting position and colour order, each
+        with a shortest command sequence ending in the tick that freezes it.
+    """
+    if not state.has_faller:
+        return []
+    rows, columns = state.rows, state.columns
+    # free[i] is 1 where cell i is empty, with a blocked row below the floor.
+    free = state.board.to_bytes().translate(FREE_CELLS) + bytes(columns + 1)
+    # Whether a horizontal or vertical faller whose first segment is at cell
+    # i has something under it.
+    landed_h = [not (free[i + columns] and free[i + columns + 1]) for i in range(rows * columns)]
+    landed_v = [not free[i + 2 * columns] if i < (rows - 2) * columns else True for i in range(rows * columns)]
+    colors = ((state.faller_color1, state.faller_color2), (state.faller_color2, state.faller_color1))
+
+    # A node packs the cell index of the first segment and the vertical,
+    # swapped-colour and landed flags into one int.
+    root = (state.faller_row * columns + state.faller_col) * 8 + state.faller_vertical * 4 + state.faller_landed
+    parents: Dict[int, Tuple[int, str]] = {root: (-1, '')}
+    queue = [root]
+    placements = []
+    seen = set()
+    for node in queue:
+        index, flags = node >> 3, node & 7
+        row, col = divmod(index, columns)
+        vertical = flags & 4
+        for move in MOVES:
+            new_index, new_flags = index, flags & 6
+            if move == '<':
+                if col == 0 or not free[index - 1] or (vertical and not free[index + columns - 1]):
+                    continue
+                new_index -= 1
+            elif move == '>':
+                edge = index if vertical else index + 1
+                if edge - row * columns == columns - 1 or not free[edge + 1] or (vertical and not free[edge + columns + 1]):
+                    continue
+                new_index += 1
+            elif move == '':
+                if flags & 1:
+                    color1, color2 = colors[(flags >> 1) & 1]
+                    key = (index, vertical, color1, color2)
+                    if key not in seen:
+                        seen.add(key)
+                        placements.append(Placement(row, col, bool(vertical), color1, color2,
+                                                    _commands(parents, node) + ('',)))
+                    continue
+                if (landed_v if vertical else landed_h)[index]:
+                    child = node | 1
+                    if child not in parents:
+                        parents[child] = (node, move)
+                        queue.append(child)
+                    continue
+                child = node + columns * 8
+                if child not in parents:
+                    parents[child] = (node, move)
+                    queue.append(child)
+                continue
+            elif not vertical:  # Horizontal to vertical
+                if row + 1 >= rows:
+                    continue  # Only a faller below the floor could result
+                if not free[index + columns]:
+                    if col > 0 and free[index - 1] and free[index + columns - 1]:
+                        new_index -= 1  # Wall kick
+                    else:
+                        continue
+                new_flags = (new_flags | 4) ^ (2 if move == 'B' else 0)
+            else:  # Vertical to horizontal
+                if col + 1 >= columns or not free[index + 1]:
+                    if col > 0 and free[index - 1]:
+                        new_index -= 1  # Wall kick
+                    else:
+                        continue
+                new_flags = (new_flags & 2) ^ (2 if move == 'A' else 0)
+            landed = (landed_v if new_flags & 4 else landed_h)[new_index]
+            child = new_index * 8 + new_flags + landed
+            if child not in parents:
+                parents[child] = (node, move)
+                queue.append(child)
+    return placements
+
+
+def _commands(parents: Dict[int, Tuple[int, str]], node: int) -> Tuple[str, ...]:
+    """Follow search parents back to the root and return the commands taken."""
+    commands = []
+    while True:
+        node, move = parents[node]
+        if node < 0:
+            break
+        commands.append(move)
+    return tuple(reversed(commands))
+
+
+def apply_placement(state: GameState, placement: Placement) -> CascadeResult:
+    """
+    Freeze the faller at a placement, with the same result as its commands.
+
+    Returns:
+        The cascade set off by the freeze and the gravity step after it.
+    """
+    state.has_faller = True
+    state.faller_row = placement.row
+    state.faller_col = placement.col
+    state.faller_vertical = placement.vertical
+    state.faller_color1 = placement.color1
+    state.faller_color2 = placement.color2
+    state.faller_landed = True
+    result = state.freeze_faller()
+    gravity = state.apply_gravity()
+    return CascadeResult(result.cleared + gravity.cleared)
+
+
+def score_state(state: GameState, cleared: int = 0, weights: Optional[Dict[str, float]] = None) -> float:
+    """
+    Score a field at rest; higher is better.
+
+    Args:
+        state: State to score.
+        cleared: Cells cleared on the way to this state.
+        weights: Overrides for WEIGHTS.
+
+    Returns:
+        float: The score, or LOSS if the game is over or the next faller
+        could not appear.
+    """
+    w = WEIGHTS if weights is None else {**WEIGHTS, **weights}
+    if state.game_over:
+        return LOSS
+    board = state.board
+    rows, columns = state.rows, state.columns
+    mid = columns // 2 - 1
+    if not board.is_empty(1, mid) or not board.is_empty(1, mid + 1):
+        return LOSS
+    viruses = state.remaining_viruses()
+    if not viruses:
+        return w['win'] + w['cleared'] * cleared
+    tops = [board.top(col) for col in range(columns)]
+    tallest = rows - min(tops)
+    # Every occupied cell lies at or below its column's top; the rest of the
+    # cells there are holes.
+    holes = rows * columns - sum(tops) - state.occupied_cells()
+    return (w['cleared'] * cleared - w['virus'] * viruses - w['segment'] * state.capsule_segments() -
+            w['height'] * tallest - w['hole'] * holes + w['adjacent'] * board.adjacent_pairs())
+
+
+class LookaheadPlayer:
+    """
+    Chooses placements by searching the placements of the known upcoming fallers.
+
+    Each candidate placement is applied to one scratch copy of the state and
+    its cascade resolved, then rolled back to a checkpoint; at the search
+    horizon the field is scored with score_state. Scores of positions
+    already searched are kept in a transposition table keyed by the field's
+    Zobrist hash and the fallers still to come.
+    Iterative deepening keeps the best move of the deepest finished pass
+    when the node or time budget runs out.
+    """
+
+    def __init__(self, depth: int = 1, max_nodes: Optional[int] = None, time_limit: Optional[float] = None,
+                 weights: Optional[Dict[str, float]] = None, table_size: int = 100000):
+        """
+        Args:
+            depth: Number of fallers to look ahead, counting the current one.
+            max_nodes: Most placements to evaluate per choice.
+            time_limit: Most seconds to spend per choice.
+            weights: Overrides for the score_state weights.
+            table_size: Transposition table entries kept before it is cleared.
+        """
+        self.depth: int = depth
+        self.max_nodes: Optional[int] = max_nodes
+        self.time_limit: Optional[float] = time_limit
+        self.weights: Dict[str, float] = {**WEIGHTS, **(weights or {})}
+        self.table_size: int = table_size
+        self.table: Dict[Tuple[int, Tuple[Tuple[str, str], ...]], float] = {}
+        self.nodes: int = 0
+        self.table_hits: int = 0
+        self._deadline: Optional[float] = None
+
+    def __call__(self, state: GameState, upcoming: Sequence[Tuple[str, str]] = ()) -> Optional[Placement]:
+        return self.choose(state, upcoming)
+
+    def choose(self, state: GameState, upcoming: Sequence[Tuple[str, str]] = ()) -> Optional[Placement]:
+        """
+        Pick a placement for the current faller.
+
+        Args:
+            state: A game state with an active faller; it is not modified.
+            upcoming: Colours of the fallers that will follow, in order.
+
+        Returns:
+            The best placement found, or None if the faller cannot be placed.
+        """
+        self.nodes = 0
+        self.table_hits = 0
+        self._deadline = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        if len(self.table) > self.table_size:
+            self.table.clear()
+        upcoming = tuple(upcoming)
+        best = None
+        for depth in range(1, max(self.depth, 1) + 1):
+            if depth > 1 and len(upcoming) < depth - 1:
+                break
+            found = self._search_root(state, upcoming[:depth - 1])
+            if found is not None and (best is None or not self._out_of_budget()):
+                best = found
+            if self._out_of_budget():
+                break
+        return best
+
+    def _out_of_budget(self) -> bool:
+        """Check whether the node or time budget is spent."""
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            return True
+        return self._deadline is not None and time.perf_counter() >= self._deadline
+
+    def _search_root(self, state: GameState, upcoming: Tuple[Tuple[str, str], ...]) -> Optional[Placement]:
+        """Return the placement with the best value, searching upcoming fallers after it."""
+        best, best_value = None, LOSS
+        scratch = state.clone()
+        # The field is at rest between ticks, so this changes no cells; it
+        # drops the match and gravity work still pending from writes such as
+        # loading a level, which every placement would otherwise redo.
+        scratch.resolve_cascade()
+        checkpoint = scratch.checkpoint()
+        for placement in enumerate_placements(scratch):
+            value = self._value_after(scratch, placement, upcoming)
+            scratch.rollback(checkpoint)
+            if best is None or value > best_value:
+                best, best_value = placement, value
+            if self._out_of_budget():
+                break
+        return best
+
+    def _value_after(self, state: GameState, placement: Placement, upcoming: Tuple[Tuple[str, str], ...]) -> float:
+        """Apply a placement to state and return the value of the position it leaves; the caller rolls it back."""
+        self.nodes += 1
+        result = apply_placement(state, placement)
+        cleared = sum(len(step) for step in result.cleared)
+        if not upcoming or state.game_over or not state.has_viruses():
+            return score_state(state, cleared, self.weights)
+        key = (state.board.zobrist, upcoming)
+        value = self.table.get(key)
+        if value is not None:
+            self.table_hits += 1
+            return value + self.weights['cleared'] * cleared
+        if not state.create_faller(*upcoming[0]):
+            return LOSS
+        checkpoint = state.checkpoint()
+        value = LOSS
+        for next_placement in enumerate_placements(state):
+            value = max(value, self._value_after(state, next_placement, upcoming[1:]))
+            state.rollback(checkpoint)
+            if self._out_of_budget():
+                return value + self.weights['cleared'] * cleared
+        self.table[key] = value
+        return value + self.weights['cleared'] * cleared
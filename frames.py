@@ -0,0 +1,141 @@
+from typing import Deque, List, Tuple
+from collections import deque
+from concurrent.futures import Executor, Future
+import os
+import struct
+import zlib
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    """Return a PNG chunk: length, type, data and CRC."""
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def encode_png(width: int, height: int, rgb: bytes, level: int = 6) -> bytes:
+    """
+    Encode 24-bit RGB pixels as a PNG image.
+
+    Args:
+        width: Image width in pixels.
+        height: Image height in pixels.
+        rgb: Three bytes per pixel, row after row, as pygame.image.tobytes
+            returns them for 'RGB'.
+        level: zlib compression level, from 0 (none) to 9 (smallest).
+    """
+    stride = width * 3
+    # Each scanline starts with its filter type; 0 leaves it unfiltered.
+    raw = b''.join(b'\0' + rgb[y * stride:(y + 1) * stride] for y in range(height))
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)  # 8-bit truecolour
+    return (PNG_SIGNATURE + _png_chunk(b'IHDR', header) + _png_chunk(b'IDAT', zlib.compress(raw, level)) +
+            _png_chunk(b'IEND', b''))
+
+
+def tile_frames(width: int, height: int, frames: List[bytes], columns: int) -> Tuple[int, int, bytes]:
+    """
+    Lay RGB frames out in a sprite sheet, left to right and top to bottom.
+
+    Args:
+        width: Frame width in pixels.
+        height: Frame height in pixels.
+        frames: RGB bytes of each frame.
+        columns: Frames per sheet row; unused slots of the last row are black.
+
+    Returns:
+        The sheet's width, height and RGB bytes.
+    """
+    stride = width * 3
+    blank = bytes(stride)
+    lines = []
+    for start in range(0, len(frames), columns):
+        row = frames[start:start + columns]
+        for y in range(height):
+            line = [frame[y * stride:(y + 1) * stride] for frame in row]
+            lines.append(b''.join(line) + blank * (columns - len(row)))
+    return width * columns, len(lines), b''.join(lines)
+
+
+def _write_png(path: str, width: int, height: int, rgb: bytes, level: int):
+    with open(path, 'wb') as f:
+        f.write(encode_png(width, height, rgb, level))
+
+
+def _write_sheet(path: str, width: int, height: int, frames: List[bytes], columns: int, level: int):
+    _write_png(path, *tile_frames(width, height, frames, columns), level)
+
+
+class FrameWriter:
+    """
+    Writes rendered frames as PNG files, encoding them on a thread pool.
+
+    Frames are handed over as raw RGB bytes, so the renderer goes on drawing
+    while earlier frames are compressed; zlib releases the GIL while it
+    works, so the encoding threads run alongside it. At most max_pending
+    files are queued at a time, after which add waits for the oldest.
+    """
+
+    def __init__(self, pool: Executor, pattern: str, width: int, height: int, sheet_columns: int = 0,
+                 sheet_frames: int = 100, level: int = 6, max_pending: int = 16):
+        """
+        Args:
+            pool: Executor that encodes and writes the files.
+            pattern: Output path with an {index} field, e.g. 'out/{index:05d}.png':
+                the frame number, or the sheet number in sheet mode.
+            width: Frame width in pixels.
+            height: Frame height in pixels.
+            sheet_columns: Tile frames into sprite sheets this many frames
+                wide instead of writing one file per frame (0).
+            sheet_frames: Most frames per sprite sheet.
+            level: zlib compression level.
+            max_pending: Most files queued for encoding at once.
+        """
+        self.pool = pool
+        self.pattern = pattern
+        self.width: int = width
+        self.height: int = height
+        self.sheet_columns: int = sheet_columns
+        self.sheet_frames: int = max(sheet_frames, 1)
+        self.level: int = level
+        self.max_pending: int = max(max_pending, 1)
+        self.frames: int = 0
+        self.files: int = 0
+        self._sheet: List[bytes] = []
+        self._pending: Deque[Future] = deque()
+
+    def add(self, rgb: bytes):
+        """Queue a frame's RGB bytes for writing."""
+        self.frames += 1
+        if not self.sheet_columns:
+            self._submit(_write_png, self.width, self.height, rgb, self.level)
+            return
+        self._sheet.append(rgb)
+        if len(self._sheet) == self.sheet_frames:
+            self._flush_sheet()
+
+    def close(self) -> int:
+        """
+        Write any part-filled sprite sheet and wait for every file.
+
+        Returns:
+            int: The number of files written.
+        """
+        if self._sheet:
+            self._flush_sheet()
+        while self._pending:
+            self._pending.popleft().result()
+        return self.files
+
+    def _flush_sheet(self):
+        """Queue the frames collected so far as one sprite sheet."""
+        frames, self._sheet = self._sheet, []
+        self._submit(_write_sheet, self.width, self.height, frames, min(self.sheet_columns, len(frames)), self.level)
+
+    def _submit(self, write, *args):
+        """Queue a file for writing, waiting for the oldest if too many are queued."""
+        while len(self._pending) >= self.max_pending:
+            self._pending.popleft().result()
+        path = self.pattern.format(index=self.files)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.files += 1
+        self._pending.append(self.pool.submit(write, path, *args))
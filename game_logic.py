@@ -1,11 +1,493 @@
 
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, Iterator, List, NamedTuple, Tuple, Optional, Sequence, Set, Union
+from array import array
+from collections import OrderedDict, deque
 import shlex
+import struct
+import sys
+
+from bitboard import BitBoard
+from zobrist import FALLER_CODE, LANDED_CODE, cell_key, field_hash
+
+# Colour key used when comparing cells for matches: a virus and a capsule
+# segment of the same colour belong to the same run.
+MATCH_KEYS = {'r': 'r', 'R': 'r', 'y': 'y', 'Y': 'y', 'b': 'b', 'B': 'b'}
+
+# MATCH_KEYS indexed by cell byte, with 0 for cells that never match.
+BYTE_KEYS = bytes(ord(MATCH_KEYS.get(chr(code), '\0')) for code in range(256))
+# Maps a cell byte to a bit of its colour (r 1, y 2, b 4), or 0 if it is empty.
+COLOR_BITS = bytes({'r': 1, 'y': 2, 'b': 4}.get(MATCH_KEYS.get(chr(code)), 0) for code in range(256))
+EMPTY = ord(' ')
+CAPSULE_BYTES = frozenset(b'RYB')
+# GridBoard.adjacent_pairs row masks per (rows, columns).
+ACROSS_MASKS: Dict[Tuple[int, int], int] = {}
+
+class CascadeResult(NamedTuple):
+    """Outcome of resolving a cascade: the cells cleared at each chain step."""
+    cleared: List[List[Tuple[int, int]]]
+    
+    @property
+    def chains(self) -> int:
+        """Number of match steps in the cascade."""
+        return len(self.cleared)
+
+
+class SegmentsFrozen(NamedTuple):
+    """Cascade event: a faller was frozen into the field as capsule segments."""
+    cells: List[Tuple[int, int, str]]  # (row, col, colour) of each segment
+
+
+class CellsCleared(NamedTuple):
+    """Cascade event: one match step removed cells from the field."""
+    chain: int  # 1 for the first match step of the cascade, 2 for the next...
+    cells: List[Tuple[int, int]]
+
+
+class PiecesDropped(NamedTuple):
+    """Cascade event: one drop step moved capsule segments down the field."""
+    moves: List[Tuple[int, int, int]]  # (row, col, new row) of each segment
+
+
+# Events reported to the listener installed with enable_cascade_events.
+CascadeEvent = Union[SegmentsFrozen, CellsCleared, PiecesDropped]
+
+
+class GridBoard:
+    """
+    Field storage as a flat bytearray of one-byte cells, row after row.
+    
+    Cells are ' ' (empty), 'r'/'y'/'b' (viruses) or 'R'/'Y'/'B' (capsule
+    segments); cell (row, col) is byte row * columns + col. Every backend
+    offers the same small interface: load, get, is_empty, top, place,
+    find_matches, clear_matches, drop_step, row_text, to_rows, to_bytes,
+    load_bytes and copy, plus a counts dict holding the number of cells of
+    each kind, per-row change stamps (see touch) and the field's Zobrist
+    hash, all kept up to date by every write.
+    """
+    
+    __slots__ = ('rows', 'columns', 'cells', 'counts', 'tops', 'stamp', 'row_stamps', 'zobrist', '_dirty',
+                 '_unsettled', '_falling')
+    
+    def __init__(self, rows: int, columns: int):
+        self.rows: int = rows
+        self.columns: int = columns
+        self.cells: bytearray = bytearray(b' ' * (rows * columns))
+        self.counts: Dict[str, int] = {cell: 0 for cell in ('r', 'y', 'b', 'R', 'Y', 'B')}
+        # Topmost occupied row of each column (rows for an empty column).
+        self.tops: List[int] = [rows] * columns
+        # stamp advances on every write; row_stamps holds the stamp of the
+        # last write to each row, so renderers can redraw only what changed.
+        # An array keeps the stamps inline, so the state does not grow as
+        # they pass the small ints Python shares.
+        self.stamp: int = 0
+        self.row_stamps: array = array('Q', [0] * rows)
+        # XOR of zobrist.cell_key for every occupied cell.
+        self.zobrist: int = 0
+        # Indices of cells written since the last match scan; every run of
+        # four on the field contains at least one of them.
+        self._dirty: Set[int] = set()
+        # Columns that may hold capsule segments with empty space below them.
+        self._unsettled: Set[int] = set()
+        # Falling segments per column as [index, distance] pairs, bottom up.
+        self._falling: Dict[int, List[List[int]]] = {}
+    
+    def load(self, contents: List[str]):
+        """Fill the field from CONTENTS rows."""
+        self._unsettled.update(range(self.columns))
+        self.touch(range(self.rows))
+        index = 0
+        for r in range(self.rows):
+            for c in range(self.columns):
+                cell = contents[r][c]
+                self.cells[index] = ord(cell)
+                if cell != ' ':
+                    self._dirty.add(index)
+                if cell in self.counts:
+                    self.counts[cell] += 1
+                index += 1
+        self._find_tops()
+        self.zobrist = field_hash(self.cells)
+    
+    def _index(self, row: int, col: int) -> int:
+        """Return the index of a cell, rejecting cells off the field."""
+        if not (0 <= row < self.rows and 0 <= col < self.columns):
+            raise IndexError('cell out of range')
+        return row * self.columns + col
+    
+    def get(self, row: int, col: int) -> str:
+        """Return the character stored in a cell."""
+        return chr(self.cells[row * self.columns + col])
+    
+    def is_empty(self, row: int, col: int) -> bool:
+        """Check whether a cell is empty."""
+        return self.cells[self._index(row, col)] == EMPTY
+    
+    def top(self, col: int) -> int:
+        """Return the topmost occupied row of a column, or rows if it is empty."""
+        return self.tops[col]
+    
+    def _find_tops(self):
+        """Recompute the top of every column."""
+        self.tops = [0] * self.columns
+        for col in range(self.columns):
+            self._lower_top(col)
+    
+    def _lower_top(self, col: int):
+        """Move a column's top down past cells that have been emptied."""
+        cells = self.cells
+        columns = self.columns
+        index = self.tops[col] * columns + col
+        while index < len(cells) and cells[index] == EMPTY:
+            index += columns
+        self.tops[col] = index // columns
+    
+    def place(self, row: int, col: int, cell: str):
+        """Write a virus or capsule segment into a cell."""
+        index = self._index(row, col)
+        code = self.cells[index]
+        old = chr(code)
+        if old in self.counts:
+            self.counts[old] -= 1
+        if code != EMPTY:
+            self.zobrist ^= cell_key(index, code)
+        self.counts[cell] += 1
+        self.cells[index] = ord(cell)
+        self.zobrist ^= cell_key(index, self.cells[index])
+        if row < self.tops[col]:
+            self.tops[col] = row
+        self.touch((row,))
+        self._dirty.add(index)
+        # A new segment may have room to fall, and any cell written into a
+        # column with segments still falling (after an unfinished cascade)
+        # changes where they land.
+        if cell in ('R', 'B', 'Y') or col in self._falling:
+            self._unsettled.add(col)
+    
+    def touch(self, rows):
+        """Advance the change stamp and record it against the given rows."""
+        self.stamp += 1
+        for row in rows:
+            self.row_stamps[row] = self.stamp
+    
+    def row_text(self, row: int) -> str:
+        """Return the cell characters of one row as a string."""
+        start = row * self.columns
+        return self.cells[start:start + self.columns].decode('latin-1')
+    
+    def to_rows(self) -> List[List[str]]:
+        """Return a copy of the field as rows of cell characters."""
+        return [list(self.row_text(r)) for r in range(self.rows)]
+    
+    def to_bytes(self) -> bytes:
+        """Return the field as row-major cell characters."""
+        return bytes(self.cells)
+    
+    def load_bytes(self, data: bytes):
+        """Replace the whole field with row-major cell characters from to_bytes."""
+        self.cells[:] = data
+        for cell in self.counts:
+            self.counts[cell] = data.count(ord(cell))
+        self._dirty = {index for index, cell in enumerate(data) if cell != EMPTY}
+        self._unsettled = set(range(self.columns))
+        self._falling.clear()
+        self._find_tops()
+        self.zobrist = field_hash(data)
+        self.touch(range(self.rows))
+    
+    def copy(self) -> 'GridBoard':
+        """Return an independent copy of the board, including pending work."""
+        board = GridBoard.__new__(GridBoard)
+        board.rows = self.rows
+        board.columns = self.columns
+        board.cells = self.cells[:]
+        board.counts = self.counts.copy()
+        board.tops = self.tops[:]
+        board.stamp = self.stamp
+        board.row_stamps = self.row_stamps[:]
+        board.zobrist = self.zobrist
+        board._dirty = self._dirty.copy()
+        board._unsettled = self._unsettled.copy()
+        board._falling = {col: [entry[:] for entry in plan] for col, plan in self._falling.items()}
+        return board
+    
+    def adjacent_pairs(self) -> int:
+        """Count the pairs of touching cells of one colour, side by side or one above the other."""
+        # One byte per cell holding its colour bit; a pair shares a set bit.
+        mask = int.from_bytes(self.cells.translate(COLOR_BITS), 'big')
+        key = (self.rows, self.columns)
+        across = ACROSS_MASKS.get(key)
+        if across is None:
+            # Bytes of every cell but the first in its row, so the last cell
+            # of one row and the first of the next are not paired.
+            row = b'\0' + b'\7' * (self.columns - 1)
+            across = ACROSS_MASKS[key] = int.from_bytes(row * self.rows, 'big')
+        return ((mask & (mask >> 8) & across).bit_count() +
+                (mask & (mask >> 8 * self.columns)).bit_count())
+    
+    def checkpoint(self) -> tuple:
+        """Capture the board, including pending work, for rollback()."""
+        return (bytes(self.cells), self.counts.copy(), self.tops[:], self.zobrist, self._dirty.copy(),
+                self._unsettled.copy(), {col: [entry[:] for entry in plan] for col, plan in self._falling.items()})
+    
+    def rollback(self, checkpoint: tuple):
+        """Return the board to a checkpoint() of it; a checkpoint can be rolled back to any number of times."""
+        cells, counts, tops, self.zobrist, dirty, unsettled, falling = checkpoint
+        self.cells[:] = cells
+        self.counts.update(counts)
+        self.tops[:] = tops
+        self._dirty = dirty.copy()
+        self._unsettled = unsettled.copy()
+        self._falling = {col: [entry[:] for entry in plan] for col, plan in falling.items()}
+        self.touch(range(self.rows))
+    
+    def clear_matches(self) -> List[Tuple[int, int]]:
+        """Remove every cell in a run of four or more and return them sorted."""
+        matches = self.find_matches()
+        columns = self.columns
+        for row, col in matches:
+            index = row * columns + col
+            code = self.cells[index]
+            self.counts[chr(code)] -= 1
+            self.zobrist ^= cell_key(index, code)
+            self.cells[index] = EMPTY
+            self._unsettled.add(col)
+        if matches:
+            for col in {col for _, col in matches}:
+                self._lower_top(col)
+            self.touch({row for row, _ in matches})
+        return sorted(matches)
+    
+    def _plan_column(self, col: int) -> List[List[int]]:
+        """
+        List the capsule segments in a column that still have room to fall.
+        
+        Returns:
+            [index, distance] pairs from the bottom up, where distance is the
+            number of empty cells between the segment and its resting row.
+        """
+        cells = self.cells
+        plan = []
+        gaps = 0
+        for index in range((self.rows - 1) * self.columns + col, -1, -self.columns):
+            cell = cells[index]
+            if cell == EMPTY:
+                gaps += 1
+            elif cell in CAPSULE_BYTES:
+                if gaps:
+                    plan.append([index, gaps])
+            else:
+                gaps = 0
+        return plan
+    
+    def drop_step(self, moves: Optional[List[Tuple[int, int]]] = None) -> bool:
+        """
+        Move every falling segment down one row; return whether any moved.
+        
+        Args:
+            moves: List to append the (row, col) each segment moved from to.
+        """
+        falling = self._falling
+        for col in self._unsettled:
+            plan = self._plan_column(col)
+            if plan:
+                falling[col] = plan
+            else:
+                falling.pop(col, None)
+        self._unsettled.clear()
+        if not falling:
+            return False
+        cells = self.cells
+        columns = self.columns
+        if moves is not None:
+            moves.extend(divmod(entry[0], columns) for plan in falling.values() for entry in plan)
+        self.stamp += 1
+        stamp = self.stamp
+        row_stamps = self.row_stamps
+        dirty = self._dirty
+        zobrist = self.zobrist
+        for col in list(falling):
+            plan = falling[col]
+            for entry in plan:
+                index = entry[0]
+                below = index + columns
+                code = cells[index]
+                cells[below] = code
+                cells[index] = EMPTY
+                zobrist ^= cell_key(index, code) ^ cell_key(below, code)
+                row = index // columns
+                row_stamps[row] = row_stamps[row + 1] = stamp
+                dirty.add(below)
+                entry[0] = below
+                entry[1] -= 1
+            self._lower_top(col)
+            plan = [entry for entry in plan if entry[1]]
+            if plan:
+                falling[col] = plan
+            else:
+                del falling[col]
+        self.zobrist = zobrist
+        if not falling:
+            # An emptied dict keeps its grown table; a settled field holds a new one.
+            self._falling = {}
+        return True
+    
+    def find_matches(self, full: bool = False) -> Set[Tuple[int, int]]:
+        """
+        Find all cells involved in matches of 4 or more.
+        
+        Only the row and column segments running through cells written since
+        the previous scan are examined, since any new run must include one of
+        them.
+        
+        Args:
+            full: Rescan every row and column instead (used to check results).
+        
+        Returns:
+            Set of (row, col) tuples for cells to be removed.
+        """
+        if full:
+            matches = self._find_matches_full()
+        else:
+            matches = self._find_matches_dirty()
+        # Matched cells stay dirty so that a caller that does not clear them
+        # still sees the same runs on the next scan.
+        columns = self.columns
+        self._dirty = {row * columns + col for row, col in matches}
+        return matches
+    
+    def _find_matches_dirty(self) -> Set[Tuple[int, int]]:
+        """Scan the row and column segments through each dirty cell."""
+        cells = self.cells
+        size = len(cells)
+        columns = self.columns
+        matches = set()
+        seen_rows = set()
+        seen_cols = set()
+        for index in self._dirty:
+            key = BYTE_KEYS[cells[index]]
+            if not key:
+                continue
+            row, col = divmod(index, columns)
+            line = index - col
+            start = index
+            if start not in seen_rows:
+                while start > line and BYTE_KEYS[cells[start - 1]] == key:
+                    start -= 1
+                end = index + 1
+                while end < line + columns and BYTE_KEYS[cells[end]] == key:
+                    end += 1
+                seen_rows.add(start)
+                if end - start >= 4:
+                    for i in range(start - line, end - line):
+                        matches.add((row, i))
+            start = index
+            if start not in seen_cols:
+                while start >= columns and BYTE_KEYS[cells[start - columns]] == key:
+                    start -= columns
+                end = index + columns
+                while end < size and BYTE_KEYS[cells[end]] == key:
+                    end += columns
+                seen_cols.add(start)
+                if end - start >= 4 * columns:
+                    for i in range(start // columns, end // columns):
+                        matches.add((i, col))
+        return matches
+    
+    def _find_matches_full(self) -> Set[Tuple[int, int]]:
+        """Scan every row and every column of the field."""
+        matches = set()
+        keys = self.cells.translate(BYTE_KEYS)
+        columns = self.columns
+        
+        # Check horizontal matches
+        for r in range(self.rows):
+            line = keys[r * columns:(r + 1) * columns]
+            count = 1
+            start = 0
+            for c in range(1, columns):
+                if line[c] and line[c] == line[c - 1]:
+                    count += 1
+                else:
+                    if count >= 4:
+                        for i in range(start, c):
+                            matches.add((r, i))
+                    count = 1
+                    start = c
+            if count >= 4:
+                for i in range(start, columns):
+                    matches.add((r, i))
+        
+        # Check vertical matches
+        for c in range(columns):
+            line = keys[c::columns]
+            count = 1
+            start = 0
+            for r in range(1, self.rows):
+                if line[r] and line[r] == line[r - 1]:
+                    count += 1
+                else:
+                    if count >= 4:
+                        for i in range(start, r):
+                            matches.add((i, c))
+                    count = 1
+                    start = r
+            if count >= 4:
+                for i in range(start, self.rows):
+                    matches.add((i, c))
+        
+        return matches
+
+
+# Field storage backends selectable through GameState(backend=...).
+BACKENDS = {'grid': GridBoard, 'bitboard': BitBoard}
+
+# Snapshot header, 11 bytes: rows, columns, flags, faller row, faller column
+# and the two faller colours; one byte per field cell follows.
+SNAPSHOT_HEADER = struct.Struct('<HHBHHcc')
+FALLER_FLAG = 1
+VERTICAL_FLAG = 2
+LANDED_FLAG = 4
+GAME_OVER_FLAG = 8
+
+# Debug mode: when set, GameState.zobrist() and every cascade check the
+# incremental Zobrist hash against a full recompute (see enable_zobrist_checks).
+CHECK_ZOBRIST = False
+
+# Cascade cache consulted by GameState.freeze_faller, or None (see
+# enable_cascade_cache).
+CASCADE_CACHE: Optional['CascadeCache'] = None
+
+# Called as listener(state, event) for every cascade event of every
+# GameState, or None (see enable_cascade_events).
+CASCADE_LISTENER: Optional[Callable[['GameState', CascadeEvent], None]] = None
+
+# Memory budget for one GameState on a 16 x 8 grid field, as measured by
+# GameState.memory_bytes (bench.py checks it). A settled state measures at
+# most 1585 bytes however long it has been played: 785 in the cells, counts,
+# column tops and row stamps, 496 in the match and gravity bookkeeping, 240
+# in the state and board objects and 64 in the hash and stamp counter. The
+# budget leaves 207 bytes for container sizes that vary between Python
+# versions.
+STATE_BYTES = 1792
+
 
 class GameState:
-    """Represents the state of the Dr. Mario game."""
+    """
+    Represents the state of the Dr. Mario game.
+    
+    The faller is held in a handful of scalar slots updated in place:
+    faller_row and faller_col locate its top or left segment, which has
+    colour faller_color1; the other segment, of colour faller_color2, is
+    below it when faller_vertical is set and to its right otherwise. With
+    the grid backend a state on a 16 x 8 field takes under STATE_BYTES
+    bytes (see memory_bytes).
+    """
+    
+    __slots__ = ('rows', 'columns', 'board', 'has_faller', 'faller_row', 'faller_col', 'faller_vertical',
+                 'faller_color1', 'faller_color2', 'faller_landed', 'game_over')
     
-    def __init__(self, rows: int, columns: int, initial_config: str, contents: Optional[List[str]] = None):
+    def __init__(self, rows: int, columns: int, initial_config: str, contents: Optional[List[str]] = None,
+                 backend: str = 'grid'):
         """
         Initialize the game field.
         
@@ -14,18 +496,222 @@ class GameState:
             columns: Number of columns in the field (at least 3).
             initial_config: 'EMPTY' or 'CONTENTS' to specify initial field state.
             contents: List of strings representing initial field contents if initial_config is 'CONTENTS'.
+            backend: Field storage, 'grid' (a bytearray of cell characters) or
+                'bitboard' (one integer mask per colour and kind).
         """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend!r}")
         self.rows: int = rows
         self.columns: int = columns
-        self.field: List[List[str]] = [[' ' for _ in range(columns)] for _ in range(rows)]
-        self.faller: Optional[List[Tuple[int, int, str, bool]]] = None  # (row, col, color, is_left)
+        self.board = BACKENDS[backend](rows, columns)
+        self.has_faller: bool = False
+        self.faller_row: int = 0
+        self.faller_col: int = 0
+        self.faller_vertical: bool = False
+        self.faller_color1: str = ' '
+        self.faller_color2: str = ' '
         self.faller_landed: bool = False
         self.game_over: bool = False
         
         if initial_config == 'CONTENTS' and contents:
-            for r in range(rows):
-                for c in range(columns):
-                    self.field[r][c] = contents[r][c]
+            self.board.load(contents)
+    
+    @property
+    def field(self) -> Tuple[Tuple[str, ...], ...]:
+        """
+        Snapshot of the field as rows of cell characters.
+        
+        The rows are tuples, so writing to a cell of the snapshot fails
+        rather than being lost; assign a whole field to write one.
+        """
+        return tuple(tuple(self.board.row_text(r)) for r in range(self.rows))
+    
+    @field.setter
+    def field(self, rows: Sequence[Sequence[str]]):
+        """Replace every cell of the field from rows of cell characters."""
+        if len(rows) != self.rows or any(len(row) != self.columns for row in rows):
+            raise ValueError(f"Field must be {self.rows} rows of {self.columns} cells")
+        self.board.load_bytes(''.join(''.join(row) for row in rows).encode('latin-1'))
+    
+    @property
+    def faller(self) -> Optional[List[Tuple[int, int, str, bool]]]:
+        """The faller as (row, col, color, is_left) segments, or None."""
+        if not self.has_faller:
+            return None
+        row, col = self.faller_row, self.faller_col
+        row2, col2 = (row + 1, col) if self.faller_vertical else (row, col + 1)
+        return [(row, col, self.faller_color1, True), (row2, col2, self.faller_color2, False)]
+    
+    @faller.setter
+    def faller(self, segments: Optional[List[Tuple[int, int, str, bool]]]):
+        if not segments:
+            self.has_faller = False
+            return
+        (row, col, color1, _), (row2, _, color2, _) = segments
+        self.has_faller = True
+        self.faller_row = row
+        self.faller_col = col
+        self.faller_vertical = row2 != row
+        self.faller_color1 = color1
+        self.faller_color2 = color2
+    
+    def faller_rows(self) -> Tuple[int, ...]:
+        """Return the rows occupied by the faller (empty if there is none)."""
+        if not self.has_faller:
+            return ()
+        if self.faller_vertical:
+            return (self.faller_row, self.faller_row + 1)
+        return (self.faller_row,)
+    
+    def memory_bytes(self) -> int:
+        """Return the approximate memory held by this state and its field, in bytes."""
+        seen = set()
+        
+        def size(obj) -> int:
+            # Small ints, single characters and None are shared, not owned.
+            if id(obj) in seen or obj is None or isinstance(obj, (bool, str)) or (type(obj) is int and -5 <= obj <= 256):
+                return 0
+            seen.add(id(obj))
+            total = sys.getsizeof(obj)
+            if isinstance(obj, dict):
+                total += sum(size(key) + size(value) for key, value in obj.items())
+            elif isinstance(obj, (list, tuple, set, frozenset)):
+                total += sum(size(item) for item in obj)
+            for cls in type(obj).__mro__:
+                for name in getattr(cls, '__slots__', ()):
+                    if hasattr(obj, name):
+                        total += size(getattr(obj, name))
+            return total
+        
+        return size(self)
+    
+    def field_stamp(self) -> int:
+        """Return a counter that advances whenever a field cell changes."""
+        return self.board.stamp
+    
+    def changed_rows(self, since: int) -> List[int]:
+        """Return the rows whose cells changed after the given field stamp."""
+        return [r for r, stamp in enumerate(self.board.row_stamps) if stamp > since]
+    
+    def zobrist(self) -> int:
+        """
+        Return a 64-bit Zobrist hash of the field and the faller.
+        
+        The field part is kept up to date by every board write, so reading it
+        costs the same on any field size; the faller adds the keys of its two
+        segments and its landed flag. Positions that differ only in
+        game_over hash alike.
+        
+        Raises:
+            AssertionError: In debug mode (CHECK_ZOBRIST), if the incremental
+                hash differs from full_zobrist().
+        """
+        if CHECK_ZOBRIST:
+            self._check_zobrist()
+        return self.board.zobrist ^ self._faller_zobrist()
+    
+    def full_zobrist(self) -> int:
+        """Return the same hash as zobrist(), recomputed from every field cell."""
+        return field_hash(self.board.to_bytes()) ^ self._faller_zobrist()
+    
+    def _faller_zobrist(self) -> int:
+        """Return the hash keys of the faller (0 without one)."""
+        if not self.has_faller:
+            return 0
+        index = self.faller_row * self.columns + self.faller_col
+        index2 = index + (self.columns if self.faller_vertical else 1)
+        h = (cell_key(index, ord(self.faller_color1) | FALLER_CODE) ^
+             cell_key(index2, ord(self.faller_color2) | FALLER_CODE))
+        if self.faller_landed:
+            h ^= cell_key(index, LANDED_CODE)
+        return h
+    
+    def _check_zobrist(self):
+        """Compare the incremental field hash with a full recompute."""
+        expected = field_hash(self.board.to_bytes())
+        if self.board.zobrist != expected:
+            raise AssertionError(f'Zobrist hash drifted: {self.board.zobrist:#018x} != {expected:#018x}')
+    
+    def snapshot(self) -> bytes:
+        """
+        Capture the field, faller and flags as an immutable byte string.
+        
+        Returns:
+            bytes: A blob that restore() or from_snapshot() turns back into
+            this position.
+        """
+        flags = ((FALLER_FLAG if self.has_faller else 0) | (VERTICAL_FLAG if self.faller_vertical else 0) |
+                 (LANDED_FLAG if self.faller_landed else 0) | (GAME_OVER_FLAG if self.game_over else 0))
+        header = SNAPSHOT_HEADER.pack(self.rows, self.columns, flags, self.faller_row, self.faller_col,
+                                      self.faller_color1.encode('latin-1'), self.faller_color2.encode('latin-1'))
+        return header + self.board.to_bytes()
+    
+    def restore(self, snapshot: bytes):
+        """
+        Return to a position captured by snapshot().
+        
+        Args:
+            snapshot: Blob from a state with the same field size.
+        
+        Raises:
+            ValueError: If the blob does not fit this field.
+        """
+        rows, columns, flags, row, col, color1, color2 = SNAPSHOT_HEADER.unpack_from(snapshot)
+        if (rows, columns) != (self.rows, self.columns) or len(snapshot) != SNAPSHOT_HEADER.size + rows * columns:
+            raise ValueError('Snapshot does not match the field size')
+        self.board.load_bytes(snapshot[SNAPSHOT_HEADER.size:])
+        self.has_faller = bool(flags & FALLER_FLAG)
+        self.faller_vertical = bool(flags & VERTICAL_FLAG)
+        self.faller_landed = bool(flags & LANDED_FLAG)
+        self.game_over = bool(flags & GAME_OVER_FLAG)
+        self.faller_row = row
+        self.faller_col = col
+        self.faller_color1 = color1.decode('latin-1')
+        self.faller_color2 = color2.decode('latin-1')
+    
+    @classmethod
+    def from_snapshot(cls, snapshot: bytes, backend: str = 'grid') -> 'GameState':
+        """Create a new state from a snapshot() blob."""
+        rows, columns = SNAPSHOT_HEADER.unpack_from(snapshot)[:2]
+        state = cls(rows, columns, 'EMPTY', backend=backend)
+        state.restore(snapshot)
+        return state
+    
+    def clone(self) -> 'GameState':
+        """Return an independent copy of this state, much cheaper than copy.deepcopy."""
+        clone = GameState.__new__(GameState)
+        clone.rows = self.rows
+        clone.columns = self.columns
+        clone.board = self.board.copy()
+        clone.has_faller = self.has_faller
+        clone.faller_row = self.faller_row
+        clone.faller_col = self.faller_col
+        clone.faller_vertical = self.faller_vertical
+        clone.faller_color1 = self.faller_color1
+        clone.faller_color2 = self.faller_color2
+        clone.faller_landed = self.faller_landed
+        clone.game_over = self.game_over
+        return clone
+    
+    def checkpoint(self) -> tuple:
+        """
+        Capture the position for rollback(), much more cheaply than snapshot().
+        
+        Unlike a snapshot, the token is only good for this state, so a search
+        can apply moves to one state and roll each back instead of cloning.
+        """
+        return (self.board.checkpoint(), self.has_faller, self.faller_row, self.faller_col, self.faller_vertical,
+                self.faller_color1, self.faller_color2, self.faller_landed, self.game_over)
+    
+    def rollback(self, checkpoint: tuple):
+        """Return to a position captured by checkpoint(), which stays usable."""
+        (board, self.has_faller, self.faller_row, self.faller_col, self.faller_vertical, self.faller_color1,
+         self.faller_color2, self.faller_landed, self.game_over) = checkpoint
+        self.board.rollback(board)
+    
+    def get_row_text(self, row: int) -> str:
+        """Return the field characters of one row, ignoring the faller."""
+        return self.board.row_text(row)
     
     def get_rows(self) -> int:
         """Return the number of rows in the field."""
@@ -37,7 +723,26 @@ class GameState:
     
     def has_viruses(self) -> bool:
         """Check if the field contains any viruses."""
-        return any(cell in ('r', 'y', 'b') for row in self.field for cell in row)
+        return self.remaining_viruses() > 0
+    
+    def virus_counts(self) -> Dict[str, int]:
+        """Return the number of viruses remaining of each colour (r, y, b)."""
+        counts = self.board.counts
+        return {color: counts[color] for color in ('r', 'y', 'b')}
+    
+    def remaining_viruses(self) -> int:
+        """Return the total number of viruses on the field."""
+        counts = self.board.counts
+        return counts['r'] + counts['y'] + counts['b']
+    
+    def capsule_segments(self) -> int:
+        """Return the number of frozen capsule segments on the field."""
+        counts = self.board.counts
+        return counts['R'] + counts['Y'] + counts['B']
+    
+    def occupied_cells(self) -> int:
+        """Return the number of field cells holding a virus or capsule segment."""
+        return sum(self.board.counts.values())
     
     def create_faller(self, color1: str, color2: str) -> bool:
         """
@@ -50,51 +755,45 @@ class GameState:
         Returns:
             bool: True if faller was created, False if it cannot be created.
         """
-        if self.faller:
+        if self.has_faller:
             return False
         mid = (self.columns // 2) - 1
-        if self.field[1][mid] != ' ' or self.field[1][mid + 1] != ' ':
+        if not self.board.is_empty(1, mid) or not self.board.is_empty(1, mid + 1):
             self.game_over = True
             return False
-        self.faller = [(1, mid, color1, True), (1, mid + 1, color2, False)]
+        self.has_faller = True
+        self.faller_row = 1
+        self.faller_col = mid
+        self.faller_vertical = False
+        self.faller_color1 = color1
+        self.faller_color2 = color2
         self.faller_landed = False
         return True
     
     def move_faller_left(self) -> bool:
         """Move the faller left if possible."""
-        if not self.faller:
+        if not self.has_faller:
             return False
-        row1, col1, color1, is_left1 = self.faller[0]
-        row2, col2, color2, is_left2 = self.faller[1]
-        
-        if row1 == row2:  # Horizontal
-            if col1 == 0 or self.field[row1][col1 - 1] != ' ':
-                return False
-            self.faller = [(row1, col1 - 1, color1, True), (row2, col2 - 1, color2, False)]
-        else:  # Vertical
-            if col1 == 0 or self.field[row1][col1 - 1] != ' ' or self.field[row2][col2 - 1] != ' ':
-                return False
-            self.faller = [(row1, col1 - 1, color1, True), (row2, col2 - 1, color2, False)]
-        
+        row, col = self.faller_row, self.faller_col
+        if col == 0 or not self.board.is_empty(row, col - 1):
+            return False
+        if self.faller_vertical and not self.board.is_empty(row + 1, col - 1):
+            return False
+        self.faller_col = col - 1
         self.faller_landed = self.is_faller_landed()
         return True
     
     def move_faller_right(self) -> bool:
         """Move the faller right if possible."""
-        if not self.faller:
+        if not self.has_faller:
             return False
-        row1, col1, color1, is_left1 = self.faller[0]
-        row2, col2, color2, is_left2 = self.faller[1]
-        
-        if row1 == row2:  # Horizontal
-            if col2 == self.columns - 1 or self.field[row2][col2 + 1] != ' ':
-                return False
-            self.faller = [(row1, col1 + 1, color1, True), (row2, col2 + 1, color2, False)]
-        else:  # Vertical
-            if col1 == self.columns - 1 or self.field[row1][col1 + 1] != ' ' or self.field[row2][col2 + 1] != ' ':
-                return False
-            self.faller = [(row1, col1 + 1, color1, True), (row2, col2 + 1, color2, False)]
-        
+        row = self.faller_row
+        edge = self.faller_col if self.faller_vertical else self.faller_col + 1  # Rightmost column
+        if edge == self.columns - 1 or not self.board.is_empty(row, edge + 1):
+            return False
+        if self.faller_vertical and not self.board.is_empty(row + 1, edge + 1):
+            return False
+        self.faller_col += 1
         self.faller_landed = self.is_faller_landed()
         return True
     
@@ -108,79 +807,124 @@ class GameState:
         Returns:
             bool: True if rotation was successful, False otherwise.
         """
-        if not self.faller:
+        if not self.has_faller:
             return False
-        row1, col1, color1, is_left1 = self.faller[0]
-        row2, col2, color2, is_left2 = self.faller[1]
-        
-        if row1 == row2:  # Horizontal to vertical
-            new_row = row1
-            new_col = col1
-            if new_row + 1 >= self.rows or self.field[new_row + 1][new_col] != ' ':
-                if new_col > 0 and self.field[new_row][new_col - 1] == ' ' and (new_row + 1 >= self.rows or self.field[new_row + 1][new_col - 1] == ' '):
-                    new_col -= 1  # Wall kick
+        row, col = self.faller_row, self.faller_col
+        color1, color2 = self.faller_color1, self.faller_color2
+        
+        if not self.faller_vertical:  # Horizontal to vertical
+            if row + 1 >= self.rows or not self.board.is_empty(row + 1, col):
+                if col > 0 and self.board.is_empty(row, col - 1) and (row + 1 >= self.rows or self.board.is_empty(row + 1, col - 1)):
+                    col -= 1  # Wall kick
                 else:
                     return False
-            self.faller = [(new_row, new_col, color1 if clockwise else color2, True),
-                           (new_row + 1, new_col, color2 if clockwise else color1, False)]
+            if not clockwise:
+                color1, color2 = color2, color1
         else:  # Vertical to horizontal
-            new_row = row1
-            new_col = col1
-            if new_col + 1 >= self.columns or self.field[new_row][new_col + 1] != ' ':
-                if new_col > 0 and self.field[new_row][new_col - 1] == ' ':
-                    new_col -= 1  # Wall kick
+            if col + 1 >= self.columns or not self.board.is_empty(row, col + 1):
+                if col > 0 and self.board.is_empty(row, col - 1):
+                    col -= 1  # Wall kick
                 else:
                     return False
-            self.faller = [(new_row, new_col, color2 if clockwise else color1, True),
-                           (new_row, new_col + 1, color1 if clockwise else color2, False)]
-        
+            if clockwise:
+                color1, color2 = color2, color1
+        self.faller_col = col
+        self.faller_vertical = not self.faller_vertical
+        self.faller_color1, self.faller_color2 = color1, color2
         self.faller_landed = self.is_faller_landed()
         return True
     
+    def drop_distance(self) -> int:
+        """
+        Return how many rows the faller can still fall.
+        
+        Uses the board's column tops, so a faller above the stack needs no
+        cell checks; only a faller tucked under an overhang walks down its
+        columns cell by cell.
+        """
+        bottom = self.faller_row + 1 if self.faller_vertical else self.faller_row
+        if bottom >= self.rows:
+            raise IndexError('faller below the floor')  # As the cell checks this replaced did
+        distance = self.rows - 1 - bottom
+        for col in ((self.faller_col,) if self.faller_vertical else (self.faller_col, self.faller_col + 1)):
+            top = self.board.top(col)
+            if top <= bottom:
+                top = bottom + 1
+                while top < self.rows and self.board.is_empty(top, col):
+                    top += 1
+            distance = min(distance, top - bottom - 1)
+        return distance
+    
     def is_faller_landed(self) -> bool:
         """Check if the faller has landed."""
-        if not self.faller:
+        if not self.has_faller:
             return False
-        row1, col1, _, _ = self.faller[0]
-        row2, col2, _, _ = self.faller[1]
-        
-        if row1 == row2:  # Horizontal
-            return (row1 == self.rows - 1 or
-                    self.field[row1 + 1][col1] != ' ' or
-                    self.field[row1 + 1][col2] != ' ')
-        else:  # Vertical
-            return row2 == self.rows - 1 or self.field[row2 + 1][col2] != ' '
+        return self.drop_distance() == 0
     
     def faller_fall(self) -> bool:
         """Make the faller fall one cell if possible."""
-        if not self.faller or self.faller_landed:
+        if not self.has_faller or self.faller_landed:
+            return False
+        if self.is_faller_landed():
+            self.faller_landed = True
             return False
-        row1, col1, color1, is_left1 = self.faller[0]
-        row2, col2, color2, is_left2 = self.faller[1]
-        
-        if row1 == row2:  # Horizontal
-            if row1 == self.rows - 1 or self.field[row1 + 1][col1] != ' ' or self.field[row1 + 1][col2] != ' ':
-                self.faller_landed = True
-                return False
-            self.faller = [(row1 + 1, col1, color1, True), (row2 + 1, col2, color2, False)]
-        else:  # Vertical
-            if row2 == self.rows - 1 or self.field[row2 + 1][col2] != ' ':
-                self.faller_landed = True
-                return False
-            self.faller = [(row1 + 1, col1, color1, True), (row2 + 1, col2, color2, False)]
+        self.faller_row += 1
         return True
     
-    def freeze_faller(self):
-        """Freeze the faller, converting it to regular capsule segments."""
-        if not self.faller or not self.faller_landed:
-            return
-        row1, col1, color1, _ = self.faller[0]
-        row2, col2, color2, _ = self.faller[1]
-        self.field[row1][col1] = color1
-        self.field[row2][col2] = color2
-        self.faller = None
+    def hard_drop(self) -> bool:
+        """
+        Drop the faller straight to its resting spot and freeze it there.
+        
+        Has the same result as repeating empty ticks until the faller freezes.
+        
+        Returns:
+            bool: True if a faller was dropped.
+        """
+        if not self.has_faller:
+            return False
+        # One ordinary tick first settles anything still pending on the field,
+        # after which further ticks only move the faller.
+        self.tick()
+        if self.has_faller:
+            self.faller_row += self.drop_distance()
+            self.faller_landed = True
+            self.freeze_faller()
+            self.apply_gravity()
+        return True
+    
+    def tick(self):
+        """Advance one time step: the faller falls or freezes, then gravity applies."""
+        if self.has_faller:
+            if self.faller_landed:
+                self.freeze_faller()
+            else:
+                self.faller_fall()
+        self.apply_gravity()
+    
+    def freeze_faller(self) -> Optional[CascadeResult]:
+        """
+        Freeze the faller, converting it to regular capsule segments.
+        
+        Returns:
+            The cascade set off by the freeze, or None if no landed faller.
+        """
+        if not self.has_faller or not self.faller_landed:
+            return None
+        cache = CASCADE_CACHE
+        listener = CASCADE_LISTENER
+        # A cached cascade skips the steps that would report events.
+        cached = cache is not None and listener is None and cache.usable(self.board)
+        row, col = self.faller_row, self.faller_col
+        row2, col2 = (row + 1, col) if self.faller_vertical else (row, col + 1)
+        self.board.place(row, col, self.faller_color1)
+        self.board.place(row2, col2, self.faller_color2)
+        self.has_faller = False
         self.faller_landed = False
-        self.handle_matching()
+        if listener is not None:
+            listener(self, SegmentsFrozen([(row, col, self.faller_color1), (row2, col2, self.faller_color2)]))
+        if cached:
+            return cache.resolve(self, col, col if self.faller_vertical else col + 1)
+        return self.handle_matching()
     
     def create_virus(self, row: int, col: int, color: str) -> bool:
         """
@@ -194,78 +938,102 @@ class GameState:
         Returns:
             bool: True if virus was created, False if cell is occupied.
         """
-        if self.field[row][col] != ' ':
+        if not self.board.is_empty(row, col):
             return False
-        self.field[row][col] = color
+        self.board.place(row, col, color)
         return True
     
-    def handle_matching(self):
+    def handle_matching(self) -> CascadeResult:
         """Detect and remove matches, then apply gravity."""
+        return self.resolve_cascade(drop_first=False)
+    
+    def resolve_cascade(self, drop_first: bool = True) -> CascadeResult:
+        """
+        Alternate drop and match steps until the field is stable.
+        
+        Each drop step moves every capsule segment that has room below it down
+        one row, as a gravity sweep always has, so a segment passing a run of
+        three mid-fall still completes it. The steps are reported to the
+        listener installed with enable_cascade_events, if any.
+        
+        Args:
+            drop_first: Start with a drop step (gravity) rather than a match
+                step (after a freeze).
+        
+        Returns:
+            CascadeResult with the cells cleared at each chain step.
+        """
+        cleared: List[List[Tuple[int, int]]] = []
+        listener = CASCADE_LISTENER
+        if listener is not None:
+            for event in self.cascade_events(drop_first, cleared):
+                listener(self, event)
+        elif drop_first or self._clear_matches(cleared):
+            while True:
+                moved = self.board.drop_step()
+                if not self._clear_matches(cleared) and not moved:
+                    break
+        if CHECK_ZOBRIST:
+            self._check_zobrist()
+        return CascadeResult(cleared)
+    
+    def cascade_events(self, drop_first: bool = True,
+                       cleared: Optional[List[List[Tuple[int, int]]]] = None) -> Iterator[CascadeEvent]:
+        """
+        Resolve a cascade one step at a time, yielding an event per step.
+        
+        Takes the same steps as resolve_cascade, but only as far as the
+        events have been consumed, so a caller can show each step before
+        taking the next. Drop steps that move nothing and match steps that
+        clear nothing report no event.
+        
+        Args:
+            drop_first: See resolve_cascade.
+            cleared: List to append the cells cleared at each chain step to.
+        
+        Yields:
+            PiecesDropped and CellsCleared events, in order.
+        """
+        if cleared is None:
+            cleared = []
+        board = self.board
+        if not drop_first:
+            if not self._clear_matches(cleared):
+                return
+            yield CellsCleared(1, cleared[-1])
         while True:
-            matches = self.find_matches()
-            if not matches:
+            moved: List[Tuple[int, int]] = []
+            if board.drop_step(moved):
+                yield PiecesDropped([(row, col, row + 1) for row, col in moved])
+            if self._clear_matches(cleared):
+                yield CellsCleared(len(cleared), cleared[-1])
+            elif not moved:
                 break
-            for row, col in matches:
-                self.field[row][col] = ' '
-            self.apply_gravity()
     
-    def find_matches(self) -> List[Tuple[int, int]]:
+    def _clear_matches(self, cleared: List[List[Tuple[int, int]]]) -> bool:
+        """Remove the current matches, recording them in cleared."""
+        matches = self.board.clear_matches()
+        if not matches:
+            return False
+        cleared.append(matches)
+        return True
+    
+    def find_matches(self, full: bool = False) -> List[Tuple[int, int]]:
         """
         Find all cells involved in matches of 4 or more.
         
+        Args:
+            full: Rescan every row and column rather than only what changed
+                since the previous scan (used to check results).
+        
         Returns:
             List of (row, col) tuples for cells to be removed.
         """
-        matches = set()
-        
-        # Check horizontal matches
-        for r in range(self.rows):
-            count = 1
-            start = 0
-            for c in range(1, self.columns):
-                if self.field[r][c].lower() == self.field[r][c-1].lower() and self.field[r][c] != ' ':
-                    count += 1
-                else:
-                    if count >= 4:
-                        for i in range(start, c):
-                            matches.add((r, i))
-                    count = 1
-                    start = c
-            if count >= 4:
-                for i in range(start, self.columns):
-                    matches.add((r, i))
-        
-        # Check vertical matches
-        for c in range(self.columns):
-            count = 1
-            start = 0
-            for r in range(1, self.rows):
-                if self.field[r][c].lower() == self.field[r-1][c].lower() and self.field[r][c] != ' ':
-                    count += 1
-                else:
-                    if count >= 4:
-                        for i in range(start, r):
-                            matches.add((i, c))
-                    count = 1
-                    start = r
-            if count >= 4:
-                for i in range(start, self.rows):
-                    matches.add((i, c))
-        
-        return list(matches)
+        return list(self.board.find_matches(full))
     
-    def apply_gravity(self):
+    def apply_gravity(self) -> CascadeResult:
         """Apply gravity to all capsules, moving them down as far as possible."""
-        moved = True
-        while moved:
-            moved = False
-            for r in range(self.rows - 2, -1, -1):
-                for c in range(self.columns):
-                    if self.field[r][c] in ('R', 'B', 'Y') and self.field[r + 1][c] == ' ':
-                        self.field[r + 1][c] = self.field[r][c]
-                        self.field[r][c] = ' '
-                        moved = True
-            self.handle_matching()
+        return self.resolve_cascade()
     
     def get_cell_display(self, row: int, col: int) -> str:
         """
@@ -278,19 +1046,20 @@ class GameState:
         Returns:
             str: 3-character string representing the cell.
         """
-        if self.faller:
-            for r, c, color, is_left in self.faller:
-                if r == row and c == col:
-                    if self.faller_landed:
-                        if r == self.faller[0][0] == self.faller[1][0]:  # Horizontal
-                            return f"|{color}-" if is_left else f"-{color}|"
-                        return f"|{color}|"
-                    else:
-                        if r == self.faller[0][0] == self.faller[1][0]:  # Horizontal
-                            return f"[{color}-" if is_left else f"-{color}]"
-                        return f"[{color}]"
-        
-        cell = self.field[row][col]
+        if self.has_faller:
+            top, left = self.faller_row, self.faller_col
+            opening, closing = ('|', '|') if self.faller_landed else ('[', ']')
+            if self.faller_vertical:
+                if col == left and top <= row <= top + 1:
+                    color = self.faller_color1 if row == top else self.faller_color2
+                    return f"{opening}{color}{closing}"
+            elif row == top:
+                if col == left:
+                    return f"{opening}{self.faller_color1}-"
+                if col == left + 1:
+                    return f"-{self.faller_color2}{closing}"
+        
+        cell = self.board.get(row, col)
         if cell == ' ':
             return '   '
         if cell in ('r', 'y', 'b'):
@@ -298,3 +1067,255 @@ class GameState:
         if cell in ('R', 'B', 'Y'):
             return f' {cell} '
         return '   '
+
+
+def enable_zobrist_checks(enabled: bool = True):
+    """Switch the debug check of incremental Zobrist hashes on or off."""
+    global CHECK_ZOBRIST
+    CHECK_ZOBRIST = enabled
+
+
+class CascadeCache:
+    """
+    LRU cache of the cascades set off by freezing a faller on a grid field.
+    
+    An entry is keyed by the contents, column by column, of a window of
+    columns around the frozen faller, from the top of the window's highest
+    stack down, taken right after the freeze. It holds the cells the cascade
+    changed and the cells cleared at each chain step, relative to the
+    window. Only cascades that change no column within three columns of an
+    open window edge are stored: a run reaching a cell outside the window
+    would then run through three window cells next to the edge, which would
+    have matched too, so the window decides the outcome and an entry applies
+    wherever the same window contents turn up.
+    
+    The cache is consulted only for freezes that complete a match, on a
+    field that was at rest before the freeze (no cells waiting for a match
+    scan and no segments still to fall), which rules out runs other than
+    those through the new segments.
+    """
+    
+    def __init__(self, max_bytes: int = 16 << 20, reach: int = 3):
+        """
+        Args:
+            max_bytes: Approximate memory the entries may take before the
+                least recently used are evicted.
+            reach: Columns on each side of the faller a stored cascade may
+                change.
+        """
+        self.max_bytes: int = max_bytes
+        self.reach: int = reach
+        self.bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        # Misses whose cascade changed columns beyond the reach.
+        self.uncached: int = 0
+        self.evictions: int = 0
+        self._entries: 'OrderedDict[tuple, tuple]' = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def clear(self):
+        """Drop every entry; the counters are kept."""
+        self._entries.clear()
+        self.bytes = 0
+    
+    @staticmethod
+    def usable(board) -> bool:
+        """Check whether a field is at rest, so that a freeze on it can use the cache."""
+        return type(board) is GridBoard and not board._dirty and not board._unsettled and not board._falling
+    
+    def resolve(self, state: GameState, first: int, last: int) -> CascadeResult:
+        """
+        Resolve the cascade after a freeze, from the cache when possible.
+        
+        Args:
+            state: State whose faller was just frozen into the field.
+            first: Leftmost column of the frozen faller.
+            last: Rightmost column of the frozen faller.
+        
+        Returns:
+            The same CascadeResult as state.handle_matching().
+        """
+        board = state.board
+        if not board.find_matches():
+            return state.handle_matching()
+        columns = board.columns
+        lo = max(first - self.reach - 3, 0)
+        hi = min(last + self.reach + 3, columns - 1)
+        top = min(board.tops[lo:hi + 1])
+        cells = board.cells
+        start = top * columns
+        window = b''.join(cells[start + col::columns] for col in range(lo, hi + 1))
+        key = (hi - lo + 1, lo == 0, hi == columns - 1, window)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._apply(board, lo, top, entry)
+        self.misses += 1
+        result = state.handle_matching()
+        inner_lo = lo if lo == 0 else lo + 3
+        inner_hi = hi if hi == columns - 1 else hi - 3
+        changed = {first, last}
+        for step in result.cleared:
+            for _, col in step:
+                if not inner_lo <= col <= inner_hi:
+                    self.uncached += 1
+                    return result
+                changed.add(col)
+        self._store(key, self._entry(board, lo, top, window, changed, result))
+        return result
+    
+    @staticmethod
+    def _entry(board: GridBoard, lo: int, top: int, before: bytes, changed: Set[int],
+               result: CascadeResult) -> tuple:
+        """Build an entry: (row, column, old, new) changes and cleared cells, relative to the window."""
+        columns = board.columns
+        height = board.rows - top
+        changes = []
+        for col in sorted(changed):
+            start = (col - lo) * height
+            old = before[start:start + height]
+            new = board.cells[top * columns + col::columns]
+            if old != new:
+                changes.extend((row, col - lo, a, b) for row, (a, b) in enumerate(zip(old, new)) if a != b)
+        cleared = tuple(tuple((row - top, col - lo) for row, col in step) for step in result.cleared)
+        return tuple(changes), cleared
+    
+    def _store(self, key: tuple, entry: tuple):
+        """Add an entry, evicting the least recently used ones over the memory cap."""
+        changes, cleared = entry
+        size = (sys.getsizeof(key[3]) + sys.getsizeof(key) + sys.getsizeof(changes) + 72 * len(changes) +
+                sys.getsizeof(cleared) + sum(sys.getsizeof(step) + 64 * len(step) for step in cleared) + 150)
+        self._entries[key] = entry + (size,)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self._entries:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+    
+    @staticmethod
+    def _apply(board: GridBoard, lo: int, top: int, entry: tuple) -> CascadeResult:
+        """Write a cached cascade's changes into the field and return its result."""
+        changes, cleared, _ = entry
+        cells = board.cells
+        columns = board.columns
+        counts = board.counts
+        zobrist = board.zobrist
+        rows = set()
+        cols = set()
+        for row, wcol, old, new in changes:
+            row += top
+            index = row * columns + lo + wcol
+            if old != EMPTY:
+                counts[chr(old)] -= 1
+                zobrist ^= cell_key(index, old)
+            if new != EMPTY:
+                counts[chr(new)] += 1
+                zobrist ^= cell_key(index, new)
+            cells[index] = new
+            rows.add(row)
+            cols.add(lo + wcol)
+        board.zobrist = zobrist
+        # The resolver leaves the field at rest after a cascade.
+        board._dirty.clear()
+        board._unsettled.clear()
+        for col in cols:
+            board._lower_top(col)
+        board.touch(rows)
+        if CHECK_ZOBRIST:
+            expected = field_hash(cells)
+            if zobrist != expected:
+                raise AssertionError(f'Zobrist hash drifted: {zobrist:#018x} != {expected:#018x}')
+        return CascadeResult([[(row + top, lo + wcol) for row, wcol in step] for step in cleared])
+
+
+def enable_cascade_cache(max_bytes: Optional[int] = 16 << 20, reach: int = 3) -> Optional[CascadeCache]:
+    """
+    Install a new cascade cache for every GameState, or remove it.
+    
+    Args:
+        max_bytes: Memory cap for the cache, or None to stop caching.
+        reach: See CascadeCache.
+    
+    Returns:
+        The installed cache, whose hits and misses count its use.
+    """
+    global CASCADE_CACHE
+    CASCADE_CACHE = None if max_bytes is None else CascadeCache(max_bytes, reach)
+    return CASCADE_CACHE
+
+
+def enable_cascade_events(listener: Optional[Callable[[GameState, CascadeEvent], None]]):
+    """
+    Report the cascade events of every GameState to a listener, or stop.
+    
+    With no listener, which is the default, no events are built and the
+    cascade machinery runs exactly as it would without this feature. While
+    a listener is installed the cascade cache is bypassed, since a cached
+    cascade has no steps to report.
+    
+    Args:
+        listener: Called as listener(state, event) for each SegmentsFrozen,
+            CellsCleared and PiecesDropped event, or None.
+    """
+    global CASCADE_LISTENER
+    CASCADE_LISTENER = listener
+
+
+class UndoStack:
+    """
+    Bounded history of GameState snapshots; the oldest are dropped when full.
+    
+    Undo keeps the position it leaves so redo can return to it, until the
+    next push starts a new line of play.
+    """
+    
+    def __init__(self, capacity: int = 100):
+        """
+        Args:
+            capacity: Most snapshots kept, for undo and for redo.
+        """
+        self._snapshots = deque(maxlen=capacity)
+        self._undone = deque(maxlen=capacity)
+    
+    def __len__(self) -> int:
+        return len(self._snapshots)
+    
+    def push(self, state: GameState):
+        """Record the current position of a state, forgetting any undone positions."""
+        self._snapshots.append(state.snapshot())
+        self._undone.clear()
+    
+    def undo(self, state: GameState) -> bool:
+        """
+        Return a state to the most recently pushed position.
+        
+        Returns:
+            bool: True if a position was restored, False if the stack was empty.
+        """
+        if not self._snapshots:
+            return False
+        self._undone.append(state.snapshot())
+        state.restore(self._snapshots.pop())
+        return True
+    
+    def redo(self, state: GameState) -> bool:
+        """
+        Return a state to the position the last undo left.
+        
+        Returns:
+            bool: True if a position was restored, False if there was nothing to redo.
+        """
+        if not self._undone:
+            return False
+        self._snapshots.append(state.snapshot())
+        state.restore(self._undone.pop())
+        return True
+    
+    def clear(self):
+        """Forget every recorded position."""
+        self._snapshots.clear()
+        self._undone.clear()
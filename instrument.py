@@ -0,0 +1,151 @@
+from collections import Counter
+from typing import Callable, Dict, Optional, Tuple
+import functools
+import time
+
+from bitboard import BitBoard
+from game_logic import GameState, GridBoard
+
+# Internal steps timed on every board backend: a match scan, a match pass
+# of a cascade and a gravity sweep.
+BOARD_STEPS = ('find_matches', 'clear_matches', 'drop_step')
+# GameState methods that return a cascade; the outermost call of a nested
+# chain (tick -> freeze_faller -> handle_matching -> resolve_cascade) adds
+# its result to the histograms.
+CASCADE_METHODS = ('freeze_faller', 'apply_gravity', 'handle_matching', 'resolve_cascade')
+
+
+class GameStats:
+    """
+    Call counts, timings and cascade histograms collected by enable_stats.
+
+    Times are inclusive: a method's time includes the methods it calls.
+    """
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.seconds: Dict[str, float] = Counter()
+        # Cascades that cleared something, by number of chain steps and by
+        # number of cells cleared.
+        self.chains: Counter = Counter()
+        self.cleared: Counter = Counter()
+        self._depth: int = 0
+
+    def reset(self):
+        """Forget everything collected so far."""
+        self.calls.clear()
+        self.seconds.clear()
+        self.chains.clear()
+        self.cleared.clear()
+
+    def record_cascade(self, result):
+        """Add a CascadeResult to the histograms."""
+        if result.cleared:
+            self.chains[result.chains] += 1
+            self.cleared[sum(len(step) for step in result.cleared)] += 1
+
+    def summary(self) -> str:
+        """Return a table of the timings and the histograms as text."""
+        lines = [f"{'method':32} {'calls':>10} {'total ms':>11} {'mean us':>10}"]
+        for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            calls = self.calls[name]
+            lines.append(f'{name:32} {calls:10d} {seconds * 1e3:11.2f} {seconds * 1e6 / calls:10.2f}')
+        cascades = sum(self.chains.values())
+        lines.append(f'cascades clearing cells: {cascades}')
+        if cascades:
+            lines.append('  chain steps: ' + ', '.join(f'{k}: {v}' for k, v in sorted(self.chains.items())))
+            lines.append('  cells cleared: ' + ', '.join(f'{k}: {v}' for k, v in sorted(self.cleared.items())))
+        return '\n'.join(lines) + '\n'
+
+
+# The stats being collected, or None while instrumentation is off.
+STATS: Optional[GameStats] = None
+# Methods replaced by enable_stats, to put back on disable_stats.
+_originals: Dict[Tuple[type, str], Callable] = {}
+
+
+def _timed(name: str, func: Callable, stats: GameStats) -> Callable:
+    """Wrap a method to count its calls and time them."""
+    calls, seconds, clock = stats.calls, stats.seconds, time.perf_counter
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            calls[name] += 1
+            seconds[name] += clock() - start
+    return wrapper
+
+
+def _timed_cascade(name: str, func: Callable, stats: GameStats) -> Callable:
+    """Wrap a cascade method to also record the outermost call's result."""
+    calls, seconds, clock = stats.calls, stats.seconds, time.perf_counter
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats._depth += 1
+        start = clock()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            stats._depth -= 1
+            calls[name] += 1
+            seconds[name] += clock() - start
+        if not stats._depth and result is not None:
+            stats.record_cascade(result)
+        return result
+    return wrapper
+
+
+def _public_methods(cls: type):
+    """List the names of a class's own public plain methods."""
+    return [name for name, value in vars(cls).items() if not name.startswith('_') and callable(value) and
+            not isinstance(value, (classmethod, staticmethod, type))]
+
+
+def enable_stats(stats: Optional[GameStats] = None) -> GameStats:
+    """
+    Start instrumenting every GameState and board.
+
+    The public GameState methods and the board steps in BOARD_STEPS are
+    replaced on their classes by wrappers that count and time each call,
+    so the instrumentation costs nothing at all until it is enabled and
+    again after disable_stats.
+
+    Args:
+        stats: Where to collect (default: a new GameStats).
+
+    Returns:
+        The GameStats being collected.
+    """
+    global STATS
+    disable_stats()
+    STATS = stats or GameStats()
+    for name in _public_methods(GameState):
+        func = vars(GameState)[name]
+        _originals[GameState, name] = func
+        wrap = _timed_cascade if name in CASCADE_METHODS else _timed
+        setattr(GameState, name, wrap(f'GameState.{name}', func, STATS))
+    for cls in (GridBoard, BitBoard):
+        for name in BOARD_STEPS:
+            func = vars(cls)[name]
+            _originals[cls, name] = func
+            setattr(cls, name, _timed(f'{cls.__name__}.{name}', func, STATS))
+    return STATS
+
+
+def disable_stats() -> Optional[GameStats]:
+    """
+    Put the original methods back.
+
+    Returns:
+        The GameStats that were being collected, or None.
+    """
+    global STATS
+    for (cls, name), func in _originals.items():
+        setattr(cls, name, func)
+    _originals.clear()
+    stats, STATS = STATS, None
+    return stats
@@ -0,0 +1,102 @@
+from typing import Optional
+import random
+
+from game_logic import EMPTY, GameState
+
+VIRUS_BYTES = b'ryb'
+
+
+def virus_layout(rows: int, columns: int, seed: int, viruses: Optional[int] = None,
+                 density: Optional[float] = None, height: Optional[int] = None, run: int = 4) -> bytes:
+    """
+    Lay out viruses at random as row-major field bytes.
+
+    The cells are drawn in one sample and coloured in row-major order, each
+    with a colour picked from those that do not complete a run of the given
+    length with the cells to its left or above it. Cells to the right and
+    below are coloured later, so at most two colours are ever ruled out and
+    every cell gets one on the first try: the layout needs no retries and
+    contains no run, whatever the count.
+
+    Args:
+        rows: Number of rows in the field.
+        columns: Number of columns in the field.
+        seed: Seed of the layout; a seed always gives the same layout.
+        viruses: Number of viruses to place.
+        density: Fraction of the cells within the height limit to fill,
+            used when viruses is not given.
+        height: Number of rows at the bottom of the field that may hold
+            viruses (default: all but the top third, keeping at least the
+            two rows where fallers appear clear).
+        run: Shortest run of one colour the layout must not contain (at
+            least 2).
+
+    Returns:
+        The field bytes, as GridBoard.to_bytes returns them.
+
+    Raises:
+        ValueError: If the arguments ask for an impossible layout.
+    """
+    if run < 2:
+        raise ValueError(f'Runs must be at least 2 cells long, not {run}')
+    if height is None:
+        height = rows - max(rows // 3, 2)
+    height = max(min(height, rows), 0)
+    region = height * columns
+    if viruses is None:
+        if density is None or not 0 <= density <= 1:
+            raise ValueError('Give a virus count or a density between 0 and 1')
+        viruses = round(density * region)
+    if not 0 <= viruses <= region:
+        raise ValueError(f'Cannot place {viruses} viruses in {region} cells')
+    rng = random.Random(seed)
+    start = (rows - height) * columns
+    cells = bytearray(b' ' * (rows * columns))
+    need = run - 1
+    reach = need * columns
+    pick = rng.random
+    for index in sorted(rng.sample(range(start, start + region), viruses)):
+        banned = ()
+        left = cells[index - 1]
+        if left != EMPTY and index % columns >= need and cells[index - need:index].count(left) == need:
+            banned = (left,)
+        above = cells[index - columns] if index >= start + reach else EMPTY
+        if above != EMPTY and cells[index - reach:index:columns].count(above) == need:
+            banned += (above,)
+        colors = [code for code in VIRUS_BYTES if code not in banned] if banned else VIRUS_BYTES
+        cells[index] = colors[int(pick() * len(colors))]
+    return bytes(cells)
+
+
+def generate_level(rows: int, columns: int, seed: int, viruses: Optional[int] = None,
+                   density: Optional[float] = None, height: Optional[int] = None, run: int = 4,
+                   backend: str = 'grid') -> GameState:
+    """
+    Build a game state whose field holds a random virus layout.
+
+    Takes the arguments of virus_layout, plus backend, the field storage
+    (see GameState). The layout is loaded into the field in one write.
+    """
+    state = GameState(rows, columns, 'EMPTY', backend=backend)
+    state.board.load_bytes(virus_layout(rows, columns, seed, viruses, density, height, run))
+    return state
+
+
+def level_from_config(rows: int, columns: int, config: str) -> GameState:
+    """
+    Build the state for a RANDOM initial-config line.
+
+    The line is 'RANDOM seed amount [height]', where amount is a virus
+    count such as 40 or a density such as 0.3, and height limits the rows
+    that hold viruses (see virus_layout).
+
+    Raises:
+        ValueError: If the line is not a valid RANDOM config.
+    """
+    words = config.split()
+    if words[0] != 'RANDOM' or not 3 <= len(words) <= 4:
+        raise ValueError(f'Expected RANDOM seed amount [height], got {config!r}')
+    amount = words[2]
+    viruses, density = (int(amount), None) if amount.isdigit() else (None, float(amount))
+    height = int(words[3]) if len(words) == 4 else None
+    return generate_level(rows, columns, int(words[1]), viruses, density, height)
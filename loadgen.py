@@ -0,0 +1,109 @@
+from typing import List, Optional, Tuple
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+# With an EMPTY field there are no viruses, so every frame ends with this line.
+FRAME_END = b'LEVEL CLEARED\n'
+COMMANDS = ('', '', '', '<', '>', 'A', 'B')
+
+
+async def connect(host: str, port: int, unix: Optional[str]) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Open a connection to the server."""
+    if unix:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+
+async def start_session(host: str, port: int, unix: Optional[str], rows: int,
+                        columns: int) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Connect, send the start-up lines for an EMPTY field and read the first frame."""
+    reader, writer = await connect(host, port, unix)
+    writer.write(f'{rows}\n{columns}\nEMPTY\n'.encode())
+    await reader.readuntil(FRAME_END)
+    return reader, writer
+
+
+async def idle_client(host: str, port: int, unix: Optional[str], rows: int, columns: int) -> asyncio.StreamWriter:
+    """Open a session that sends nothing after its start-up lines."""
+    _, writer = await start_session(host, port, unix, rows, columns)
+    return writer
+
+
+async def active_client(host: str, port: int, unix: Optional[str], rows: int, columns: int, commands: int,
+                        seed: int, latencies: List[float]):
+    """
+    Send commands one at a time, timing each until its frame arrives.
+
+    A new session is started whenever the game ends.
+    """
+    rng = random.Random(seed)
+    reader, writer = await start_session(host, port, unix, rows, columns)
+    sent = 0
+    since_faller = 0
+    while sent < commands:
+        if since_faller == 0:
+            command = f'F {rng.choice("RYB")} {rng.choice("RYB")}'
+        else:
+            command = rng.choice(COMMANDS)
+        since_faller = (since_faller + 1) % (rows + 4)
+        start = time.perf_counter()
+        writer.write(command.encode() + b'\n')
+        try:
+            await reader.readuntil(FRAME_END)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            reader, writer = await start_session(host, port, unix, rows, columns)
+            since_faller = 0
+            continue
+        latencies.append(time.perf_counter() - start)
+        sent += 1
+    writer.write(b'Q\n')
+    writer.close()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Return the value below which the given fraction of sorted values lie."""
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else 0.0
+
+
+async def run(args) -> str:
+    """Open the idle and active sessions, run the active ones and report."""
+    idle = []
+    for start in range(0, args.idle, 500):
+        idle += await asyncio.gather(*(idle_client(args.host, args.port, args.unix, args.rows, args.columns)
+                                       for _ in range(min(500, args.idle - start))))
+    latencies: List[float] = []
+    began = time.perf_counter()
+    await asyncio.gather(*(active_client(args.host, args.port, args.unix, args.rows, args.columns, args.commands,
+                                         args.seed + i, latencies) for i in range(args.active)))
+    elapsed = time.perf_counter() - began
+    for writer in idle:
+        writer.close()
+    latencies.sort()
+    ms = [1000 * percentile(latencies, p) for p in (0.5, 0.9, 0.99, 0.999)]
+    return (f'{args.idle} idle, {args.active} active sessions: {len(latencies)} commands in {elapsed:.2f}s = '
+            f'{len(latencies) / elapsed:.0f} commands/s; latency ms p50 {ms[0]:.2f} p90 {ms[1]:.2f} '
+            f'p99 {ms[2]:.2f} p99.9 {ms[3]:.2f} max {1000 * (latencies[-1] if latencies else 0):.2f}')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Measure server.py throughput and latency.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--unix', metavar='PATH', help='connect to a Unix socket instead of TCP')
+    parser.add_argument('--idle', type=int, default=0, help='sessions that stay connected without commands')
+    parser.add_argument('--active', type=int, default=100, help='sessions sending commands')
+    parser.add_argument('--commands', type=int, default=200, help='commands per active session')
+    parser.add_argument('--rows', type=int, default=16)
+    parser.add_argument('--columns', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    print(asyncio.run(run(args)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
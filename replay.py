@@ -0,0 +1,237 @@
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+import argparse
+import struct
+import sys
+
+from commands import DROP, FALLER, LEFT, QUIT, RIGHT, ROTATE, TICK, VIRUS, Command, apply_command, parse_command
+from game_logic import GameState
+
+# File layout: MAGIC, a HEADER, the initial field bytes if the CONTENTS
+# flag is set, then records of a one-byte opcode and its arguments.
+MAGIC = b'DRML\x01'
+HEADER = struct.Struct('<HHIB')  # rows, columns, keyframe interval, flags
+CONTENTS_FLAG = 1
+
+OP_NOP = 0        # a line that is not a valid command
+OP_TICK = 1
+OP_LEFT = 2
+OP_RIGHT = 3
+OP_ROTATE_CW = 4
+OP_ROTATE_CCW = 5
+OP_FALLER = 6     # + two colour bytes
+OP_VIRUS = 7      # + VIRUS_ARGS
+OP_QUIT = 8
+OP_KEYFRAME = 9   # + KEYFRAME_ARGS + snapshot bytes
+OP_DROP = 10
+
+VIRUS_ARGS = struct.Struct('<iic')        # row, column, colour
+VIRUS_MIN, VIRUS_MAX = -1 << 31, (1 << 31) - 1  # Coordinates VIRUS_ARGS can hold
+KEYFRAME_ARGS = struct.Struct('<II')      # commands before it, snapshot length
+
+# Parsed commands with no arguments, by opcode and back.
+SIMPLE_OPCODES = {(TICK,): OP_TICK, (LEFT,): OP_LEFT, (RIGHT,): OP_RIGHT, (ROTATE, True): OP_ROTATE_CW,
+                  (ROTATE, False): OP_ROTATE_CCW, (QUIT,): OP_QUIT, (DROP,): OP_DROP}
+SIMPLE_COMMANDS = {opcode: parsed for parsed, opcode in SIMPLE_OPCODES.items()}
+
+
+def encode_command(parsed: Optional[Command]) -> bytes:
+    """Return the log record for a parsed command."""
+    if parsed is None:
+        return bytes((OP_NOP,))
+    opcode = SIMPLE_OPCODES.get(parsed)
+    if opcode is not None:
+        return bytes((opcode,))
+    if parsed[0] == FALLER:
+        return bytes((OP_FALLER,)) + (parsed[1] + parsed[2]).encode('latin-1')
+    _, row, col, color = parsed
+    if not (VIRUS_MIN <= row <= VIRUS_MAX and VIRUS_MIN <= col <= VIRUS_MAX):
+        # Too far off any field for VIRUS_ARGS; the game ignores it, as it
+        # does an invalid line.
+        return bytes((OP_NOP,))
+    return bytes((OP_VIRUS,)) + VIRUS_ARGS.pack(row, col, color.encode('latin-1'))
+
+
+class Recorder:
+    """Writes a session to a binary replay log as commands are applied."""
+
+    def __init__(self, out: BinaryIO, state: GameState, interval: int = 1000):
+        """
+        Write the log header for a session starting from state.
+
+        Args:
+            out: Binary file to write to.
+            state: The session's state before any command.
+            interval: Commands between keyframes.
+        """
+        self.out = out
+        self.interval: int = interval
+        self.commands: int = 0
+        field = state.board.to_bytes()
+        flags = CONTENTS_FLAG if field.strip(b' ') else 0
+        out.write(MAGIC + HEADER.pack(state.rows, state.columns, interval, flags))
+        if flags & CONTENTS_FLAG:
+            out.write(field)
+
+    def record(self, command: str, state: GameState):
+        """Log a command line that has just been applied to state."""
+        self.out.write(encode_command(parse_command(command)))
+        self.commands += 1
+        if self.commands % self.interval == 0:
+            snapshot = state.snapshot()
+            self.out.write(bytes((OP_KEYFRAME,)) + KEYFRAME_ARGS.pack(self.commands, len(snapshot)) + snapshot)
+
+    def close(self):
+        """Flush the log; the caller still owns the file."""
+        self.out.flush()
+
+
+class Replay:
+    """
+    A replay log loaded for playback.
+
+    The records are indexed once on load, so that seek() can start from the
+    nearest keyframe at or before the target and replay only the commands
+    after it.
+    """
+
+    def __init__(self, data: bytes):
+        """
+        Args:
+            data: Contents of a log written by Recorder.
+
+        Raises:
+            ValueError: If data is not a replay log.
+        """
+        if not data.startswith(MAGIC):
+            raise ValueError('Not a replay log')
+        offset = len(MAGIC)
+        self.rows, self.columns, self.interval, flags = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        self.contents: Optional[List[str]] = None
+        if flags & CONTENTS_FLAG:
+            field = data[offset:offset + self.rows * self.columns].decode('latin-1')
+            self.contents = [field[r * self.columns:(r + 1) * self.columns] for r in range(self.rows)]
+            offset += self.rows * self.columns
+        self.commands: List[Optional[Command]] = []
+        # (commands before it, snapshot) pairs, in order.
+        self.keyframes: List[Tuple[int, bytes]] = []
+        for parsed, keyframe in self._records(data, offset):
+            if keyframe is not None:
+                self.keyframes.append(keyframe)
+            else:
+                self.commands.append(parsed)
+
+    @classmethod
+    def load(cls, path: str) -> 'Replay':
+        """Read a replay log from a file."""
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    @staticmethod
+    def _records(data: bytes, offset: int) -> Iterator[Tuple[Optional[Command], Optional[Tuple[int, bytes]]]]:
+        """Decode records as (command, None) or (None, keyframe) pairs."""
+        end = len(data)
+        while offset < end:
+            opcode = data[offset]
+            offset += 1
+            if opcode in SIMPLE_COMMANDS:
+                yield SIMPLE_COMMANDS[opcode], None
+            elif opcode == OP_NOP:
+                yield None, None
+            elif opcode == OP_FALLER:
+                colors = data[offset:offset + 2].decode('latin-1')
+                offset += 2
+                yield (FALLER, colors[0], colors[1]), None
+            elif opcode == OP_VIRUS:
+                row, col, color = VIRUS_ARGS.unpack_from(data, offset)
+                offset += VIRUS_ARGS.size
+                yield (VIRUS, row, col, color.decode('latin-1')), None
+            elif opcode == OP_KEYFRAME:
+                index, length = KEYFRAME_ARGS.unpack_from(data, offset)
+                offset += KEYFRAME_ARGS.size
+                yield None, (index, data[offset:offset + length])
+                offset += length
+            else:
+                raise ValueError(f'Unknown opcode {opcode} at byte {offset - 1}')
+
+    def __len__(self) -> int:
+        return len(self.commands)
+
+    def initial_state(self) -> GameState:
+        """Return the state the session started from."""
+        if self.contents is None:
+            return GameState(self.rows, self.columns, 'EMPTY')
+        return GameState(self.rows, self.columns, 'CONTENTS', self.contents)
+
+    def seek(self, index: int, use_keyframes: bool = True) -> GameState:
+        """
+        Return the state after the first index commands.
+
+        Args:
+            index: Number of commands to apply, from 0 to len(self).
+            use_keyframes: Start from the nearest keyframe instead of the
+                initial state.
+        """
+        index = max(0, min(index, len(self.commands)))
+        state, start = None, 0
+        if use_keyframes:
+            for position, snapshot in reversed(self.keyframes):
+                if position <= index:
+                    state, start = GameState.from_snapshot(snapshot), position
+                    break
+        if state is None:
+            state = self.initial_state()
+        for parsed in self.commands[start:index]:
+            apply_command(state, parsed)
+        return state
+
+    def text(self) -> str:
+        """Return the session as a2.py standard input."""
+        lines = [str(self.rows), str(self.columns), 'EMPTY' if self.contents is None else 'CONTENTS']
+        lines.extend(self.contents or ())
+        lines.extend(format_command(parsed) for parsed in self.commands)
+        return '\n'.join(lines) + '\n'
+
+
+def format_command(parsed: Optional[Command]) -> str:
+    """Return the protocol line for a parsed command ('#', which is ignored, for None)."""
+    if parsed is None:
+        return '#'
+    opcode = parsed[0]
+    if opcode == TICK:
+        return ''
+    if opcode == ROTATE:
+        return 'A' if parsed[1] else 'B'
+    if opcode == FALLER:
+        return f'F {parsed[1]} {parsed[2]}'
+    if opcode == VIRUS:
+        return f'v {parsed[1]} {parsed[2]} {parsed[3]}'
+    return opcode
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Inspect and replay a2.py session logs.')
+    parser.add_argument('log', help='replay log written with --record')
+    parser.add_argument('--seek', type=int, default=None, metavar='N',
+                        help='show the field after N commands (default: the end of the session)')
+    parser.add_argument('--no-keyframes', action='store_true', help='replay from the start, ignoring keyframes')
+    parser.add_argument('--text', action='store_true', help='print the session as a2.py input instead')
+    args = parser.parse_args(argv)
+
+    replay = Replay.load(args.log)
+    if args.text:
+        sys.stdout.write(replay.text())
+        return 0
+    index = len(replay) if args.seek is None else args.seek
+    state = replay.seek(index, not args.no_keyframes)
+    from a2 import display_field
+    print(f'{replay.rows}x{replay.columns} session, {len(replay)} commands, {len(replay.keyframes)} keyframes; '
+          f'after command {min(max(index, 0), len(replay))}:')
+    display_field(state)
+    if state.game_over:
+        print('GAME OVER')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
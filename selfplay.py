@@ -0,0 +1,225 @@
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import argparse
+import csv
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from engine import LookaheadPlayer, Placement, apply_placement, enumerate_placements
+from game_logic import GameState, enable_cascade_cache
+from levelgen import generate_level
+
+# A policy picks a placement for the state's faller, given the colours of
+# the fallers that follow; None gives up the game.
+Policy = Callable[[GameState, Sequence[Tuple[str, str]]], Optional[Placement]]
+
+CAPSULE_COLORS = ('R', 'Y', 'B')
+FIELDS = ('level', 'seed', 'viruses', 'outcome', 'fallers', 'moves', 'ticks', 'chains', 'max_chain', 'seconds')
+
+
+class RandomPlayer:
+    """Picks a uniformly random placement."""
+
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+
+    def __call__(self, state: GameState, upcoming: Sequence[Tuple[str, str]] = ()) -> Optional[Placement]:
+        placements = enumerate_placements(state)
+        return self.rng.choice(placements) if placements else None
+
+
+# Built-in policies by name.
+POLICIES: Dict[str, Callable[[], Policy]] = {
+    'random': RandomPlayer,
+    'greedy': lambda: LookaheadPlayer(depth=1),
+    'lookahead': lambda: LookaheadPlayer(depth=2, max_nodes=2000),
+}
+
+
+def load_policy(spec: str) -> Policy:
+    """
+    Build a policy from a built-in name or a 'module:factory' path.
+
+    Raises:
+        ValueError: If spec names no known policy.
+    """
+    if spec in POLICIES:
+        return POLICIES[spec]()
+    if ':' not in spec:
+        raise ValueError(f"Unknown policy: {spec!r}")
+    module, name = spec.split(':', 1)
+    return getattr(importlib.import_module(module), name)()
+
+
+def make_level(rows: int, columns: int, viruses: int, seed: int) -> GameState:
+    """
+    Lay out viruses on an empty field with levelgen.
+
+    Viruses go in the lower two thirds of the field and never form a run of
+    three of one colour, so the level does not clear itself; a count beyond
+    the room there fills it.
+    """
+    height = rows - max(rows // 3, 2)
+    return generate_level(rows, columns, seed, min(viruses, height * columns), run=3)
+
+
+def play_level(state: GameState, policy: Policy, seed: int, max_fallers: int = 1000,
+               lookahead: int = 2) -> Dict[str, object]:
+    """
+    Play a level until it is cleared, lost or max_fallers fallers were used.
+
+    Args:
+        state: Level to play; it is modified.
+        policy: Chooses where each faller goes.
+        seed: Seed for the faller colours.
+        max_fallers: Fallers allowed before the game counts as a timeout.
+        lookahead: Upcoming fallers shown to the policy.
+
+    Returns:
+        dict: Per-game stats (see FIELDS).
+    """
+    rng = random.Random(seed)
+    queue = [(rng.choice(CAPSULE_COLORS), rng.choice(CAPSULE_COLORS)) for _ in range(lookahead + 1)]
+    stats = {'viruses': state.remaining_viruses(), 'fallers': 0, 'moves': 0, 'ticks': 0, 'chains': 0,
+             'max_chain': 0}
+    start = time.perf_counter()
+    outcome = 'timeout'
+    while stats['fallers'] < max_fallers:
+        if not state.has_viruses():
+            outcome = 'cleared'
+            break
+        color1, color2 = queue.pop(0)
+        queue.append((rng.choice(CAPSULE_COLORS), rng.choice(CAPSULE_COLORS)))
+        if not state.create_faller(color1, color2):
+            outcome = 'lost'
+            break
+        placement = policy(state, queue)
+        if placement is None:
+            outcome = 'lost'
+            break
+        result = apply_placement(state, placement)
+        stats['fallers'] += 1
+        stats['moves'] += len(placement.commands)
+        stats['ticks'] += placement.commands.count('')
+        stats['chains'] += result.chains
+        stats['max_chain'] = max(stats['max_chain'], result.chains)
+    else:
+        if not state.has_viruses():
+            outcome = 'cleared'
+    stats['outcome'] = outcome
+    stats['seconds'] = round(time.perf_counter() - start, 6)
+    return stats
+
+
+# Policy built once per worker process.
+_worker_policy: Optional[Policy] = None
+
+
+def _init_worker(policy: str, cascade_cache: Optional[int] = None):
+    global _worker_policy
+    _worker_policy = load_policy(policy)
+    if cascade_cache:
+        enable_cascade_cache(cascade_cache)
+
+
+def _run_task(task: Tuple[int, int, int, int, int, int]) -> Dict[str, object]:
+    """Build and play one level in a worker process."""
+    level, seed, rows, columns, viruses, max_fallers = task
+    stats = play_level(make_level(rows, columns, viruses, seed), _worker_policy, seed, max_fallers)
+    stats['level'] = level
+    stats['seed'] = seed
+    return stats
+
+
+def run_levels(levels: int, rows: int, columns: int, viruses: int, policy: str = 'greedy', seed: int = 0,
+               workers: Optional[int] = None, chunksize: int = 4, max_fallers: int = 1000,
+               cascade_cache: Optional[int] = None) -> Iterator[Dict[str, object]]:
+    """
+    Play many levels across a process pool, yielding stats as games finish.
+
+    Args:
+        levels: Number of levels to play.
+        rows: Field rows.
+        columns: Field columns.
+        viruses: Viruses per level.
+        policy: Built-in policy name or 'module:factory' path.
+        seed: Base seed; level i uses seed + i.
+        workers: Worker processes (default: one per core; 1 plays in this process).
+        chunksize: Levels handed to a worker at a time.
+        max_fallers: Fallers allowed per game.
+        cascade_cache: Bytes of cascade cache per worker (default: no cache).
+    """
+    tasks = ((i, seed + i, rows, columns, viruses, max_fallers) for i in range(levels))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(policy, cascade_cache)
+        yield from map(_run_task, tasks)
+        return
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(policy, cascade_cache)) as pool:
+        yield from pool.imap_unordered(_run_task, tasks, chunksize)
+
+
+class StatsWriter:
+    """Streams per-game stats to a JSONL or CSV file."""
+
+    def __init__(self, out, fmt: str = 'jsonl'):
+        self.out = out
+        self.fmt = fmt
+        self._csv = None
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(out, FIELDS)
+            self._csv.writeheader()
+
+    def write(self, stats: Dict[str, object]):
+        """Write one game's stats and flush them."""
+        if self._csv is not None:
+            self._csv.writerow(stats)
+        else:
+            self.out.write(json.dumps({field: stats[field] for field in FIELDS}) + '\n')
+        self.out.flush()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Play many generated levels in parallel and record per-game stats.')
+    parser.add_argument('--levels', type=int, default=100, help='number of levels to play')
+    parser.add_argument('--rows', type=int, default=16)
+    parser.add_argument('--columns', type=int, default=8)
+    parser.add_argument('--viruses', type=int, default=8, help='viruses per level')
+    parser.add_argument('--policy', default='greedy', help="'random', 'greedy', 'lookahead' or module:factory")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--chunksize', type=int, default=4)
+    parser.add_argument('--max-fallers', type=int, default=1000)
+    parser.add_argument('--cascade-cache', type=int, default=0, metavar='MB',
+                        help='cache cascade outcomes, up to this many megabytes per worker')
+    parser.add_argument('--out', default='-', help='stats file (default: standard output)')
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default=None,
+                        help='stats format (default: from the file extension, else jsonl)')
+    args = parser.parse_args(argv)
+    load_policy(args.policy)  # Fail early on a bad policy
+    fmt = args.format or ('csv' if args.out.endswith('.csv') else 'jsonl')
+
+    out = sys.stdout if args.out == '-' else open(args.out, 'w', newline='')
+    totals = {'cleared': 0, 'lost': 0, 'timeout': 0}
+    start = time.perf_counter()
+    try:
+        writer = StatsWriter(out, fmt)
+        for stats in run_levels(args.levels, args.rows, args.columns, args.viruses, args.policy, args.seed,
+                                args.workers, args.chunksize, args.max_fallers, args.cascade_cache << 20):
+            writer.write(stats)
+            totals[stats['outcome']] += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"{args.levels} levels in {elapsed:.2f}s: {totals['cleared']} cleared, {totals['lost']} lost, "
+          f"{totals['timeout']} timed out", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+from typing import List, Optional, Set
+import argparse
+import asyncio
+import sys
+
+from a2 import TextRenderer
+from commands import run_command
+from game_logic import GameState
+from levelgen import level_from_config
+
+READ_SIZE = 65536
+# Bytes queued for a client above which reading from it pauses until it
+# catches up, and server ticks stop sending it intermediate frames.
+HIGH_WATER = 256 * 1024
+LOW_WATER = 64 * 1024
+
+
+class Session:
+    """
+    One connection's game: a GameState and the frames waiting to be sent.
+
+    Frames are rendered with a2.TextRenderer into a pending list and sent to
+    the client in one write per batch of commands.
+    """
+
+    __slots__ = ('writer', 'state', 'renderer', 'pending', 'done')
+
+    def __init__(self, writer: asyncio.StreamWriter, state: GameState):
+        self.writer = writer
+        self.state = state
+        self.renderer = TextRenderer(out=self)
+        self.pending: List[str] = []
+        self.done: bool = False
+
+    def write(self, text: str):
+        """Queue text for the client (the renderer's output stream)."""
+        self.pending.append(text)
+
+    def flush(self):
+        """Send everything queued in a single write."""
+        if self.pending:
+            self.writer.write(''.join(self.pending).encode('latin-1'))
+            self.pending.clear()
+
+    def start(self):
+        """Queue the first frame, as a2.py prints before reading a command."""
+        self.renderer.frame(self.state)
+
+    def command(self, command: str) -> bool:
+        """
+        Apply one command line and queue the frame a2.py would print after it.
+
+        Returns:
+            bool: False once the session has ended (quit or game over).
+        """
+        if self.done:
+            return False
+        if not run_command(self.state, command):
+            self.renderer.finish(self.state)
+            self.done = True
+            return False
+        self.renderer.frame(self.state)
+        if self.state.game_over:
+            self.renderer.finish(self.state, 'GAME OVER\n')
+            self.done = True
+            return False
+        return True
+
+    def congested(self) -> bool:
+        """Check whether the client is too far behind to be sent more frames."""
+        return self.writer.transport.get_write_buffer_size() > HIGH_WATER
+
+
+class GameServer:
+    """
+    Hosts a GameState per connection over the a2.py text protocol.
+
+    A client sends the rows, columns and configuration lines a2.py reads at
+    start-up, then one command per line, and receives exactly the frames
+    a2.py would print. With a tick interval, a single server loop also
+    advances the faller and gravity of every session that has a faller, as
+    an empty command would; frames from these ticks are skipped for clients
+    that are not keeping up.
+    """
+
+    def __init__(self, tick_interval: Optional[float] = None):
+        """
+        Args:
+            tick_interval: Seconds between server-side gravity ticks (None for no ticks).
+        """
+        self.tick_interval: Optional[float] = tick_interval
+        self.sessions: Set[Session] = set()
+        self.active: Set[Session] = set()  # Sessions with a faller
+        self.commands: int = 0
+        self._ticker: Optional[asyncio.Task] = None
+
+    async def start_tcp(self, host: str = '127.0.0.1', port: int = 7777) -> asyncio.AbstractServer:
+        """Listen on a TCP port."""
+        self._start_ticker()
+        return await asyncio.start_server(self.handle, host, port, limit=READ_SIZE, backlog=4096)
+
+    async def start_unix(self, path: str) -> asyncio.AbstractServer:
+        """Listen on a Unix socket."""
+        self._start_ticker()
+        return await asyncio.start_unix_server(self.handle, path, limit=READ_SIZE, backlog=4096)
+
+    def _start_ticker(self):
+        if self.tick_interval and self._ticker is None:
+            self._ticker = asyncio.get_running_loop().create_task(self._tick_loop())
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one connection until the client quits, loses or disconnects."""
+        writer.transport.set_write_buffer_limits(HIGH_WATER, LOW_WATER)
+        session = None
+        try:
+            state = await self._read_header(reader)
+            if state is None:
+                return
+            session = Session(writer, state)
+            self.sessions.add(session)
+            session.start()
+            session.flush()
+            buffered = b''
+            while not session.done:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    session.command('Q')  # End of input quits, as in a2.py
+                    session.flush()
+                    break
+                lines = (buffered + data).split(b'\n')
+                buffered = lines.pop()
+                for line in lines:
+                    self.commands += 1
+                    if not session.command(line.decode('latin-1').strip()):
+                        break
+                self._update_active(session)
+                session.flush()
+                await writer.drain()
+        except (ConnectionError, ValueError, IndexError):
+            pass
+        finally:
+            if session is not None:
+                self.sessions.discard(session)
+                self.active.discard(session)
+            writer.close()
+
+    async def _read_header(self, reader: asyncio.StreamReader) -> Optional[GameState]:
+        """Read the start-up lines and build the session's state (None on early EOF)."""
+        lines = []
+        for _ in range(3):
+            line = await reader.readline()
+            if not line:
+                return None
+            lines.append(line.decode('latin-1').strip())
+        rows, columns, config = int(lines[0]), int(lines[1]), lines[2]
+        contents = None
+        if config == 'CONTENTS':
+            contents = [(await reader.readline()).decode('latin-1').strip() for _ in range(rows)]
+        if config.startswith('RANDOM'):
+            return level_from_config(rows, columns, config)
+        return GameState(rows, columns, config, contents)
+
+    def _update_active(self, session: Session):
+        """Track whether a session needs server ticks."""
+        if session.state.has_faller and not session.done:
+            self.active.add(session)
+        else:
+            self.active.discard(session)
+
+    async def _tick_loop(self):
+        """Tick every active session together on a fixed schedule."""
+        loop = asyncio.get_running_loop()
+        due = loop.time()
+        while True:
+            due += self.tick_interval
+            await asyncio.sleep(max(due - loop.time(), 0))
+            for session in list(self.active):
+                try:
+                    if session.congested():
+                        session.state.tick()
+                    else:
+                        session.command('')
+                        session.flush()
+                except IndexError:
+                    session.done = True
+                    session.writer.close()
+                self._update_active(session)
+
+
+async def serve(host: str, port: int, unix: Optional[str], tick_interval: Optional[float]):
+    """Run a server until cancelled."""
+    server = GameServer(tick_interval)
+    listener = await (server.start_unix(unix) if unix else server.start_tcp(host, port))
+    where = unix or f'{host}:{port}'
+    print(f'Serving on {where}', file=sys.stderr)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Serve the a2.py protocol to many clients at once.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--unix', metavar='PATH', help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--tick', type=float, default=None, metavar='SECONDS',
+                        help='advance every session with a faller at this interval')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.tick))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import random
+import sys
+
+import reference_game_logic
+
+# The reference engine resolves cascades by recursion.
+sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+
+SEEDS = range(300)
+
+
+def random_game(rng: random.Random):
+    """Draw a field size, an initial config and a command script."""
+    rows = rng.randint(4, 12)
+    columns = rng.randint(3, 8)
+    contents = None
+    if rng.random() < 0.7:
+        density = rng.random()
+        contents = [''.join(rng.choice('RYBryb') if rng.random() < density and r > 1 else ' '
+                            for c in range(columns)) for r in range(rows)]
+    commands = []
+    for _ in range(rng.randint(10, 200)):
+        x = rng.random()
+        if x < 0.33:
+            commands.append('')
+        elif x < 0.48:
+            commands.append(f'F {rng.choice("RYB")} {rng.choice("RYB")}')
+        elif x < 0.53:
+            commands.append('D')
+        elif x < 0.6:
+            commands.append(rng.choice('AB'))
+        elif x < 0.8:
+            commands.append(rng.choice('<>'))
+        else:
+            commands.append(f'v {rng.randrange(rows)} {rng.randrange(columns)} {rng.choice("ryb")}')
+    return rows, columns, 'CONTENTS' if contents else 'EMPTY', contents, commands
+
+
+def apply(state, command: str):
+    """Apply a command with the methods every engine shares."""
+    if command == '':
+        if state.faller:
+            if state.faller_landed:
+                state.freeze_faller()
+            else:
+                state.faller_fall()
+        state.apply_gravity()
+    elif command.startswith('F'):
+        _, color1, color2 = command.split()
+        state.create_faller(color1, color2)
+    elif command == 'D':
+        if hasattr(state, 'hard_drop'):
+            state.hard_drop()
+        else:
+            # The reference engine has no hard drop; tick the faller to rest.
+            while state.faller:
+                apply(state, '')
+    elif command in ('A', 'B'):
+        state.rotate_faller(command == 'A')
+    elif command == '<':
+        state.move_faller_left()
+    elif command == '>':
+        state.move_faller_right()
+    else:
+        _, row, col, color = command.split()
+        state.create_virus(int(row), int(col), color)
+
+
+def show(state) -> str:
+    """Return what a front end would show of a state."""
+    lines = [''.join(state.get_cell_display(r, c) for c in range(state.get_columns()))
+             for r in range(state.get_rows())]
+    return '\n'.join(lines + [str(state.has_viruses()), str(state.game_over)])
+
+
+def first_mismatch(seed: int, make, check=None):
+    """
+    Play a random game on the reference engine and on make's, command by command.
+
+    Returns:
+        None if they always agree, else a description of the first difference.
+    """
+    rows, columns, config, contents, commands = random_game(random.Random(seed))
+    expected = reference_game_logic.GameState(rows, columns, config, contents)
+    actual = make(rows, columns, config, contents)
+    for step, command in enumerate([None] + commands):
+        if command is not None:
+            errors = []
+            for state in (expected, actual):
+                try:
+                    apply(state, command)
+                    errors.append(None)
+                except IndexError:
+                    # The reference engine cannot rotate a faller on the bottom row.
+                    errors.append('IndexError')
+            if errors[0] or errors[1]:
+                return None if errors[0] == errors[1] else f'seed {seed} step {step} {command!r}: {errors}'
+        if show(expected) != show(actual):
+            return f'seed {seed} step {step} {command!r}:\n{show(expected)}\n!=\n{show(actual)}'
+        if check is not None:
+            check(actual)
+    return None
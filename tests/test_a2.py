@@ -0,0 +1,132 @@
+import contextlib
+import io
+import random
+
+import pytest
+
+import a2
+from commands import run_command
+from differential import random_game
+
+
+def game_text(seed: int) -> str:
+    """Return the a2.py input for a random game on an empty field."""
+    rows, columns, _, _, commands = random_game(random.Random(seed))
+    return '\n'.join([str(rows), str(columns), 'EMPTY'] + commands + ['Q'])
+
+
+def test_read_games_with_a_custom_delimiter():
+    text = 'first\n1\n=====\n\n  \n=====\nsecond\n\n 2 \n  =====  \nthird\n====='
+    expected = [['first', '1'], ['second', '', ' 2 '], ['third']]
+    for chunk_size in (1, 3, 7, 1 << 20):
+        assert list(a2.read_games(io.StringIO(text), '=====', chunk_size)) == expected
+        assert list(a2.read_games(io.StringIO(text + '\n'), '=====', chunk_size)) == expected
+    # The default delimiter is only an ordinary line under another one.
+    assert list(a2.read_games(io.StringIO('a\n---\nb\n===\nc'), '===')) == [['a', '---', 'b'], ['c']]
+    assert list(a2.read_games(io.StringIO(''), '===')) == []
+    assert list(a2.read_games(io.StringIO('===\n\n===\n'), '===')) == []
+
+
+def test_batch_output_keeps_input_order_across_workers():
+    # Long games first, so a worker finishing early would reorder the output.
+    games = [game_text(seed) for seed in sorted(range(24), key=lambda seed: -len(game_text(seed)))]
+    batch = '\n@@\n'.join(games) + '\n@@\n'
+    expected = ''.join(a2.play_batch_game(game.split('\n'))[0] + '@@\n' for game in games)
+    for workers, chunksize in ((1, 4), (3, 1), (4, 2)):
+        out = io.StringIO()
+        failed = a2.run_batch(io.StringIO(batch), out, '@@', workers=workers, chunksize=chunksize)
+        assert out.getvalue() == expected, (workers, chunksize)
+        assert failed == sum(a2.play_batch_game(game.split('\n'))[1] is not None for game in games)
+
+
+@pytest.mark.parametrize('workers', ['1', '2'])
+def test_batch_reports_an_invalid_game_and_fails(monkeypatch, capsys, workers):
+    good = '4\n3\nEMPTY\nF R Y\n\nQ'
+    games = [good, '4\nthree\nEMPTY\nQ', good, '4\n3\nRANDOM 1 lots\nQ', good, '4\n3']
+    monkeypatch.setattr('sys.stdin', io.StringIO('\n;;\n'.join(games)))
+    assert a2.main(['--batch', '--delimiter', ';;', '--workers', workers, '--chunksize', '1']) == 1
+    captured = capsys.readouterr()
+    assert captured.err == ("game 2: ValueError: invalid literal for int() with base 10: 'three'\n"
+                            "game 4: ValueError: could not convert string to float: 'lots'\n"
+                            'game 6: incomplete game header\n')
+    good_output = a2.play_batch_game(good.split('\n'))[0]
+    assert captured.out == ';;\n'.join([good_output, '', good_output, '', good_output, '', ''])
+    monkeypatch.setattr('sys.stdin', io.StringIO('\n;;\n'.join([good, good])))
+    assert a2.main(['--batch', '--delimiter', ';;', '--workers', workers]) == 0
+
+
+class Frames:
+    """Output stream keeping each write apart; TextRenderer writes a frame per call."""
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, text: str):
+        self.writes.append(text)
+
+
+def frames(text: str, every: int = 1, final_only: bool = False) -> list:
+    """Play an a2.py input through a TextRenderer and return its writes."""
+    lines = iter(text.split('\n'))
+    out = Frames()
+    a2.play(a2.read_game(lines), lines, a2.TextRenderer(every, final_only, out))
+    return out.writes
+
+
+def per_command_output(text: str) -> str:
+    """Print a game the way a2.py did before TextRenderer: display_field before every command."""
+    lines = iter(text.split('\n'))
+    state = a2.read_game(lines)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        while True:
+            a2.display_field(state)
+            if state.game_over:
+                print('GAME OVER')
+                break
+            if not run_command(state, next(lines, 'Q').strip()):
+                break
+    return out.getvalue()
+
+
+def playable_games():
+    """Yield random games that end without the faller rotating off the bottom row."""
+    for seed in range(0, 300, 4):
+        text = game_text(seed)
+        try:
+            per_command_output(text)
+        except IndexError:
+            continue
+        yield text
+
+
+def test_default_output_matches_printing_every_frame(monkeypatch, capsys):
+    for text in playable_games():
+        expected = per_command_output(text)
+        monkeypatch.setattr('sys.stdin', io.StringIO(text))
+        assert a2.main([]) == 0
+        assert capsys.readouterr().out == expected
+        assert ''.join(frames(text)) == expected
+
+
+@pytest.mark.parametrize('every', [1, 2, 3, 7])
+def test_every_nth_frame_and_the_last(every):
+    for text in playable_games():
+        full = frames(text)
+        trailer = [full.pop()] if full[-1] == 'GAME OVER\n' else []
+        expected = full[::every]
+        if (len(full) - 1) % every:
+            expected.append(full[-1])  # The final frame is always written
+        assert ''.join(frames(text, every)) == ''.join(expected + trailer)
+        assert ''.join(frames(text, every, final_only=True)) == ''.join([full[-1]] + trailer)
+
+
+@pytest.mark.parametrize('ending, trailer', [('\nQ', ''), ('', ''), ('\nv 1 1 b\nF R Y', 'GAME OVER\n')])
+def test_final_frame_is_written_before_the_game_ends(monkeypatch, capsys, ending, trailer):
+    text = '6\n4\nEMPTY\nv 5 0 r\nF R Y\n>\n\n\n\nA\n\n<' + ending
+    full = frames(text)
+    for every in (4, 5, 100):
+        monkeypatch.setattr('sys.stdin', io.StringIO(text))
+        assert a2.main(['--every', str(every)]) == 0
+        assert capsys.readouterr().out.endswith(full[-1 - bool(trailer)] + trailer)
+    assert bool(trailer) == (full[-1] == 'GAME OVER\n')
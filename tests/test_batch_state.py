@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from differential import apply, random_game
+from game_logic import GameState
+
+np = pytest.importorskip('numpy')
+from batch_state import BatchGameState  # noqa: E402
+
+
+def board_display(get, rows, columns):
+    return [''.join(get(r, c) for c in range(columns)) for r in range(rows)]
+
+
+@pytest.mark.parametrize('seed', range(0, 40, 10))
+def test_batch_matches_game_states(seed):
+    count = 20
+    for seed in range(seed, seed + 10):
+        rng = random.Random(seed)
+        rows, columns, _, _, commands = random_game(rng)
+        states = []
+        for _ in range(count):
+            density = rng.random()
+            contents = [''.join(rng.choice('RYBryb') if rng.random() < density and r > 1 else ' '
+                                for c in range(columns)) for r in range(rows)]
+            states.append(GameState(rows, columns, 'CONTENTS', contents))
+        batch = BatchGameState.from_states(states)
+        alive = [True] * count
+        for step, command in enumerate(commands):
+            where = np.array([rng.random() < 0.8 for _ in range(count)])
+            for i, state in enumerate(states):
+                if where[i] and alive[i]:
+                    try:
+                        apply(state, command)
+                    except IndexError:
+                        alive[i] = False  # The batch rejects this rotation instead
+            batch.command(command, where)
+            viruses = batch.has_viruses()
+            for i, state in enumerate(states):
+                if not alive[i]:
+                    continue
+                expected = board_display(state.get_cell_display, rows, columns)
+                actual = board_display(lambda r, c: batch.get_cell_display(i, r, c), rows, columns)
+                context = f'seed {seed} step {step} {command!r} board {i}'
+                assert actual == expected, context
+                assert batch.game_over[i] == state.game_over, context
+                assert viruses[i] == state.has_viruses(), context
+
+
+def test_batch_rejects_fields_taller_than_a_lane():
+    BatchGameState(2, 64, 8)
+    with pytest.raises(ValueError):
+        BatchGameState(2, 65, 8)
@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+import game_logic
+from differential import SEEDS, first_mismatch
+from engine import apply_placement, enumerate_placements
+from game_logic import GameState, enable_cascade_cache, enable_zobrist_checks
+
+
+@pytest.fixture
+def cache():
+    enable_zobrist_checks(True)
+    yield enable_cascade_cache(1 << 20)
+    enable_cascade_cache(None)
+    enable_zobrist_checks(False)
+
+
+def test_cached_games_match_reference(cache):
+    mismatches = [m for m in (first_mismatch(seed, GameState) for seed in SEEDS) if m]
+    assert not mismatches, mismatches[0]
+
+
+def test_cache_hits_match_recomputation(cache):
+    rng = random.Random(3)
+    for _ in range(150):
+        rows, columns = 12, rng.randint(4, 10)
+        contents = [''.join(rng.choice('RYBryb  ') if r > 3 else ' ' for c in range(columns)) for r in range(rows)]
+        state = GameState(rows, columns, 'CONTENTS', contents)
+        state.tick()
+        if state.game_over or not state.create_faller(rng.choice('RYB'), rng.choice('RYB')):
+            continue
+        for placement in enumerate_placements(state):
+            # The second cached placement of each position is a hit.
+            cached = [state.clone() for _ in range(2)]
+            cached_results = [apply_placement(clone, placement) for clone in cached]
+            game_logic.CASCADE_CACHE = None
+            plain = state.clone()
+            plain_result = apply_placement(plain, placement)
+            game_logic.CASCADE_CACHE = cache
+            for clone, result in zip(cached, cached_results):
+                assert result == plain_result
+                assert clone.board.to_bytes() == plain.board.to_bytes()
+                assert clone.board.tops == plain.board.tops
+                assert clone.board.counts == plain.board.counts
+                assert clone.zobrist() == plain.zobrist()
+    assert cache.hits > 100
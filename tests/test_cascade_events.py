@@ -0,0 +1,38 @@
+import pytest
+
+from game_logic import CellsCleared, GameState, PiecesDropped
+
+
+def field_counts(state):
+    counts = {cell: 0 for cell in 'ryb' 'RYB'}
+    for row in state.field:
+        for cell in row:
+            if cell != ' ':
+                counts[cell] += 1
+    return counts
+
+
+@pytest.mark.parametrize('backend', ['grid', 'bitboard'])
+def test_abandoned_generator_does_not_overwrite_later_writes(backend):
+    state = GameState(8, 3, 'EMPTY', backend=backend)
+    state.board.place(1, 1, 'R')
+    events = state.cascade_events()
+    assert next(events) == PiecesDropped([(1, 1, 2)])
+    assert state.create_virus(4, 1, 'y')
+    state.tick()
+    assert state.board.get(4, 1) == 'y'
+    assert state.board.get(3, 1) == 'R'
+    assert state.board.counts == field_counts(state)
+    assert state.zobrist() == state.full_zobrist()
+
+
+@pytest.mark.parametrize('backend', ['grid', 'bitboard'])
+def test_generator_steps_match_resolve_cascade(backend):
+    contents = ['B   ', 'R   ', '    ', 'r   ', 'r   ', 'rbbB']
+    stepped = GameState(6, 4, 'CONTENTS', contents, backend=backend)
+    resolved = GameState(6, 4, 'CONTENTS', contents, backend=backend)
+    events = list(stepped.cascade_events())
+    result = resolved.resolve_cascade()
+    assert [event.cells for event in events if isinstance(event, CellsCleared)] == result.cleared
+    assert stepped.field == resolved.field
+    assert result.chains == 2
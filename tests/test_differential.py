@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+from differential import SEEDS, apply, first_mismatch, random_game, show
+from game_logic import GameState
+
+
+def check_counts(state):
+    field = state.field
+    for cell, count in state.board.counts.items():
+        assert count == sum(row.count(cell) for row in field)
+
+
+@pytest.mark.parametrize('backend', ['grid', 'bitboard'])
+def test_backend_matches_reference(backend):
+    def make(rows, columns, config, contents):
+        return GameState(rows, columns, config, contents, backend=backend)
+
+    mismatches = [m for m in (first_mismatch(seed, make, check_counts) for seed in SEEDS) if m]
+    assert not mismatches, mismatches[0]
+
+
+@pytest.mark.parametrize('backend', ['grid', 'bitboard'])
+def test_hard_drop_matches_ticking_to_rest(backend):
+    for seed in SEEDS:
+        rows, columns, config, contents, commands = random_game(random.Random(seed))
+        state = GameState(rows, columns, config, contents, backend=backend)
+        for step, command in enumerate(commands):
+            if state.has_faller:
+                dropped, ticked = state.clone(), state.clone()
+                assert dropped.hard_drop()
+                while ticked.has_faller:
+                    ticked.tick()
+                context = f'seed {seed} step {step}'
+                assert show(dropped) == show(ticked), context
+                assert dropped.board.to_bytes() == ticked.board.to_bytes(), context
+                assert dropped.zobrist() == ticked.zobrist(), context
+            try:
+                apply(state, command)
+            except IndexError:
+                break  # A rotation below the floor
@@ -0,0 +1,117 @@
+import random
+
+import pytest
+
+from differential import apply, random_game
+from engine import LOSS, WEIGHTS, LookaheadPlayer, Placement, apply_placement, enumerate_placements, score_state
+from game_logic import MATCH_KEYS, GameState
+from levelgen import generate_level
+
+
+def test_apply_placement_reports_clears_by_the_falling_half():
+    column0 = 'yryryry'
+    contents = ['    '] * 3 + [column0[i] + (' ' if i < 4 else 'b') + '  ' for i in range(7)]
+    state = GameState(10, 4, 'CONTENTS', contents)
+    state.resolve_cascade()
+    result = apply_placement(state, Placement(2, 0, False, 'R', 'B', ()))
+    assert result.chains == 1
+    assert result.cleared == [[(6, 1), (7, 1), (8, 1), (9, 1)]]
+    assert all(state.board.get(row, 1) == ' ' for row in range(10))
+
+
+def test_apply_placement_matches_its_commands():
+    contents = ['    '] * 6 + ['y   ', 'r Rb', 'y Yb', 'ryBb']
+    state = GameState(10, 4, 'CONTENTS', contents)
+    state.resolve_cascade()
+    state.create_faller('B', 'Y')
+    clearing = 0
+    for placement in enumerate_placements(state):
+        placed = state.clone()
+        played = state.clone()
+        result = apply_placement(placed, placement)
+        cleared = []
+        for command in placement.commands:
+            if command == '':
+                played_result = played.freeze_faller() if played.faller_landed else None
+                if played_result is None:
+                    played.faller_fall()
+                else:
+                    cleared += played_result.cleared
+                cleared += played.apply_gravity().cleared
+            elif command in '<>':
+                (played.move_faller_left if command == '<' else played.move_faller_right)()
+            else:
+                played.rotate_faller(command == 'A')
+        assert placed.field == played.field
+        assert result.cleared == cleared
+        clearing += bool(cleared)
+    assert clearing
+
+
+def naive_score(state: GameState, cleared: int) -> float:
+    """score_state worked out cell by cell from the field."""
+    field, rows, columns = state.field, state.rows, state.columns
+    mid = columns // 2 - 1
+    if state.game_over or field[1][mid] != ' ' or field[1][mid + 1] != ' ':
+        return LOSS
+    cells = [(r, c) for r in range(rows) for c in range(columns) if field[r][c] != ' ']
+    viruses = sum(field[r][c].islower() for r, c in cells)
+    if not viruses:
+        return WEIGHTS['win'] + WEIGHTS['cleared'] * cleared
+    tops = [min([r for r in range(rows) if field[r][c] != ' '], default=rows) for c in range(columns)]
+    holes = sum(field[r][c] == ' ' for c in range(columns) for r in range(tops[c], rows))
+    adjacent = sum(MATCH_KEYS[field[r][c]] == MATCH_KEYS.get(field[r2][c2])
+                   for r, c in cells for r2, c2 in ((r, c + 1), (r + 1, c)) if r2 < rows and c2 < columns)
+    return (WEIGHTS['cleared'] * cleared - WEIGHTS['virus'] * viruses - WEIGHTS['segment'] * (len(cells) - viruses) -
+            WEIGHTS['height'] * (rows - min(tops)) - WEIGHTS['hole'] * holes + WEIGHTS['adjacent'] * adjacent)
+
+
+@pytest.mark.parametrize('backend', ['grid', 'bitboard'])
+def test_score_state_matches_the_field(backend):
+    for seed in range(0, 300, 5):
+        rows, columns, config, contents, commands = random_game(random.Random(seed))
+        state = GameState(rows, columns, config, contents, backend=backend)
+        for command in commands:
+            try:
+                apply(state, command)
+            except IndexError:
+                break  # Rotating a vertical faller on the bottom row
+            if not state.faller:
+                assert score_state(state, seed) == naive_score(state, seed), seed
+
+
+def best_by_cloning(state: GameState, upcoming) -> Placement:
+    """Pick a placement the way LookaheadPlayer does, on a fresh clone per node and with no table."""
+    def value_after(state, placement, upcoming):
+        child = state.clone()
+        cleared = sum(len(step) for step in apply_placement(child, placement).cleared)
+        if not upcoming or child.game_over or not child.has_viruses():
+            return score_state(child, cleared)
+        if not child.create_faller(*upcoming[0]):
+            return LOSS
+        value = max((value_after(child, p, upcoming[1:]) for p in enumerate_placements(child)), default=LOSS)
+        return value + WEIGHTS['cleared'] * cleared
+
+    best, best_value = None, LOSS
+    for placement in enumerate_placements(state):
+        value = value_after(state, placement, upcoming)
+        if best is None or value > best_value:
+            best, best_value = placement, value
+    return best
+
+
+@pytest.mark.parametrize('backend', ['grid', 'bitboard'])
+def test_lookahead_search_matches_cloning_every_node(backend):
+    rng = random.Random(backend)
+    player = LookaheadPlayer(depth=3)
+    for seed in range(6):
+        state = generate_level(8, 5, seed, density=0.5, backend=backend)
+        state.create_faller(rng.choice('RYB'), rng.choice('RYB'))
+        upcoming = ((rng.choice('RYB'), rng.choice('RYB')), (rng.choice('RYB'), rng.choice('RYB')))
+        before = state.snapshot()
+        expected = best_by_cloning(state, upcoming)
+        assert player.choose(state, upcoming) == expected
+        assert state.snapshot() == before
+        # A second search over the same positions is answered from the table.
+        assert player.choose(state, upcoming) == expected
+        assert player.table_hits
@@ -0,0 +1,226 @@
+import random
+
+import pytest
+
+from differential import apply, show
+from game_logic import SNAPSHOT_HEADER, STATE_BYTES, GameState, UndoStack
+
+
+@pytest.mark.parametrize('backend', ['grid', 'bitboard'])
+def test_field_snapshot_rejects_cell_writes(backend):
+    state = GameState(4, 3, 'EMPTY', backend=backend)
+    with pytest.raises(TypeError):
+        state.field[3][0] = 'r'
+
+
+@pytest.mark.parametrize('backend', ['grid', 'bitboard'])
+def test_field_assignment_writes_through(backend):
+    state = GameState(4, 3, 'EMPTY', backend=backend)
+    field = [list(row) for row in state.field]
+    field[3][0] = 'r'
+    field[2][1] = 'B'
+    state.field = field
+    assert state.board.get(3, 0) == 'r'
+    assert state.field[2] == (' ', 'B', ' ')
+    assert state.remaining_viruses() == 1
+    assert state.zobrist() == state.full_zobrist()
+    state.apply_gravity()
+    assert state.field[3] == ('r', 'B', ' ')
+
+
+def test_field_assignment_checks_the_size():
+    state = GameState(4, 3, 'EMPTY')
+    with pytest.raises(ValueError):
+        state.field = ['   '] * 3
+
+
+def test_played_state_stays_within_memory_budget():
+    # Row stamps pass the small ints Python shares once a state has been
+    # played a while, and cascades grow the gravity bookkeeping.
+    rng = random.Random(0)
+    state = GameState(16, 8, 'EMPTY')
+    empty = state.field
+    for game in range(4):
+        if game:
+            state.field = empty  # Start another game on the same state
+            state.game_over = False
+        while not state.game_over:
+            apply(state, rng.choice(['', '<', '>']) if state.faller else f'F {rng.choice("RYB")} {rng.choice("RYB")}')
+    assert min(state.board.row_stamps) > 256
+    assert state.memory_bytes() <= STATE_BYTES
+
+
+def test_snapshot_is_an_11_byte_header_and_a_byte_per_cell():
+    state = GameState(16, 8, 'EMPTY')
+    state.create_faller('R', 'Y')
+    assert SNAPSHOT_HEADER.size == 11
+    assert len(state.snapshot()) == 11 + 16 * 8
+
+
+BACKENDS = ['grid', 'bitboard']
+CONTENTS = ['     ', '     ', '     ', '     ', '   y ', ' R   ', 'r b y', 'yBrRb']
+# Commands leading to each position the snapshot round trip is checked in.
+POSITIONS = {
+    'no faller': [],
+    'horizontal': ['F R B', '>'],
+    'horizontal landed': ['F R B', '>', '', '', ''],
+    'vertical': ['F Y R', 'A', '<'],
+    'vertical landed': ['F Y R', 'A', '<', '', '', '', ''],
+    'game over': ['v 1 2 b', 'F Y Y'],
+}
+# Play that exercises the faller, freezing and the cascade after a restore.
+CONTINUATION = ['B', '>', '', '', '', '', '', 'F B Y', '<', '<', 'D', 'F R R', 'A', 'D', '', '', 'F Y B']
+
+
+def position(name: str, backend: str) -> GameState:
+    state = GameState(8, 5, 'CONTENTS', CONTENTS, backend=backend)
+    for command in POSITIONS[name]:
+        apply(state, command)
+    return state
+
+
+def trace(state: GameState, commands) -> list:
+    """Return what a front end shows after each command."""
+    shown = [show(state)]
+    for command in commands:
+        apply(state, command)
+        shown.append(show(state))
+    return shown
+
+
+def test_positions_are_what_they_say():
+    for backend in BACKENDS:
+        assert not position('no faller', backend).has_faller
+        for name in ('horizontal', 'horizontal landed', 'vertical', 'vertical landed'):
+            state = position(name, backend)
+            assert state.has_faller
+            assert state.faller_vertical == name.startswith('vertical')
+            assert state.faller_landed == name.endswith('landed')
+        assert position('game over', backend).game_over
+
+
+@pytest.mark.parametrize('name', POSITIONS)
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('into', BACKENDS)
+def test_snapshot_round_trips(name, backend, into):
+    state = position(name, backend)
+    blob = state.snapshot()
+    restored = GameState(8, 5, 'EMPTY', backend=into)
+    restored.create_faller('B', 'B')
+    restored.create_virus(7, 0, 'r')
+    restored.restore(blob)
+    for copy in (restored, GameState.from_snapshot(blob, into)):
+        assert copy.snapshot() == blob
+        assert copy.zobrist() == state.zobrist() == copy.full_zobrist()
+        assert show(copy) == show(state)
+        assert trace(copy, CONTINUATION) == trace(state.clone(), CONTINUATION)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_restore_rejects_a_snapshot_of_another_size(backend):
+    blob = position('horizontal', backend).snapshot()
+    for rows, columns in ((8, 6), (7, 5), (5, 8)):
+        state = GameState(rows, columns, 'EMPTY', backend=backend)
+        with pytest.raises(ValueError):
+            state.restore(blob)
+    state = GameState(8, 5, 'EMPTY', backend=backend)
+    for bad in (blob[:-1], blob + b' '):
+        with pytest.raises(ValueError):
+            state.restore(bad)
+    assert state.snapshot() == GameState(8, 5, 'EMPTY', backend=backend).snapshot()
+
+
+@pytest.mark.parametrize('name', POSITIONS)
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_clone_is_independent(name, backend):
+    state = position(name, backend)
+    clone = state.clone()
+    ahead = ['D', 'F B B', 'D', 'v 3 0 r']
+    aside = ['<', 'A', '', 'v 2 4 y', 'D', 'F R Y', '>', 'D']
+    # Each copy plays its own line; the other must not see any of it.
+    expected_state, expected_clone = position(name, backend), position(name, backend)
+    assert trace(state, ahead) == trace(expected_state, ahead)
+    assert trace(clone, aside) == trace(expected_clone, aside)
+    assert state.snapshot() == expected_state.snapshot()
+    assert clone.snapshot() == expected_clone.snapshot()
+    assert state.snapshot() != clone.snapshot()
+    assert state.zobrist() == state.full_zobrist() and clone.zobrist() == clone.full_zobrist()
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_undo_stack_evicts_the_oldest_and_redoes_in_order(backend):
+    state = position('no faller', backend)
+    history = UndoStack(capacity=3)
+    seen = [state.snapshot()]
+    for command in ('F R B', '>', 'D', 'F Y Y', 'A'):
+        history.push(state)
+        apply(state, command)
+        seen.append(state.snapshot())
+    assert len(history) == 3
+    # Only the three most recent positions before the current one remain.
+    for expected in reversed(seen[2:5]):
+        assert history.undo(state)
+        assert state.snapshot() == expected
+    assert not history.undo(state)
+    assert state.snapshot() == seen[2]
+    for expected in seen[3:]:
+        assert history.redo(state)
+        assert state.snapshot() == expected
+    assert not history.redo(state)
+    # A push after an undo drops the positions that could have been redone.
+    history.undo(state)
+    history.push(state)
+    assert not history.redo(state)
+    history.undo(state)
+    assert state.snapshot() == seen[4]
+    history.clear()
+    assert len(history) == 0 and not history.undo(state) and not history.redo(state)
+
+
+@pytest.mark.parametrize('name', POSITIONS)
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_checkpoint_rolls_back_any_number_of_times(name, backend):
+    state = position(name, backend)
+    blob, shown = state.snapshot(), show(state)
+    checkpoint = state.checkpoint()
+    played = trace(state.clone(), CONTINUATION)
+    for _ in range(2):
+        stamp = state.field_stamp()
+        assert trace(state, CONTINUATION) == played
+        state.rollback(checkpoint)
+        assert state.snapshot() == blob and show(state) == shown
+        assert state.zobrist() == state.full_zobrist()
+        # Every row is reported changed, so renderers redraw the restored field.
+        assert state.changed_rows(stamp) == list(range(8))
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_checkpoint_mid_cascade_keeps_the_falling_segments(backend):
+    contents = ['     '] * 3 + ['Y    ', 'B    ', 'rrrr ', '     ', '    b']
+    state = GameState(8, 5, 'CONTENTS', contents, backend=backend)
+    events = state.cascade_events()
+    assert type(next(events)).__name__ == 'CellsCleared'
+    assert type(next(events)).__name__ == 'PiecesDropped'
+    checkpoint = state.checkpoint()
+    list(events)
+    settled = state.snapshot()
+    assert state.board.get(7, 0) == 'B'
+    state.rollback(checkpoint)
+    assert state.board.get(5, 0) == 'B'
+    state.resolve_cascade()
+    assert state.snapshot() == settled
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('row, col', [(-1, 0), (-8, 2), (8, 0), (0, -1), (3, 5), (7, 6)])
+def test_cells_off_the_field_are_rejected(backend, row, col):
+    state = position('no faller', backend)
+    blob, tops = state.snapshot(), [state.board.top(c) for c in range(5)]
+    with pytest.raises(IndexError):
+        state.board.place(row, col, 'B')
+    with pytest.raises(IndexError):
+        state.create_virus(row, col, 'y')
+    assert state.snapshot() == blob
+    assert [state.board.top(c) for c in range(5)] == tops
+    assert state.zobrist() == state.full_zobrist()
+    assert state.remaining_viruses() == 7 and state.capsule_segments() == 3
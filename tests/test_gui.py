@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import a2_GUI
+
+
+@pytest.mark.parametrize('overlay', [False, True])
+def test_windowed_run_processes_every_scripted_command(monkeypatch, overlay):
+    monkeypatch.setattr(a2_GUI, 'FALL_INTERVAL', 0.05)
+    game = a2_GUI.DrMarioGUI(8, 6, 'EMPTY')
+    game.overlay = overlay
+    processed = []
+    process_command = game.process_command
+
+    def record(command):
+        if command:
+            processed.append(command)
+        return process_command(command)
+
+    monkeypatch.setattr(game, 'process_command', record)
+    game.run(script=[(0.02, 'F R Y'), (0.12, '<'), (0.18, '<')], max_ticks=6)
+    assert processed == ['F R Y', '<', '<']
+
+
+def test_headless_run_processes_every_scripted_command():
+    game = a2_GUI.DrMarioGUI(8, 6, 'EMPTY', headless=True)
+    ticks = game.run(script=[(0.2, 'F R Y'), (1.2, '<'), (1.8, '<')], max_ticks=6)
+    assert ticks == 6
+    assert game.state.faller_col == 0
+
+
+def test_logic_only_use_does_not_load_pygame():
+    # A fresh interpreter, since the windowed tests load pygame into this one.
+    code = ('import sys, a2_GUI\n'
+            "a2_GUI.DrMarioGUI(8, 6, 'EMPTY', headless=True).run(script=[(0.2, 'F R Y')], max_ticks=2)\n"
+            "print('pygame' in sys.modules)")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == 'False'
@@ -0,0 +1,114 @@
+import asyncio
+import io
+
+import pytest
+
+import a2
+from game_logic import GameState
+from levelgen import generate_level, level_from_config, virus_layout
+from server import GameServer
+
+
+def longest_runs(layout: bytes, rows: int, columns: int):
+    """Return the longest horizontal and vertical runs of one virus colour."""
+    longest = [0, 0]
+    for axis, (lines, length, step, stride) in enumerate(((rows, columns, 1, columns), (columns, rows, columns, 1))):
+        for line in range(lines):
+            run, last = 0, None
+            for i in range(length):
+                cell = layout[line * stride + i * step]
+                run = run + 1 if cell == last and cell != ord(' ') else 1
+                last = cell
+                if cell != ord(' '):
+                    longest[axis] = max(longest[axis], run)
+    return longest
+
+
+def test_same_seed_gives_same_layout():
+    assert virus_layout(16, 8, 42, viruses=40) == virus_layout(16, 8, 42, viruses=40)
+    assert virus_layout(16, 8, 42, viruses=40) != virus_layout(16, 8, 43, viruses=40)
+    first, second = generate_level(16, 8, 7, density=0.5), generate_level(16, 8, 7, density=0.5, backend='bitboard')
+    assert first.field == second.field
+
+
+@pytest.mark.parametrize('run', [2, 3, 4, 5])
+def test_layout_has_no_run(run):
+    for seed in range(50):
+        rows, columns = 5 + seed % 20, 3 + seed % 11
+        layout = virus_layout(rows, columns, seed, density=1.0, height=rows, run=run)
+        assert max(longest_runs(layout, rows, columns)) < run, f'seed {seed}'
+
+
+def test_count_and_density_are_exact():
+    for viruses in (0, 1, 17, 88):
+        layout = virus_layout(16, 8, viruses, viruses=viruses)
+        assert len(layout) - layout.count(b' ') == viruses
+    # The default height leaves the top third clear: 11 of 16 rows.
+    for density, expected in ((0.0, 0), (0.25, 22), (0.5, 44), (1.0, 88)):
+        layout = virus_layout(16, 8, 3, density=density)
+        assert len(layout) - layout.count(b' ') == expected
+    state = generate_level(16, 8, 3, viruses=30)
+    assert state.remaining_viruses() == 30
+
+
+@pytest.mark.parametrize('height', [0, 1, 4, 11, 16])
+def test_height_limit_is_respected(height):
+    for seed in range(20):
+        layout = virus_layout(16, 8, seed, density=1.0, height=height)
+        assert layout[:(16 - height) * 8] == b' ' * ((16 - height) * 8)
+        assert len(layout) - layout.count(b' ') == height * 8
+
+
+@pytest.mark.parametrize('viruses, density, run', [(200, None, 4), (None, 1.5, 4), (None, None, 4), (5, None, 1)])
+def test_impossible_layouts_are_rejected(viruses, density, run):
+    with pytest.raises(ValueError):
+        virus_layout(16, 8, 0, viruses=viruses, density=density, run=run)
+
+
+def test_random_config_line():
+    assert level_from_config(16, 8, 'RANDOM 9 30').field == generate_level(16, 8, 9, viruses=30).field
+    assert level_from_config(16, 8, 'RANDOM 9 0.5 6').field == generate_level(16, 8, 9, density=0.5,
+                                                                               height=6).field
+    for line in ('RANDOM', 'RANDOM 9', 'RANDOM x 30', 'RANDOM 9 lots', 'RANDOM 9 30 6 1'):
+        with pytest.raises(ValueError):
+            level_from_config(16, 8, line)
+
+
+def expected_output(state: GameState, commands: str) -> str:
+    """Return what a2.py prints for commands played on state."""
+    out = io.StringIO()
+    a2.play(state, iter(commands.splitlines()), a2.TextRenderer(out=out))
+    return out.getvalue()
+
+
+def test_random_config_in_a2(monkeypatch, capsys):
+    commands = 'F R Y\n\n\n\nQ\n'
+    monkeypatch.setattr('sys.stdin', io.StringIO('12\n6\nRANDOM 4 0.4\n' + commands))
+    assert a2.main([]) == 0
+    assert capsys.readouterr().out == expected_output(generate_level(12, 6, 4, density=0.4), commands)
+
+
+def test_bad_random_config_in_a2_is_reported(monkeypatch, capsys):
+    monkeypatch.setattr('sys.stdin', io.StringIO('12\n6\nRANDOM 4 many\nQ\n'))
+    assert a2.main([]) == 1
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert captured.err == "ValueError: could not convert string to float: 'many'\n"
+
+
+def test_random_config_in_server():
+    commands = 'F B B\n>\n\n\nQ\n'
+
+    async def session() -> bytes:
+        server = GameServer()
+        listener = await server.start_tcp('127.0.0.1', 0)
+        async with listener:
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'12\n6\nRANDOM 8 20 9\n{commands}'.encode())
+            output = await reader.read()
+            writer.close()
+            return output
+
+    served = asyncio.run(session()).decode('latin-1')
+    assert served == expected_output(generate_level(12, 6, 8, viruses=20, height=9), commands)
@@ -0,0 +1,52 @@
+import io
+import random
+
+import pytest
+
+import a2
+from commands import parse_command, run_command
+from differential import random_game, show
+from game_logic import GameState
+from replay import OP_NOP, Recorder, Replay, encode_command
+
+
+@pytest.mark.parametrize('line', ['v 3000000000 1 r', 'v 1 -3000000000 y', 'v 99999999999999999999 0 b'])
+def test_out_of_range_virus_is_logged_as_ignored(line):
+    assert encode_command(parse_command(line)) == bytes((OP_NOP,))
+
+
+def test_record_survives_out_of_range_virus(tmp_path, monkeypatch, capsys):
+    script = '6\n4\nEMPTY\nv 3000000000 1 r\nv 5 1 r\nv -7 2 y\nF R Y\n\n\nQ\n'
+    log = tmp_path / 'session.drml'
+    monkeypatch.setattr('sys.stdin', io.StringIO(script))
+    a2.main(['--record', str(log)])
+    recorded = capsys.readouterr().out
+    monkeypatch.setattr('sys.stdin', io.StringIO(script))
+    a2.main([])
+    assert capsys.readouterr().out == recorded
+    replay = Replay.load(str(log))
+    assert len(replay) == 7
+    state = replay.seek(len(replay))
+    assert state.board.get(5, 1) == 'r'
+    assert state.board.counts['r'] == 1
+
+
+@pytest.mark.parametrize('seed', range(0, 300, 3))
+def test_replay_seek_matches_live_game(seed):
+    rows, columns, config, contents, commands = random_game(random.Random(seed))
+    state = GameState(rows, columns, config, contents)
+    out = io.BytesIO()
+    recorder = Recorder(out, state, interval=7)
+    shown = [show(state)]
+    for command in commands:
+        try:
+            run_command(state, command)
+        except IndexError:
+            break  # A rotation below the floor
+        recorder.record(command, state)
+        shown.append(show(state))
+    replay = Replay(out.getvalue())
+    assert len(replay) == len(shown) - 1
+    for index, expected in enumerate(shown):
+        assert show(replay.seek(index)) == expected, f'seed {seed} command {index}'
+    assert show(replay.seek(len(replay), use_keyframes=False)) == shown[-1]
@@ -0,0 +1,38 @@
+from functools import lru_cache
+
+MASK = (1 << 64) - 1
+
+# Key code added to a capsule colour byte for a faller segment, so a
+# faller never hashes like the frozen segment in the same cell.
+FALLER_CODE = 0x80
+# Key code, at the faller's first cell, of a landed faller.
+LANDED_CODE = 0
+
+
+@lru_cache(maxsize=1 << 16)
+def cell_key(index: int, code: int) -> int:
+    """
+    Return the 64-bit Zobrist key for a cell byte at a flat cell index.
+
+    Keys are derived with the splitmix64 finaliser rather than drawn into a
+    table, so fields of any size share them without storing one key per cell
+    and colour, and every run gets the same hashes. Recently used keys are
+    cached, which covers every key of a field up to about 10,000 cells.
+
+    Args:
+        index: Cell index, row * columns + col.
+        code: Cell byte (a field character, or a faller code).
+    """
+    z = ((index << 8) + code + 1) * 0x9E3779B97F4A7C15 & MASK
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9 & MASK
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EB & MASK
+    return z ^ (z >> 31)
+
+
+def field_hash(cells: bytes) -> int:
+    """Return the Zobrist hash of row-major field bytes, from scratch."""
+    h = 0
+    for index, code in enumerate(cells):
+        if code != 32:  # ' '
+            h ^= cell_key(index, code)
+    return h